@@ -0,0 +1,11 @@
+"""
+Offline benchmark suite for the download engine.
+
+Runs real batches through DownloadEngine against a local stand-in media
+server (benchmarks.media_server) with a fake yt-dlp extractor
+(benchmarks.fake_extractor), so results don't depend on YouTube.
+
+    python -m benchmarks --sizes 1 10 100 1000 --output results.json
+    python -m benchmarks --compare old.json new.json
+    python -m benchmarks.jobserver_check
+"""
@@ -0,0 +1,178 @@
+"""
+One benchmark run: python -m benchmarks.batch --server URL --items N [options]
+
+Runs a single batch through DownloadEngine in this (fresh) process and
+prints one JSON object with its measurements, so peak memory is not
+inflated by earlier runs. Normally started by benchmarks.runner.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Dict, Any, Optional # For type hinting
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+from yt_downloader.engine import DownloadOptions, DownloadEngine, DEFAULT_WORKER_COUNT
+from yt_downloader.progress import ProgressBus, format_item_status
+from yt_downloader.pipeline import DEFAULT_POSTPROCESS_WORKERS
+
+from .fake_extractor import BenchIE, bench_urls
+
+UI_FRAME_INTERVAL = 0.066 # Same frame rate as the Tk GUI (UI_REFRESH_INTERVAL_MS)
+
+
+class TimedProgressBus(ProgressBus):
+    """ProgressBus that stamps each publish so a consumer can measure delivery latency."""
+    def publish(self, key: str, state: Dict[str, Any]):
+        state['_published'] = time.perf_counter()
+        super().publish(key, state)
+
+
+class SimulatedUI:
+    """
+    Drains the bus at the GUI's frame rate on its own thread, formatting the
+    newest item like _poll_progress_bus does, and records how long each
+    drained update waited between publish and paint.
+    """
+    def __init__(self, bus: TimedProgressBus, interval: float = UI_FRAME_INTERVAL):
+        self.bus = bus
+        self.interval = interval
+        self.latencies: List[float] = []
+        self.frames = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="bench-ui", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._frame() # Whatever arrived after the last frame
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._frame()
+
+    def _frame(self):
+        items, _status, _overall = self.bus.drain()
+        if not items:
+            return
+        self.frames += 1
+        format_item_status(next(reversed(items.values())))
+        painted = time.perf_counter()
+        self.latencies.extend(painted - state['_published'] for state in items.values())
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return {'frames': self.frames, 'samples': 0}
+        return {
+            'frames': self.frames,
+            'samples': len(ordered),
+            'avg_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            'max_ms': round(ordered[-1] * 1000, 3),
+        }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, if the platform reports it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1) # Bytes on macOS, KiB elsewhere
+
+
+def output_bytes(directory: str) -> int:
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(directory):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def run(server: str, items: int, workers: int, postprocess_workers: int, with_state: bool, prefix: str) -> Dict[str, Any]:
+    """Downloads `items` benchmark URLs and returns the measurements."""
+    work_dir = tempfile.mkdtemp(prefix="yt-bench-")
+    output_dir = os.path.join(work_dir, "out")
+    os.makedirs(output_dir)
+    os.environ['YT_DOWNLOADER_STATE_DIR'] = os.path.join(work_dir, "state") # Index/cache/journal start empty
+    options = DownloadOptions(
+        download_path=output_dir,
+        worker_count=workers,
+        postprocess_workers=postprocess_workers,
+        use_index=with_state,
+        use_metadata_cache=with_state,
+        use_journal=with_state,
+    )
+    events: Dict[str, int] = {}
+
+    def on_event(event: str, payload: Dict[str, Any]):
+        events[event] = events.get(event, 0) + 1 # Dict increments are atomic enough under the GIL
+
+    bus = TimedProgressBus()
+    ui = SimulatedUI(bus)
+    engine = DownloadEngine(options, on_event=on_event, progress_bus=bus, extractors=[BenchIE])
+    urls = bench_urls(server, items, prefix)
+    try:
+        ui.start()
+        started = time.perf_counter()
+        result = engine.run(urls)
+        elapsed = time.perf_counter() - started
+        ui.stop()
+        downloaded = output_bytes(output_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    bus_stats = bus.stats()
+    return {
+        'items': items,
+        'workers': workers,
+        'postprocess_workers': postprocess_workers,
+        'with_state': with_state,
+        'completed': result.completed,
+        'failed': len(result.failed_items),
+        'retries': events.get('item_retry', 0),
+        'circuit_trips': events.get('circuit_open', 0),
+        'seconds': round(elapsed, 3),
+        'items_per_sec': round(result.completed / elapsed, 3) if elapsed else None,
+        'bytes': downloaded,
+        'bytes_per_sec': round(downloaded / elapsed) if elapsed else None,
+        'hook_calls': bus_stats['hook_calls'],
+        'hook_avg_us': round(bus_stats['hook_avg_us'], 3),
+        'updates_coalesced': bus_stats['updates_coalesced'],
+        'ui_latency': ui.summary(),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.batch", description="Run one benchmark batch and print JSON.")
+    parser.add_argument('--server', required=True, help="Base URL of benchmarks.media_server, e.g. http://127.0.0.1:8765")
+    parser.add_argument('--items', type=int, required=True, help="Batch size.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKER_COUNT, help="Parallel downloads (default: %(default)s).")
+    parser.add_argument('--postprocess-workers', type=int, default=DEFAULT_POSTPROCESS_WORKERS,
+                        help="Post-processing stage workers, 0 = inline (default: %(default)s).")
+    parser.add_argument('--with-state', action='store_true', help="Enable the download index, metadata cache and job journal.")
+    parser.add_argument('--prefix', default='item', help="Item id prefix (distinct ids per run).")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    measurements = run(args.server.rstrip('/'), args.items, args.workers, args.postprocess_workers, args.with_state, args.prefix)
+    print(json.dumps(measurements), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+from typing import List # For type hinting
+
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class BenchIE(InfoExtractor):
+    """
+    Extractor for the local stand-in media server.
+
+    http://127.0.0.1:<port>/bench/<id> costs one metadata round-trip
+    (/api/<id>.json), like a real extractor's page or API request, and
+    resolves to a single progressive MP4 format on /media/<id>.mp4.
+    """
+    IE_NAME = 'bench'
+    IE_DESC = False # Not listed in --list-extractors
+    _VALID_URL = r'(?P<base>https?://(?:127\.0\.0\.1|localhost)(?::\d+)?)/bench/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        base, video_id = self._match_valid_url(url).group('base', 'id')
+        meta = self._download_json(f'{base}/api/{video_id}.json', video_id, note=False)
+        return {
+            'id': video_id,
+            'title': meta['title'],
+            'formats': [{
+                'format_id': 'mp4',
+                'url': f'{base}/media/{video_id}.mp4',
+                'ext': 'mp4',
+                'vcodec': 'avc1.4d401f',
+                'acodec': 'mp4a.40.2',
+                'filesize': meta['size'],
+            }],
+        }
+
+
+def bench_urls(base_url: str, count: int, prefix: str = 'item') -> List[str]:
+    """URLs for count distinct benchmark items on the server at base_url."""
+    return [f"{base_url}/bench/{prefix}-{n:05d}" for n in range(count)]
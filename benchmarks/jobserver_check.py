@@ -0,0 +1,182 @@
+"""
+Job server check: python -m benchmarks.jobserver_check [options]
+
+Runs one distributed batch end to end on localhost: benchmarks.media_server,
+`python -m yt_downloader.jobserver serve`, two `... worker` processes
+loading the fake extractor, and `python -m yt_downloader --server`. Once
+the first worker has started a download it is killed (SIGKILL, so it
+can't hand its jobs back). The check passes if that worker's jobs are
+re-queued when their lease expires and the batch still finishes with
+every item downloaded. Prints its findings as one JSON object and exits
+with 1 if an expectation failed.
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Dict, Any, Tuple # For type hinting
+
+from .fake_extractor import bench_urls
+from .runner import start_media_server, REPO_ROOT
+
+WORKER_PROCESSES = 2 # The first one to start a download is killed
+STOP_TIMEOUT = 15.0 # Seconds a process gets to exit after Ctrl+C
+
+
+def start_job_server(lease_seconds: float) -> Tuple[subprocess.Popen, str]:
+    """Starts `jobserver serve` on a free port and returns (process, URL)."""
+    command = [sys.executable, '-m', 'yt_downloader.jobserver', 'serve', '--port', '0', '--lease-seconds', str(lease_seconds)]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stderr=subprocess.PIPE, text=True)
+    line = server.stderr.readline() # "Job server listening on http://127.0.0.1:<port>"
+    if 'listening on' not in line:
+        server.kill()
+        raise RuntimeError(f"Job server failed to start: {line.strip()}")
+    threading.Thread(target=server.stderr.read, daemon=True).start() # Never block the server on a full pipe
+    return server, line.split()[-1]
+
+
+def start_worker(server_url: str, args: argparse.Namespace, output_dir: str, state_dir: str) -> subprocess.Popen:
+    """Starts one worker process with its own state directory, as if on a host of its own."""
+    command = [
+        sys.executable, '-m', 'yt_downloader.jobserver', 'worker', '--server', server_url, '-w', str(args.workers),
+        '-o', output_dir, '--extractor', 'benchmarks.fake_extractor:BenchIE',
+    ]
+    env = dict(os.environ, YT_DOWNLOADER_STATE_DIR=state_dir)
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stderr=None if args.verbose else subprocess.DEVNULL)
+
+
+def stop_all(processes: List[subprocess.Popen]):
+    """Ctrl+C to all (a worker hands its running jobs back), then kills those that don't exit."""
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for process in processes:
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def follow(client: subprocess.Popen, workers: Dict[str, subprocess.Popen], items: int, output_dir: str) -> Dict[str, Any]:
+    """Reads the client's events, kills the first worker that starts a download, and checks the outcome."""
+    killed = None
+    requeued: List[Dict[str, Any]] = []
+    summary: Dict[str, Any] = {}
+    for line in client.stdout:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        event = record.get('event')
+        if event == 'item_started' and killed is None and record.get('worker') in workers:
+            killed = record['worker']
+            workers[killed].kill() # Mid-lease: its jobs only come back when the lease expires
+        elif event == 'item_requeued':
+            requeued.append({'key': record.get('key'), 'worker': record.get('worker'), 'reason': record.get('reason')})
+        elif event == 'batch_finished':
+            summary = record
+    exit_code = client.wait()
+    files = [name for name in os.listdir(output_dir) if name.endswith('.mp4')]
+
+    problems = []
+    if killed is None:
+        problems.append("no worker started a download")
+    elif not any(r['worker'] == killed for r in requeued):
+        problems.append(f"the jobs of killed worker {killed} weren't re-queued")
+    if not summary:
+        problems.append(f"the batch didn't finish (client exit code {exit_code})")
+    else:
+        if summary.get('total') != items or summary.get('completed') != items:
+            problems.append(f"{summary.get('completed')} of {summary.get('total')} item(s) completed, expected {items}")
+        if summary.get('failed'):
+            problems.append(f"{summary['failed']} item(s) failed: {summary.get('failed_items')}")
+        if exit_code != 0:
+            problems.append(f"client exit code {exit_code}")
+    if len(files) != items:
+        problems.append(f"{len(files)} file(s) downloaded, expected {items}")
+    return {
+        'items': items,
+        'completed': summary.get('completed'),
+        'failed': summary.get('failed'),
+        'workers': summary.get('workers'),
+        'killed_worker': killed,
+        'requeued': requeued,
+        'files': len(files),
+        'problems': problems,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Starts the servers, workers and client, and returns follow()'s findings."""
+    work_dir = tempfile.mkdtemp(prefix="yt-jobserver-check-")
+    output_dir = os.path.join(work_dir, "out") # Shared by both workers
+    os.makedirs(output_dir)
+    processes: List[subprocess.Popen] = []
+    try:
+        media, base_url = start_media_server(args)
+        processes.append(media)
+        server, server_url = start_job_server(args.lease_seconds)
+        processes.append(server)
+        workers: Dict[str, subprocess.Popen] = {}
+        for n in range(WORKER_PROCESSES):
+            worker = start_worker(server_url, args, output_dir, os.path.join(work_dir, f"state-{n + 1}"))
+            workers[f"{socket.gethostname()}-{worker.pid}"] = worker # Its name on the job server
+            processes.append(worker)
+        url_file = os.path.join(work_dir, "urls.txt")
+        with open(url_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(bench_urls(base_url, args.items, 'check')) + "\n")
+        env = dict(os.environ, YT_DOWNLOADER_STATE_DIR=os.path.join(work_dir, "state-client"))
+        client = subprocess.Popen([sys.executable, '-m', 'yt_downloader', url_file, '--server', server_url],
+                                  cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL, text=True)
+        processes.append(client)
+        timer = threading.Timer(args.timeout, client.kill) # Ends follow() if the batch hangs
+        timer.start()
+        started = time.perf_counter()
+        try:
+            findings = follow(client, workers, args.items, output_dir)
+        finally:
+            timer.cancel()
+        findings['seconds'] = round(time.perf_counter() - started, 3)
+        return findings
+    finally:
+        stop_all(processes)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.jobserver_check",
+                                     description="Run a batch through a local job server and two workers, killing one mid-lease.")
+    parser.add_argument('--items', type=int, default=12, help="Batch size (default: %(default)s).")
+    parser.add_argument('--workers', type=int, default=2, help="Download threads per worker process (default: %(default)s).")
+    parser.add_argument('--lease-seconds', type=float, default=3.0,
+                        help="Job server lease time, i.e. how soon the killed worker's jobs return (default: %(default)s).")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Seconds the batch may take (default: %(default)s).")
+    parser.add_argument('--item-size', default='256K', help="Payload size per item (default: %(default)s).")
+    parser.add_argument('--latency', type=float, default=0.05, help="Server seconds before the first byte of every response.")
+    parser.add_argument('--bandwidth', default='128K',
+                        help="Server bytes/s per connection, so the killed worker is mid-download (default: %(default)s).")
+    parser.add_argument('--error-429', type=float, default=0.0, help="Probability of a 429 response.")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="Probability of a 503 response.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for error injection.")
+    parser.add_argument('--verbose', action='store_true', help="Show the workers' and client's stderr.")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    findings = run(args)
+    print(json.dumps(findings), flush=True)
+    return 1 if findings['problems'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Stand-in media server: python -m benchmarks.media_server [options]
+
+Serves synthetic media for the benchmark's fake extractor:
+
+    GET /api/<id>.json      metadata (id, title, size)
+    GET /media/<id>.mp4     payload of --size bytes (Range supported)
+    GET /stats[?reset=1]    request/error counters as JSON
+
+Every request waits --latency seconds before the first byte, payloads are
+paced to --bandwidth bytes/s per connection, and --error-429/--error-5xx
+inject failures with the given probability. Prints "READY <port>" once
+listening.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple # For type hinting
+from urllib.parse import urlsplit, parse_qs
+
+from yt_dlp.utils import parse_bytes
+
+CHUNK_SIZE = 64 * 1024
+_PAYLOAD = random.Random(0).randbytes(CHUNK_SIZE) # Incompressible, generated once
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+_API_PATH = re.compile(r"^/api/([\w-]+)\.json$")
+_MEDIA_PATH = re.compile(r"^/media/([\w-]+)\.mp4$")
+
+
+class MediaServerConfig:
+    """Behaviour of the stand-in server, shared by all handler threads."""
+    def __init__(self, size: int, latency: float = 0.0, bandwidth: float = 0.0, error_429: float = 0.0, error_5xx: float = 0.0, seed: int = 0):
+        self.size = size
+        self.latency = latency
+        self.bandwidth = bandwidth # Bytes/s per connection, 0 = unlimited
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def injected_error(self) -> Optional[int]:
+        """Status code to fail this request with, if any."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_429:
+            return 429
+        if roll < self.error_429 + self.error_5xx:
+            return 503
+        return None
+
+    def stats(self, reset: bool = False) -> Dict[str, int]:
+        with self._lock:
+            snapshot = dict(self.counters)
+            if reset:
+                self.counters.clear()
+        return snapshot
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BenchMediaServer/1.0"
+    protocol_version = "HTTP/1.1" # Keep-alive, like a real CDN
+    config: MediaServerConfig # Set on the subclass built by make_server
+
+    def log_message(self, format: str, *args: Any):
+        pass # Thousands of requests per run; counters are in /stats
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == '/stats':
+            reset = parse_qs(parts.query).get('reset') == ['1']
+            self._send_json(200, self.config.stats(reset))
+            return
+
+        self.config.count('requests')
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        error = self.config.injected_error()
+        if error is not None:
+            self.config.count(f'errors_{error}')
+            self.send_response(error)
+            if error == 429:
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        api = _API_PATH.match(parts.path)
+        if api:
+            video_id = api.group(1)
+            self._send_json(200, {'id': video_id, 'title': f"Bench item {video_id}", 'size': self.config.size})
+            return
+        media = _MEDIA_PATH.match(parts.path)
+        if media:
+            self._send_media()
+            return
+        self.send_error(404)
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _requested_range(self) -> Tuple[int, int]:
+        """(start, end) inclusive byte range to send."""
+        size = self.config.size
+        match = _RANGE_PATTERN.match(self.headers.get('Range') or '')
+        if not match or not (match.group(1) or match.group(2)):
+            return 0, size - 1
+        if not match.group(1): # Suffix range: last N bytes
+            return max(0, size - int(match.group(2))), size - 1
+        return int(match.group(1)), min(size - 1, int(match.group(2))) if match.group(2) else size - 1
+
+    def _send_media(self):
+        size = self.config.size
+        start, end = self._requested_range()
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        length = end - start + 1
+        self.send_response(206 if self.headers.get('Range') else 200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(length))
+        if self.headers.get('Range'):
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        sent = 0
+        began = time.monotonic()
+        offset = start % CHUNK_SIZE
+        try:
+            while sent < length:
+                block = _PAYLOAD[offset:offset + min(CHUNK_SIZE - offset, length - sent)]
+                self.wfile.write(block)
+                sent += len(block)
+                offset = 0
+                if self.config.bandwidth:
+                    ahead = sent / self.config.bandwidth - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Client cancelled
+        self.config.count('media_bytes', sent)
+
+
+def make_server(config: MediaServerConfig, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Builds (but doesn't start) a threaded server bound to host:port (0 = any free port)."""
+    handler = type('ConfiguredMediaRequestHandler', (MediaRequestHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.media_server", description="Stand-in media server for benchmarks.")
+    parser.add_argument('--port', type=int, default=0, help="Port to listen on (default: any free port).")
+    parser.add_argument('--size', default='256K', help="Payload size per item, e.g. 256K or 4M (default: %(default)s).")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before the first byte of every response.")
+    parser.add_argument('--bandwidth', default='0', help="Bytes/s per connection, e.g. 2M; 0 = unlimited.")
+    parser.add_argument('--error-429', type=float, default=0.0, help="Probability of answering 429 Too Many Requests.")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="Probability of answering 503 Service Unavailable.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for error injection.")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    size, bandwidth = parse_bytes(args.size), parse_bytes(args.bandwidth) if args.bandwidth != '0' else 0
+    if not size or bandwidth is None:
+        print("Invalid --size or --bandwidth", file=sys.stderr)
+        return 2
+    config = MediaServerConfig(size, args.latency, float(bandwidth), args.error_429, args.error_5xx, args.seed)
+    server = make_server(config, port=args.port)
+    print(f"READY {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
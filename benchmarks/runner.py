@@ -0,0 +1,170 @@
+"""
+Benchmark orchestrator: python -m benchmarks [options]
+
+Starts benchmarks.media_server in a subprocess, runs one fresh
+benchmarks.batch process per batch size (and repeat), and writes all
+measurements plus the environment to a JSON file. --compare prints the
+change between two such files.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import List, Dict, Any, Optional, Tuple # For type hinting
+
+import yt_dlp
+
+from yt_downloader.engine import DEFAULT_WORKER_COUNT
+from yt_downloader.pipeline import DEFAULT_POSTPROCESS_WORKERS
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Metrics shown by --compare, and whether a higher value is better
+COMPARED_METRICS = {
+    'items_per_sec': True,
+    'bytes_per_sec': True,
+    'hook_avg_us': False,
+    'ui_latency.p95_ms': False,
+    'peak_rss_mb': False,
+}
+
+
+def start_media_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Starts the stand-in server and returns (process, base URL)."""
+    command = [
+        sys.executable, '-m', 'benchmarks.media_server',
+        '--size', args.item_size, '--latency', str(args.latency), '--bandwidth', args.bandwidth,
+        '--error-429', str(args.error_429), '--error-5xx', str(args.error_5xx), '--seed', str(args.seed),
+    ]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    ready = server.stdout.readline().split()
+    if len(ready) != 2 or ready[0] != 'READY':
+        server.kill()
+        raise RuntimeError("Media server failed to start")
+    return server, f"http://127.0.0.1:{ready[1]}"
+
+
+def server_stats(base_url: str) -> Dict[str, int]:
+    """Reads and resets the server's request/error counters."""
+    with urllib.request.urlopen(f"{base_url}/stats?reset=1", timeout=10) as response:
+        return json.load(response)
+
+
+def run_batch(base_url: str, items: int, args: argparse.Namespace, prefix: str) -> Dict[str, Any]:
+    """Runs one batch in a fresh interpreter and returns its measurements."""
+    command = [
+        sys.executable, '-m', 'benchmarks.batch', '--server', base_url, '--items', str(items),
+        '--workers', str(args.workers), '--postprocess-workers', str(args.postprocess_workers), '--prefix', prefix,
+    ]
+    if args.with_state:
+        command.append('--with-state')
+    completed = subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL if not args.verbose else None, text=True)
+    if completed.returncode != 0 or not completed.stdout.strip():
+        return {'items': items, 'error': f"batch process exited with {completed.returncode}"}
+    measurements = json.loads(completed.stdout.strip().splitlines()[-1])
+    measurements['server'] = server_stats(base_url)
+    return measurements
+
+
+def metric(run: Dict[str, Any], name: str) -> Optional[float]:
+    """Looks up a possibly nested ('ui_latency.p95_ms') metric."""
+    value: Any = run
+    for part in name.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(old_path: str, new_path: str) -> int:
+    """Prints per-batch-size changes between two result files."""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    old_runs = {run['items']: run for run in old['runs'] if 'error' not in run}
+    print(f"{'items':>7}  {'metric':<20} {'old':>14} {'new':>14} {'change':>9}")
+    for run in new['runs']:
+        before = old_runs.get(run['items'])
+        if before is None or 'error' in run:
+            continue
+        for name, higher_is_better in COMPARED_METRICS.items():
+            a, b = metric(before, name), metric(run, name)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            better = (change > 0) == higher_is_better
+            marker = '' if abs(change) < 5 else (' +' if better else ' -') # Flag changes beyond noise
+            print(f"{run['items']:>7}  {name:<20} {a:>14.3f} {b:>14.3f} {change:>8.1f}%{marker}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Offline download engine benchmarks against a local stand-in media server.",
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Batch sizes to run (default: %(default)s).")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per batch size (default: %(default)s).")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKER_COUNT, help="Parallel downloads (default: %(default)s).")
+    parser.add_argument('--postprocess-workers', type=int, default=DEFAULT_POSTPROCESS_WORKERS,
+                        help="Post-processing stage workers, 0 = inline (default: %(default)s).")
+    parser.add_argument('--with-state', action='store_true',
+                        help="Enable the download index, metadata cache and job journal (fresh per run).")
+    parser.add_argument('--item-size', default='256K', help="Payload size per item (default: %(default)s).")
+    parser.add_argument('--latency', type=float, default=0.0, help="Server seconds before the first byte of every response.")
+    parser.add_argument('--bandwidth', default='0', help="Server bytes/s per connection, e.g. 2M; 0 = unlimited.")
+    parser.add_argument('--error-429', type=float, default=0.0, help="Probability of a 429 response.")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="Probability of a 503 response.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for error injection.")
+    parser.add_argument('--output', default=None,
+                        help="Results file (default: benchmark_results_<timestamp>.json in the current directory).")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two results files and exit.")
+    parser.add_argument('--verbose', action='store_true', help="Show the batch processes' stderr.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        return compare(*args.compare)
+
+    output = args.output or f"benchmark_results_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    results: Dict[str, Any] = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'yt_dlp': yt_dlp.version.__version__,
+        },
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'verbose')},
+        'runs': [],
+    }
+
+    server, base_url = start_media_server(args)
+    try:
+        for items in args.sizes:
+            for repeat in range(args.repeat):
+                print(f"Running {items} item(s), run {repeat + 1}/{args.repeat}...", file=sys.stderr)
+                measurements = run_batch(base_url, items, args, prefix=f"r{repeat}n{items}")
+                results['runs'].append(measurements)
+                if 'error' in measurements:
+                    print(f"  {measurements['error']}", file=sys.stderr)
+                else:
+                    print(f"  {measurements['items_per_sec']} items/s, {measurements['bytes_per_sec'] / 1024 / 1024:.2f} MB/s, "
+                          f"hook {measurements['hook_avg_us']} us, UI p95 {measurements['ui_latency'].get('p95_ms')} ms, "
+                          f"peak RSS {measurements['peak_rss_mb']} MB", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(output)
+    return 1 if any('error' in run for run in results['runs']) else 0
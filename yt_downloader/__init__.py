@@ -0,0 +1,49 @@
+"""
+Download engine shared by the Tkinter GUI (yt_downloader_gui.py) and the
+headless command line interface (python -m yt_downloader).
+
+Names from modules that import yt-dlp are resolved on first access, so
+importing the package (or its light modules) doesn't load yt-dlp's
+extractor registry; the GUI warms that up in the background.
+"""
+import importlib
+
+from .constants import (
+    VIDEO_TYPE, AUDIO_TYPE, DEFAULT_AUDIO_CODEC, DEFAULT_AUDIO_QUALITY, DEFAULT_ACCEPTED_AUDIO_CODECS,
+    DEFAULT_WORKER_COUNT, MAX_WORKER_COUNT, STOP_LATENCY_BOUND, DEFAULT_PLAYLIST_WINDOW,
+)
+from .progress import ProgressBus, format_item_status, format_throughput, format_stage_depths
+from .jobs import DownloadJob, JobJournal
+from .metrics import ItemMetrics, MetricsRecorder
+from .queue_model import QueueModel, QueueRow
+
+# --- Lazily imported (these modules import yt_dlp) ---
+_LAZY_EXPORTS = {
+    'DownloadOptions': 'engine', 'BatchResult': 'engine', 'DownloadEngine': 'engine',
+    'JobCancelled': 'engine', 'JobPaused': 'engine', 'CancelToken': 'cancel',
+    'AudioPolicy': 'audio_policy', 'AudioPolicyPP': 'audio_policy',
+    'build_ydl_opts': 'engine', 'split_valid_urls': 'engine', 'check_download_path': 'engine',
+    'DownloadIndex': 'index',
+    'UrlIngestor': 'ingest', 'IngestReport': 'ingest', 'ingest_lines': 'ingest', 'ingest_file': 'ingest', 'canonicalize': 'ingest',
+    'MetadataCache': 'metadata_cache',
+    'PipelinedYoutubeDL': 'pipeline', 'PostProcessStage': 'pipeline',
+    'DiskGuard': 'storage', 'InsufficientDiskSpace': 'storage',
+    'JobServer': 'jobserver', 'JobServerClient': 'jobserver', 'RemoteWorker': 'jobserver', 'serve': 'jobserver',
+    'PlaylistStream': 'streaming', 'ItemRecord': 'streaming',
+    'PlaylistSyncer': 'sync', 'SubscriptionStore': 'sync', 'scan_source': 'sync',
+    'RetryPolicy': 'retry', 'CircuitBreaker': 'retry', 'classify_error': 'retry', 'load_failure_report': 'retry',
+    'BandwidthScheduler': 'scheduler', 'BandwidthProfile': 'scheduler', 'HostLimiter': 'scheduler', 'parse_rate': 'scheduler',
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
@@ -0,0 +1,139 @@
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterable # For type hinting
+
+import yt_dlp
+from yt_dlp.postprocessor.ffmpeg import ACODECS, FFmpegExtractAudioPP
+
+from .constants import DEFAULT_AUDIO_CODEC, DEFAULT_AUDIO_QUALITY, DEFAULT_ACCEPTED_AUDIO_CODECS
+
+# --- Audio Outcomes ---
+AUDIO_COPIED = "copied" # Stream-copied/remuxed (or already in an accepted file), no re-encode
+AUDIO_TRANSCODED = "transcoded"
+
+# Names users (and yt-dlp's format 'acodec' field) use for the codecs ffprobe reports
+_CODEC_ALIASES = {'m4a': 'aac', 'mp4a': 'aac', 'ogg': 'vorbis', 'mp3': 'mp3', 'opus': 'opus', 'flac': 'flac', 'alac': 'alac', 'wav': 'wav'}
+# Prefix of yt-dlp's format 'acodec' field per codec, for format selection
+_ACODEC_PREFIXES = {'aac': 'mp4a', 'opus': 'opus', 'mp3': 'mp3', 'vorbis': 'vorbis', 'flac': 'flac', 'alac': 'alac'}
+
+
+def normalize_codec(name: Optional[str]) -> Optional[str]:
+    """Canonical codec name ('aac', 'opus', ...) for ffprobe, yt-dlp or user spellings."""
+    if not name or name == 'none':
+        return None
+    name = name.lower().split('.')[0] # 'mp4a.40.2' -> 'mp4a'
+    return _CODEC_ALIASES.get(name, name)
+
+
+class AudioPolicy:
+    """
+    Decides per item whether audio is stream-copied or transcoded.
+
+    Sources whose codec is in accepted_codecs are only remuxed into a
+    matching audio file (opus -> .opus, aac -> .m4a, ...); anything else is
+    converted to fallback_codec at bitrate kbit/s. An empty accepted list
+    transcodes everything (the old always-MP3 behaviour).
+    """
+    def __init__(self, accepted_codecs: Iterable[str] = DEFAULT_ACCEPTED_AUDIO_CODECS,
+                 fallback_codec: str = DEFAULT_AUDIO_CODEC, bitrate: str = DEFAULT_AUDIO_QUALITY):
+        """
+        Raises:
+            ValueError: Unknown fallback codec or non-numeric bitrate.
+        """
+        if fallback_codec not in ACODECS:
+            raise ValueError(f"Unsupported audio format {fallback_codec!r} (choose from {', '.join(ACODECS)})")
+        try:
+            float(bitrate)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid audio bitrate {bitrate!r} (kbit/s, e.g. 192)") from None
+        self.accepted = [c for c in (normalize_codec(name) for name in accepted_codecs) if c]
+        self.fallback_codec = fallback_codec
+        self.bitrate = str(bitrate)
+
+    def accepts(self, codec: Optional[str]) -> bool:
+        return normalize_codec(codec) in self.accepted
+
+    def format_selector(self) -> str:
+        """
+        yt-dlp format string: the best audio-only format with an accepted
+        codec, else the best audio-only format, else the best format.
+        """
+        prefixes = sorted({_ACODEC_PREFIXES[c] for c in self.accepted if c in _ACODEC_PREFIXES})
+        if not prefixes:
+            return 'bestaudio/best'
+        return f"bestaudio[acodec~='^({'|'.join(prefixes)})']/bestaudio/best"
+
+
+class AudioPolicyPP(yt_dlp.postprocessor.PostProcessor):
+    """
+    Audio extraction following an AudioPolicy.
+
+    Runs yt-dlp's FFmpegExtractAudioPP in copy mode ('best') for accepted
+    codecs and in convert mode otherwise. Both delegates are created once
+    and never reconfigured, so the same instance can run for items on
+    several threads (download workers and the post-processing stage).
+    """
+    def __init__(self, policy: AudioPolicy, on_result: Optional[Callable[[Dict[str, Any], str], None]] = None, downloader=None):
+        """
+        Args:
+            policy: Accepted codecs, fallback codec and bitrate.
+            on_result: Called as on_result(info, AUDIO_COPIED or AUDIO_TRANSCODED) per item.
+            downloader: YoutubeDL (add_post_processor also sets it).
+        """
+        self.policy = policy
+        self.on_result = on_result
+        self._copy = FFmpegExtractAudioPP(None, preferredcodec='best')
+        self._convert = FFmpegExtractAudioPP(None, preferredcodec=policy.fallback_codec, preferredquality=policy.bitrate)
+        super().__init__(downloader)
+
+    def set_downloader(self, downloader):
+        super().set_downloader(downloader)
+        # The delegates report through this PP's hooks, not their own
+        self._copy._downloader = downloader
+        self._convert._downloader = downloader
+
+    @classmethod
+    def pp_key(cls):
+        return 'ExtractAudio' # Same progress/metrics treatment as the stock audio extraction
+
+    def source_codec(self, info: Dict[str, Any]) -> Optional[str]:
+        """Codec the selected format advertised, else probed from the downloaded file."""
+        codec = normalize_codec(info.get('acodec'))
+        filepath = info.get('filepath')
+        if codec is None and filepath and (self._copy.probe_available or self._copy.available):
+            codec = normalize_codec(self._copy.get_audio_codec(filepath))
+        return codec
+
+    def run(self, information: Dict[str, Any]):
+        codec = self.source_codec(information)
+        if self.policy.accepts(codec):
+            result = self._copy.run(information)
+            outcome = AUDIO_COPIED
+        else:
+            result = self._convert.run(information)
+            outcome = AUDIO_COPIED if codec == normalize_codec(self.policy.fallback_codec) else AUDIO_TRANSCODED
+        self.to_screen(f"Audio {outcome} ({codec or 'unknown codec'}): {information.get('filepath')}")
+        if self.on_result is not None:
+            self.on_result(information, outcome)
+        return result
+
+
+class AudioStats:
+    """Thread-safe copied/transcoded counters for a batch."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {AUDIO_COPIED: 0, AUDIO_TRANSCODED: 0}
+
+    def record(self, _info: Dict[str, Any], outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def parse_codec_list(text: str) -> List[str]:
+    """'opus,m4a' -> ['opus', 'aac']; 'none' or '' -> [] (always transcode)."""
+    if text.strip().lower() in ('', 'none'):
+        return []
+    return [c for c in (normalize_codec(part.strip()) for part in text.split(',')) if c]
@@ -0,0 +1,144 @@
+"""
+Per-job cancellation tokens and child process tracking.
+
+yt-dlp runs FFmpeg (merges, audio extraction, HLS downloads) through
+yt_dlp.utils.Popen and only looks at cancellation in progress hooks, which
+don't fire while FFmpeg runs. install_process_tracking() swaps in a Popen
+subclass that registers each child with the token of the job the calling
+thread is working on, so cancelling the job terminates its FFmpeg.
+"""
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Optional # For type hinting
+
+import yt_dlp
+import yt_dlp.downloader.external
+import yt_dlp.postprocessor.ffmpeg
+
+from .constants import STOP_LATENCY_BOUND
+
+TERMINATE_GRACE = 1.0 # Seconds between terminate() and kill() for a child process
+
+_current = threading.local() # .token = CancelToken of the job this thread works on
+_install_lock = threading.Lock()
+_installed = False
+
+
+class CancelToken:
+    """
+    Cancellation state of one job.
+
+    cancel() may be called from any thread; the job's thread notices it at
+    its next check (progress hook, HTTP request, post-processor start) and
+    child processes registered with the token are terminated right away.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requested_at: Optional[float] = None # time.monotonic() of the first cancel()
+        self._processes: List[subprocess.Popen] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.requested_at is not None
+
+    def cancel(self):
+        with self._lock:
+            if self.requested_at is None:
+                self.requested_at = time.monotonic()
+            processes = list(self._processes)
+        for proc in processes:
+            _terminate(proc)
+
+    def add_process(self, proc: subprocess.Popen):
+        with self._lock:
+            self._processes = [p for p in self._processes if p.poll() is None]
+            self._processes.append(proc)
+            cancelled = self.requested_at is not None
+        if cancelled:
+            _terminate(proc) # Started after the cancel (e.g. the next post-processor)
+
+    def latency(self) -> Optional[float]:
+        """Seconds since cancel() (None if not cancelled)."""
+        return time.monotonic() - self.requested_at if self.requested_at is not None else None
+
+
+def _terminate(proc: subprocess.Popen):
+    """terminate(), then kill() from a helper thread if the process ignores it."""
+    if proc.poll() is not None:
+        return
+    try:
+        proc.terminate()
+    except OSError:
+        return
+
+    def reap():
+        try:
+            proc.wait(timeout=TERMINATE_GRACE)
+        except subprocess.TimeoutExpired:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+    threading.Thread(target=reap, name="ffmpeg-reaper", daemon=True).start()
+
+
+def set_current_token(token: Optional[CancelToken]):
+    """Attributes child processes started by this thread to token (None = untracked)."""
+    _current.token = token
+
+
+class TrackedPopen(yt_dlp.utils.Popen):
+    """yt-dlp's Popen, registered with the calling thread's CancelToken."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        token: Optional[CancelToken] = getattr(_current, 'token', None)
+        if token is not None:
+            token.add_process(self)
+
+
+def install_process_tracking():
+    """Makes yt-dlp's FFmpeg post-processors and external downloaders start TrackedPopen (idempotent)."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        yt_dlp.postprocessor.ffmpeg.Popen = TrackedPopen
+        yt_dlp.downloader.external.Popen = TrackedPopen
+        _installed = True
+
+
+class StopLatency:
+    """Time from cancel requests to the job (or batch) actually stopping."""
+    def __init__(self, bound: float = STOP_LATENCY_BOUND):
+        self.bound = bound
+        self._lock = threading.Lock()
+        self.count = 0
+        self.max_seconds = 0.0
+        self.total_seconds = 0.0
+        self.over_bound = 0
+
+    def record(self, seconds: float, what: str):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            over = seconds > self.bound
+            if over:
+                self.over_bound += 1
+        if over:
+            print(f"Warning: stopping {what} took {seconds:.2f}s (bound {self.bound:.1f}s)", file=sys.stderr)
+
+    def reset(self):
+        with self._lock:
+            self.count = self.over_bound = 0
+            self.max_seconds = self.total_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'stops': self.count, 'bound_seconds': self.bound, 'over_bound': self.over_bound,
+                'max_seconds': round(self.max_seconds, 3),
+                'avg_seconds': round(self.total_seconds / self.count, 3) if self.count else None,
+            }
@@ -0,0 +1,527 @@
+"""
+Headless entry point: python -m yt_downloader [options] [URL_FILE | -]
+
+Reads URLs (one per line, '#' comments allowed) from a file or streams them
+from stdin, downloads them with the same engine as the GUI, and prints one
+JSON object per line on stdout for every event and progress frame.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterable, Iterator, TextIO # For type hinting
+
+from .engine import (
+    VIDEO_TYPE, AUDIO_TYPE, DEFAULT_WORKER_COUNT, MAX_WORKER_COUNT,
+    DownloadOptions, DownloadEngine, check_download_path,
+)
+from .audio_policy import parse_codec_list
+from .constants import DEFAULT_AUDIO_CODEC, DEFAULT_AUDIO_QUALITY, DEFAULT_ACCEPTED_AUDIO_CODECS, DEFAULT_PLAYLIST_WINDOW
+from .index import DownloadIndex
+from .ingest import UrlIngestor, IngestReport, ingest_file
+from .jobs import JobJournal
+from .jobserver import JobServerClient, JobServerError, BATCH_OPTIONS
+from .metadata_cache import DEFAULT_METADATA_TTL, DEFAULT_METADATA_MAX_ENTRIES
+from .metrics import peak_rss
+from .pipeline import DEFAULT_POSTPROCESS_WORKERS, DEFAULT_POSTPROCESS_QUEUE_SIZE, MAX_POSTPROCESS_WORKERS
+from .retry import (
+    ERROR_CATEGORIES, REQUEUE_CATEGORIES, DEFAULT_TRANSIENT_RETRIES, DEFAULT_RATE_LIMITED_RETRIES,
+    DEFAULT_RETRY_BACKOFF, DEFAULT_BREAKER_COOLDOWN, default_report_path, load_failure_report,
+)
+from .scheduler import BandwidthProfile, parse_rate
+from .storage import DEFAULT_MIN_FREE_SPACE, parse_size
+from .sync import (
+    PlaylistSyncer, SubscriptionStore, SyncResult,
+    DEFAULT_SYNC_INTERVAL, MIN_SYNC_INTERVAL, DEFAULT_MAX_CONCURRENT_SYNCS, MAX_CONCURRENT_SYNCS,
+)
+
+# --- Exit Codes ---
+EXIT_OK = 0
+EXIT_FAILURES = 1 # Batch finished but some URLs failed
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+DEFAULT_PROGRESS_INTERVAL = 0.5 # Seconds between progress frames
+
+
+class JsonLinesReporter:
+    """Serializes engine events and ProgressBus frames as JSON lines."""
+    def __init__(self, stream: TextIO = sys.stdout):
+        self.stream = stream
+        self._lock = threading.Lock() # Events arrive from several worker threads
+
+    def write(self, event: str, **payload: Any):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(payload)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def on_event(self, event: str, payload: Dict[str, Any]):
+        """DownloadEngine on_event callback."""
+        self.write(event, **payload)
+
+    def write_progress_frame(self, engine: DownloadEngine):
+        """Drains the engine's ProgressBus and prints what changed."""
+        items, _status, overall = engine.progress_bus.drain() # Status lines arrive as events
+        for key, state in items.items():
+            state.pop('_seq', None)
+            self.write('progress', item=key, **state)
+        if overall is not None:
+            completed, total, active, stages = overall
+            self.write('overall', completed=completed, total=total, active=active, stages=stages, peak_rss=peak_rss())
+        if items: # Something is transferring
+            self.write('throughput', bytes_per_second=round(engine.bandwidth.throughput()), limit=engine.bandwidth.current_limit())
+
+
+def iter_url_lines(stream: TextIO, reporter: JsonLinesReporter) -> Iterator[str]:
+    """Lazily yields canonical, deduplicated URLs from stream, reporting skipped lines."""
+    ingestor = UrlIngestor()
+    report = ingestor.report
+    for line in stream:
+        invalid, duplicates = len(report.invalid_lines), report.duplicates
+        for item in ingestor.add_text(line):
+            yield item.url
+        if len(report.invalid_lines) > invalid:
+            reporter.write('skipped', line=line.strip(), reason="didn't look like a URL")
+        if report.duplicates > duplicates:
+            reporter.write('skipped', line=line.strip(), reason="duplicate")
+
+
+def report_ingestion(report: IngestReport, reporter: JsonLinesReporter):
+    """Writes the skipped lines and the summary of a whole-file ingestion."""
+    for line in report.invalid_lines:
+        reporter.write('skipped', line=line, reason="didn't look like a URL")
+    reporter.write('ingested', lines=report.lines, urls=len(report.urls), duplicates=report.duplicates,
+                   invalid=len(report.invalid_lines), kinds=report.counts())
+
+
+def _rate_arg(text: str) -> Optional[float]:
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _size_arg(text: str) -> int:
+    try:
+        return parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _categories_arg(text: str) -> List[str]:
+    categories = [part.strip().replace('-', '_') for part in text.split(',') if part.strip()]
+    unknown = [c for c in categories if c not in ERROR_CATEGORIES]
+    if unknown or not categories:
+        raise argparse.ArgumentTypeError(f"Unknown error categories: {', '.join(unknown) or text!r} (choose from {', '.join(ERROR_CATEGORIES)})")
+    return categories
+
+
+def _profile_arg(text: str) -> str:
+    try:
+        BandwidthProfile.parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text.strip() # Kept as text: DownloadOptions are journaled as JSON
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m yt_downloader",
+        description="Download YouTube videos or audio in batch without the GUI (yt-dlp).",
+    )
+    parser.add_argument('url_file', nargs='?', default='-',
+                        help="File with one URL per line (.txt), a CSV file or exported browser bookmarks (.html), "
+                             "or '-' to stream from stdin (default). Duplicate URLs are dropped.")
+    parser.add_argument('-t', '--type', dest='download_type', choices=[VIDEO_TYPE, AUDIO_TYPE], default=VIDEO_TYPE,
+                        help="Download type (default: %(default)s).")
+    parser.add_argument('-c', '--container', choices=['mp4', 'mkv'], default='mp4',
+                        help="Video container, ignored for audio (default: %(default)s).")
+    parser.add_argument('--audio-accept', type=parse_codec_list, default=list(DEFAULT_ACCEPTED_AUDIO_CODECS), metavar='CODECS',
+                        help="Audio codecs kept as downloaded (stream-copied, no re-encode), comma-separated, "
+                             "or 'none' to always convert (default: %s)." % ",".join(DEFAULT_ACCEPTED_AUDIO_CODECS))
+    parser.add_argument('--audio-format', default=DEFAULT_AUDIO_CODEC,
+                        help="Codec other audio is converted to, e.g. mp3, m4a, opus (default: %(default)s).")
+    parser.add_argument('--audio-quality', default=DEFAULT_AUDIO_QUALITY, metavar='KBPS',
+                        help="Bitrate of converted audio in kbit/s (default: %(default)s).")
+    parser.add_argument('-p', '--playlists', action='store_true',
+                        help="Download whole playlists into subfolders.")
+    parser.add_argument('--stream-playlists', dest='playlist_window', nargs='?', type=int, const=DEFAULT_PLAYLIST_WINDOW, default=0, metavar='N',
+                        help="Read playlists N entries at a time (default N: %(const)s) and keep only a short record of finished "
+                             "entries, so memory stays flat however long they are. Implies --playlists.")
+    parser.add_argument('-o', '--output', default=os.getcwd(),
+                        help="Base directory to save files (default: current directory).")
+    parser.add_argument('--scratch-dir', default=None, metavar='DIR',
+                        help="Directory (e.g. on a fast disk) for .part and intermediate files; "
+                             "finished files are moved to --output.")
+    parser.add_argument('--min-free', type=_size_arg, default=DEFAULT_MIN_FREE_SPACE, metavar='SIZE',
+                        help="Space always left free on the output/scratch volumes, e.g. 2G (default: 512M).")
+    parser.add_argument('--no-disk-check', dest='disk_admission', action='store_false',
+                        help="Start items without reserving their estimated size against free disk space.")
+    parser.add_argument('--max-writes-per-volume', type=int, default=0, metavar='N',
+                        help="Concurrent downloads writing to one volume (default: no limit besides --workers).")
+    parser.add_argument('--max-merges-per-volume', type=int, default=0, metavar='N',
+                        help="Concurrent merges/conversions writing to one volume (default: no limit besides --postprocess-workers).")
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKER_COUNT,
+                        help=f"Parallel downloads, 1-{MAX_WORKER_COUNT} (default: %(default)s).")
+    parser.add_argument('--no-index', dest='use_index', action='store_false',
+                        help="Don't skip items recorded in the download index (and don't record new ones).")
+    parser.add_argument('--index-db', default=None,
+                        help="Path of the SQLite download index (default: in the state directory).")
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="Scan the output directory and re-index existing downloads before starting. "
+                             "Only YouTube files can be recognized (the site isn't part of the file name); "
+                             "downloads from other sites are indexed again as they finish.")
+    parser.add_argument('--no-metadata-cache', dest='use_metadata_cache', action='store_false',
+                        help="Always re-extract metadata instead of reusing cached info_dicts.")
+    parser.add_argument('--metadata-ttl', type=float, default=DEFAULT_METADATA_TTL,
+                        help="Seconds cached metadata stays valid (default: %(default)s).")
+    parser.add_argument('--metadata-cache-size', type=int, default=DEFAULT_METADATA_MAX_ENTRIES,
+                        help="Maximum number of cached info_dicts, LRU-evicted (default: %(default)s).")
+    parser.add_argument('--no-journal', dest='use_journal', action='store_false',
+                        help="Don't journal jobs on disk (the batch can't be resumed).")
+    parser.add_argument('--journal-db', default=None,
+                        help="Path of the SQLite job journal (default: in the state directory).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Resume the most recent unfinished batch with its original options (URL input is ignored).")
+    parser.add_argument('-r', '--limit-rate', type=_rate_arg, default=None,
+                        help="Bandwidth shared by all parallel downloads, e.g. 500K or 4M bytes/s (default: unlimited).")
+    parser.add_argument('--bandwidth-profile', dest='bandwidth_profiles', action='append', type=_profile_arg, default=[],
+                        metavar='HH:MM-HH:MM=RATE',
+                        help="Time-of-day limit overriding --limit-rate, e.g. 09:00-18:00=1M or 18:00-09:00=unlimited. "
+                             "Repeatable; the first matching window wins.")
+    parser.add_argument('--max-per-host', type=int, default=0,
+                        help="Maximum concurrent downloads from one host (default: no limit besides --workers).")
+    parser.add_argument('--postprocess-workers', type=int, default=DEFAULT_POSTPROCESS_WORKERS,
+                        help=f"Merges/conversions run alongside downloads, 0-{MAX_POSTPROCESS_WORKERS}; 0 post-processes "
+                             "inline on the download worker (default: %(default)s).")
+    parser.add_argument('--postprocess-queue', type=int, default=DEFAULT_POSTPROCESS_QUEUE_SIZE,
+                        help="Finished downloads that may wait for post-processing before downloads pause (default: %(default)s).")
+    parser.add_argument('--retries', dest='transient_retries', type=int, default=DEFAULT_TRANSIENT_RETRIES, metavar='N',
+                        help="Extra attempts for items failing with network errors, timeouts or 5xx (default: %(default)s).")
+    parser.add_argument('--rate-limit-retries', dest='rate_limited_retries', type=int, default=DEFAULT_RATE_LIMITED_RETRIES, metavar='N',
+                        help="Extra attempts for rate-limited items, HTTP 429 or bot checks (default: %(default)s).")
+    parser.add_argument('--retry-backoff', type=float, default=DEFAULT_RETRY_BACKOFF, metavar='SECONDS',
+                        help="Delay before the first retry, doubled per attempt with random jitter (default: %(default)s).")
+    parser.add_argument('--breaker-cooldown', type=float, default=DEFAULT_BREAKER_COOLDOWN, metavar='SECONDS',
+                        help="How long all downloads from a rate-limiting site are held back, doubled if it keeps "
+                             "limiting; 0 disables (default: %(default)s).")
+    parser.add_argument('--failure-report', default=None, metavar='PATH',
+                        help="Where to save the JSON report of failed items (default: in the state directory).")
+    parser.add_argument('--requeue-failures', nargs='?', const='', default=None, metavar='REPORT',
+                        help="Download the items of a failure report again (default report if no path is given; URL input is ignored).")
+    parser.add_argument('--requeue-categories', type=_categories_arg, default=list(REQUEUE_CATEGORIES), metavar='CATEGORIES',
+                        help=f"Error categories --requeue-failures picks, comma-separated from {', '.join(ERROR_CATEGORIES)} "
+                             f"(default: {','.join(REQUEUE_CATEGORIES)}).")
+    parser.add_argument('--metrics-jsonl', default=None, metavar='PATH',
+                        help="Append per-item phase timings (extraction, first byte, transfer, merge, transcode) as JSON lines.")
+    parser.add_argument('--metrics-prom', default=None, metavar='PATH',
+                        help="Write aggregate phase timing histograms as a Prometheus text file (textfile collector).")
+    parser.add_argument('--server', default=None, metavar='URL',
+                        help="Submit the batch to a job server (python -m yt_downloader.jobserver serve) instead of "
+                             "downloading here; its workers' events and progress are printed as usual. "
+                             "Only what to download and the format/quality options are sent: the workers' own "
+                             "--output and settings decide where files go.")
+    parser.add_argument('--server-token', default=os.environ.get('YT_DOWNLOADER_JOB_TOKEN'), metavar='TOKEN',
+                        help="Job server token (default: $YT_DOWNLOADER_JOB_TOKEN).")
+    parser.add_argument('--subscribe', action='store_true',
+                        help="Subscribe to the input playlist/channel URLs for --sync and --watch instead of downloading them now.")
+    parser.add_argument('--sync', action='store_true',
+                        help="Download what's new in every subscribed playlist/channel (input URLs are subscribed first), "
+                             "scanning each only up to its last known entry.")
+    parser.add_argument('--watch', action='store_true',
+                        help="Like --sync, but keep running and sync each subscription every --sync-interval until Ctrl+C.")
+    parser.add_argument('--sync-interval', type=float, default=DEFAULT_SYNC_INTERVAL, metavar='SECONDS',
+                        help=f"Time between two syncs of a subscription with --watch, at least {MIN_SYNC_INTERVAL:.0f} (default: %(default)s).")
+    parser.add_argument('--max-concurrent-syncs', type=int, default=DEFAULT_MAX_CONCURRENT_SYNCS, metavar='N',
+                        help=f"Subscriptions scanned at the same time, 1-{MAX_CONCURRENT_SYNCS} (default: %(default)s).")
+    parser.add_argument('--sync-initial', type=int, default=None, metavar='N',
+                        help="Items downloaded from a subscription's first sync: its N newest, 0 = only items published "
+                             "afterwards (default: the whole list).")
+    parser.add_argument('--list-subscriptions', action='store_true',
+                        help="Print the subscriptions and their sync state, then exit.")
+    parser.add_argument('--unsubscribe', action='append', default=[], metavar='URL',
+                        help="Remove a subscription (repeatable), then exit.")
+    parser.add_argument('--subscriptions-db', default=None, metavar='PATH',
+                        help="Path of the SQLite subscription store (default: in the state directory).")
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help="Seconds between progress frames (default: %(default)s).")
+    return parser
+
+
+def run_on_server(client: JobServerClient, urls: List[str], options: DownloadOptions, reporter: JsonLinesReporter, interval: float) -> int:
+    """Submits a batch to a job server and prints its events and progress until it's done."""
+    try:
+        batch_id = client.submit(urls, {name: getattr(options, name) for name in BATCH_OPTIONS})
+    except JobServerError as e:
+        reporter.write('error', message=str(e))
+        return EXIT_USAGE
+    since = 0
+    cancelled = False
+    summary: Dict[str, Any] = {}
+    while True:
+        try:
+            update = client.poll(batch_id, since, interval)
+        except KeyboardInterrupt:
+            if not cancelled:
+                cancelled = True
+                reporter.write('status', message="Cancellation requested, waiting for the workers to stop...")
+                try:
+                    client.cancel(batch_id)
+                except JobServerError as e:
+                    reporter.write('error', message=str(e))
+                    return EXIT_CANCELLED
+            continue
+        except JobServerError as e:
+            reporter.write('error', message=str(e))
+            if e.status == 404:
+                return EXIT_FAILURES # The server dropped the batch (restarted, or kept it past its retention)
+            time.sleep(interval) # The server may come back; its workers keep going
+            continue
+        if update['dropped']:
+            reporter.write('status', message=f"{update['dropped']} event(s) were dropped by the job server")
+        for record in update['events']:
+            record.pop('seq', None)
+            event = record.pop('event')
+            if event == 'batch_finished':
+                summary = record
+            reporter.write(event, **record)
+        since = update['next']
+        for key, state in update['progress'].items():
+            reporter.write('progress', item=key, **state)
+        overall = update['overall']
+        reporter.write('overall', completed=overall['completed'], total=overall['total'], active=overall['leased'],
+                       stages={'queued': overall['queued'], 'leased': overall['leased']})
+        if update['finished']:
+            break
+    if summary.get('cancelled'):
+        return EXIT_CANCELLED
+    return EXIT_FAILURES if summary.get('failed') else EXIT_OK
+
+
+def read_subscription_urls(url_file: str, reporter: JsonLinesReporter) -> Optional[List[str]]:
+    """URLs to subscribe to (none when stdin is a terminal); None if the file can't be read."""
+    if url_file == '-':
+        return [] if sys.stdin.isatty() else list(iter_url_lines(sys.stdin, reporter))
+    try:
+        report = ingest_file(url_file)
+    except OSError as e:
+        reporter.write('error', message=f"Cannot read URL file: {e}")
+        return None
+    report_ingestion(report, reporter)
+    return [item.url for item in report.urls]
+
+
+def run_sync(args: argparse.Namespace, options: DownloadOptions, reporter: JsonLinesReporter) -> int:
+    """--subscribe, --sync and --watch: subscribes to the input URLs, then syncs the subscriptions."""
+    store = SubscriptionStore(args.subscriptions_db)
+    try:
+        urls = read_subscription_urls(args.url_file, reporter)
+        if urls is None:
+            return EXIT_USAGE
+        for url in urls:
+            reporter.write('subscribed', url=url, new=store.add(url))
+        if not (args.sync or args.watch):
+            return EXIT_OK
+
+        syncer = PlaylistSyncer(options, store, interval=args.sync_interval, max_concurrent=args.max_concurrent_syncs,
+                                initial_items=args.sync_initial, on_event=reporter.on_event)
+        outcome: Dict[str, Any] = {}
+        sync_done = threading.Event()
+
+        def run():
+            try:
+                if args.watch:
+                    syncer.watch()
+                else:
+                    outcome['result'] = syncer.sync_once(force=True)
+            finally:
+                sync_done.set()
+
+        threading.Thread(target=run, name="yt-dlp-sync", daemon=True).start()
+        try:
+            while not sync_done.wait(timeout=args.progress_interval):
+                reporter.write_progress_frame(syncer.engine)
+        except KeyboardInterrupt:
+            syncer.stop()
+            reporter.write('status', message="Stopping, new items not downloaded yet are kept for the next sync...")
+            sync_done.wait()
+        reporter.write_progress_frame(syncer.engine)
+    finally:
+        store.close()
+
+    result: Optional[SyncResult] = outcome.get('result')
+    if result is None:
+        return EXIT_OK if args.watch else EXIT_FAILURES # --watch only ends on Ctrl+C
+    if result.cancelled:
+        return EXIT_CANCELLED
+    return EXIT_FAILURES if result.failed_sources or result.failed_items else EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    reporter = JsonLinesReporter()
+
+    if args.list_subscriptions or args.unsubscribe:
+        store = SubscriptionStore(args.subscriptions_db)
+        try:
+            for url in args.unsubscribe:
+                reporter.write('unsubscribed', url=url, found=store.remove(url))
+            if args.list_subscriptions:
+                for source in store.sources():
+                    head_ids = source.pop('head_ids')
+                    reporter.write('subscription', known_ids=sum(len(ids) for ids in head_ids.values()), **source)
+        finally:
+            store.close()
+        return EXIT_OK
+
+    resume_batch_id: Optional[int] = None
+    if args.resume:
+        journal = JobJournal(args.journal_db)
+        try:
+            unfinished = journal.unfinished_batch()
+        finally:
+            journal.close()
+        if unfinished is None:
+            reporter.write('status', message="No unfinished batch to resume.")
+            return EXIT_OK
+        resume_batch_id = unfinished['batch_id']
+        options = DownloadOptions.from_dict(unfinished['options'])
+        if args.journal_db:
+            options.journal_path = args.journal_db
+        if args.metrics_jsonl:
+            options.metrics_jsonl_path = args.metrics_jsonl
+        if args.metrics_prom:
+            options.metrics_prometheus_path = args.metrics_prom
+    else:
+        options = DownloadOptions(
+            download_path=args.output,
+            download_type=args.download_type,
+            container_format=args.container if args.download_type == VIDEO_TYPE else None,
+            download_playlists=args.playlists or args.playlist_window > 0,
+            playlist_window=max(0, args.playlist_window),
+            worker_count=args.workers,
+            use_index=args.use_index,
+            index_path=args.index_db,
+            use_metadata_cache=args.use_metadata_cache,
+            metadata_ttl=args.metadata_ttl,
+            metadata_max_entries=args.metadata_cache_size,
+            use_journal=args.use_journal,
+            journal_path=args.journal_db,
+            rate_limit=args.limit_rate,
+            bandwidth_profiles=args.bandwidth_profiles,
+            max_per_host=max(0, args.max_per_host),
+            postprocess_workers=max(0, min(args.postprocess_workers, MAX_POSTPROCESS_WORKERS)),
+            postprocess_queue_size=max(1, args.postprocess_queue),
+            metrics_jsonl_path=args.metrics_jsonl,
+            metrics_prometheus_path=args.metrics_prom,
+            audio_accepted_codecs=args.audio_accept,
+            audio_fallback_codec=args.audio_format,
+            audio_bitrate=args.audio_quality,
+            scratch_path=args.scratch_dir,
+            disk_admission=args.disk_admission,
+            min_free_space=args.min_free,
+            max_writes_per_volume=max(0, args.max_writes_per_volume),
+            max_merges_per_volume=max(0, args.max_merges_per_volume),
+            transient_retries=max(0, args.transient_retries),
+            rate_limited_retries=max(0, args.rate_limited_retries),
+            retry_backoff=max(0.0, args.retry_backoff),
+            breaker_cooldown=max(0.0, args.breaker_cooldown),
+            failure_report_path=args.failure_report,
+        )
+        try:
+            options.audio_policy()
+        except ValueError as e:
+            reporter.write('error', message=str(e))
+            return EXIT_USAGE
+
+    path_error = check_download_path(options.download_path)
+    if not path_error and options.scratch_path:
+        path_error = check_download_path(options.scratch_path)
+    if path_error:
+        reporter.write('error', message=path_error)
+        return EXIT_USAGE
+
+    if args.subscribe or args.sync or args.watch:
+        if resume_batch_id is not None or args.server or args.requeue_failures is not None:
+            reporter.write('error', message="--subscribe/--sync/--watch can't be combined with --resume, --server or --requeue-failures.")
+            return EXIT_USAGE
+        return run_sync(args, options, reporter)
+
+    url_stream: Optional[TextIO] = None
+    url_source: Iterable[str] = ()
+    if resume_batch_id is None:
+        if args.requeue_failures is not None:
+            report_path = args.requeue_failures or default_report_path()
+            try:
+                url_source = load_failure_report(report_path, args.requeue_categories)
+            except (OSError, ValueError) as e:
+                reporter.write('error', message=f"Cannot read failure report: {e}")
+                return EXIT_USAGE
+            reporter.write('requeued', report=report_path, categories=args.requeue_categories, urls=len(url_source))
+        elif args.url_file == '-':
+            url_stream = sys.stdin
+            url_source = iter_url_lines(url_stream, reporter) # Streamed as lines arrive
+        else:
+            # Read up front: bulk index lookup, and the whole batch is journaled for --resume
+            try:
+                report = ingest_file(args.url_file)
+            except OSError as e:
+                reporter.write('error', message=f"Cannot read URL file: {e}")
+                return EXIT_USAGE
+            report_ingestion(report, reporter)
+            url_source = [item.url for item in report.urls]
+
+    if args.server:
+        if resume_batch_id is not None:
+            reporter.write('error', message="--resume can't be combined with --server (the server tracks its own batches).")
+            return EXIT_USAGE
+        return run_on_server(JobServerClient(args.server, args.server_token), list(url_source), options, reporter, args.progress_interval)
+
+    if args.rebuild_index:
+        index = DownloadIndex(options.index_path)
+        try:
+            indexed = index.rebuild([options.download_path])
+        finally:
+            index.close()
+        reporter.write('index_rebuilt', directory=options.download_path, files=indexed)
+    engine = DownloadEngine(options, on_event=reporter.on_event)
+    outcome: Dict[str, Any] = {}
+
+    batch_done = threading.Event()
+
+    def run_batch():
+        try:
+            if resume_batch_id is not None:
+                outcome['result'] = engine.resume(resume_batch_id)
+            else:
+                outcome['result'] = engine.run(url_source)
+        finally:
+            batch_done.set()
+
+    batch_thread = threading.Thread(target=run_batch, name="yt-dlp-batch", daemon=True)
+    batch_thread.start()
+    try:
+        # Main thread only paints progress frames and waits for Ctrl+C.
+        # (Event.wait, unlike an interrupted Thread.join, is safe to re-enter.)
+        while not batch_done.wait(timeout=args.progress_interval):
+            reporter.write_progress_frame(engine)
+    except KeyboardInterrupt:
+        engine.cancel()
+        reporter.write('status', message="Cancellation requested, waiting for current operation to stop...")
+        batch_done.wait()
+    finally:
+        if url_stream is not None and url_stream is not sys.stdin:
+            url_stream.close()
+    reporter.write_progress_frame(engine)
+
+    result = outcome.get('result')
+    if result is None or result.init_error:
+        return EXIT_FAILURES
+    if result.cancelled:
+        return EXIT_CANCELLED
+    return EXIT_FAILURES if result.failed_items else EXIT_OK
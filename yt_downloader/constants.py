@@ -0,0 +1,15 @@
+"""
+Settings shared by the engine and the UIs.
+
+Kept free of yt-dlp imports so the GUI can build its window before the
+(slow to import) yt-dlp extractor registry is loaded.
+"""
+VIDEO_TYPE = "video"
+AUDIO_TYPE = "audio"
+DEFAULT_AUDIO_CODEC = "mp3" # Or 'm4a', 'opus', etc.
+DEFAULT_AUDIO_QUALITY = "192" # kbit/s
+DEFAULT_ACCEPTED_AUDIO_CODECS = ("aac", "opus", "mp3", "vorbis") # Stream-copied in audio mode; others are converted
+DEFAULT_WORKER_COUNT = 3 # Parallel downloads, each with its own YoutubeDL
+MAX_WORKER_COUNT = 8
+STOP_LATENCY_BOUND = 2.0 # Seconds a cancel may take to stop a job (or a batch) before it's reported
+DEFAULT_PLAYLIST_WINDOW = 50 # Entries read and queued at a time when streaming playlists
@@ -0,0 +1,1418 @@
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, asdict
+from typing import List, Dict, Any, Optional, Callable, Deque, Iterable, Iterator, Tuple, Set # For type hinting
+
+import yt_dlp
+from yt_dlp.utils import PlaylistEntries
+
+from .constants import (
+    VIDEO_TYPE, AUDIO_TYPE, DEFAULT_AUDIO_CODEC, DEFAULT_AUDIO_QUALITY, DEFAULT_ACCEPTED_AUDIO_CODECS,
+    DEFAULT_WORKER_COUNT, MAX_WORKER_COUNT,
+)
+from .progress import ProgressBus
+from .audio_policy import AudioPolicy, AudioPolicyPP, AudioStats
+from .cancel import CancelToken, StopLatency, install_process_tracking, set_current_token
+from .index import DownloadIndex, IndexRecorderPP, variant_for
+from .jobs import (
+    DownloadJob, JobJournal,
+    JOB_PENDING, JOB_EXTRACTING, JOB_DOWNLOADING, JOB_POSTPROCESSING, JOB_DONE, JOB_FAILED, JOB_EXPANDED,
+)
+from .metrics import (
+    ItemMetrics, MetricsRecorder, phase_for_postprocessor, peak_rss,
+    PHASE_FIRST_BYTE, PHASE_TRANSFER, PHASE_POSTPROCESS_WAIT, PHASE_OTHER,
+)
+from .metadata_cache import MetadataCache, DEFAULT_METADATA_TTL, DEFAULT_METADATA_MAX_ENTRIES, cache_key_for
+from .pipeline import (
+    PipelinedYoutubeDL, PostProcessTask, PostProcessStage, stage_capacity,
+    DEFAULT_POSTPROCESS_WORKERS, DEFAULT_POSTPROCESS_QUEUE_SIZE,
+)
+from .retry import (
+    RetryPolicy, CircuitBreaker, classify_error, count_by_category, write_failure_report, default_report_path,
+    ERROR_PERMANENT, ERROR_CANCELLED,
+    DEFAULT_TRANSIENT_RETRIES, DEFAULT_RATE_LIMITED_RETRIES, DEFAULT_RETRY_BACKOFF, DEFAULT_RETRY_BACKOFF_MAX,
+    DEFAULT_BREAKER_COOLDOWN,
+)
+from .streaming import (
+    PlaylistStream, ItemRecord, playlist_entries, streamable, WINDOW_START_KEY, RECORD_DONE, RECORD_FAILED, RECORD_SKIPPED, RECORD_CANCELLED,
+)
+from .scheduler import BandwidthScheduler, BandwidthProfile, HostLimiter, host_key
+from .storage import DiskGuard, InsufficientDiskSpace, estimate_size, DEFAULT_MIN_FREE_SPACE, IO_WRITE
+from .urls import match_extractor
+
+# --- Constants ---
+HOST_LOOKAHEAD = 64 # Jobs read ahead of the feed while looking for one whose host has a free slot
+_YOUTUBE_URL_PATTERN = re.compile(
+    r"^(https?://)?(www\.)?(youtube\.com/|youtu\.be/)"
+    r"(watch\?v=|playlist\?list=|shorts/|embed/|c/|channel/|user/|@)?"
+    r"[a-zA-Z0-9_\-?=&]+$" # Slightly improved pattern
+)
+
+ITEM_CANCELLED_ERROR = "Cancelled by user"
+
+# Callback signature: on_event(event_name, payload). Called from worker threads.
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class JobCancelled(yt_dlp.utils.DownloadCancelled):
+    """Raised inside yt-dlp to stop one job (DownloadEngine.cancel_job); the batch goes on."""
+    msg = 'Item cancelled by user.'
+
+
+class JobPaused(yt_dlp.utils.DownloadCancelled):
+    """Raised inside yt-dlp to park a job while the engine is paused; it is re-queued and continues its .part file."""
+    msg = 'Item paused.'
+
+
+@dataclass
+class DownloadOptions:
+    """User-facing download settings shared by the GUI and the CLI."""
+    download_path: str
+    download_type: str = VIDEO_TYPE
+    container_format: Optional[str] = "mp4" # Only used for VIDEO_TYPE
+    download_playlists: bool = False
+    playlist_window: int = 0 # Stream playlists: entries read and queued at a time, 0 = expand the whole list up front
+    worker_count: int = DEFAULT_WORKER_COUNT
+    transient_retries: int = DEFAULT_TRANSIENT_RETRIES # Extra attempts after network errors, timeouts, 5xx
+    rate_limited_retries: int = DEFAULT_RATE_LIMITED_RETRIES # Extra attempts after HTTP 429 / bot checks
+    retry_backoff: float = DEFAULT_RETRY_BACKOFF # Seconds before the first retry, doubled per attempt (with jitter)
+    retry_backoff_max: float = DEFAULT_RETRY_BACKOFF_MAX
+    breaker_cooldown: float = DEFAULT_BREAKER_COOLDOWN # Seconds a rate-limiting site is left alone, 0 = no circuit breaker
+    failure_report_path: Optional[str] = None # None = default location in the state dir
+    use_index: bool = True # Skip items already in the DownloadIndex, record new ones
+    index_path: Optional[str] = None # None = default location in the state dir
+    use_metadata_cache: bool = True # Reuse recently extracted info_dicts
+    metadata_ttl: float = DEFAULT_METADATA_TTL # Seconds
+    metadata_max_entries: int = DEFAULT_METADATA_MAX_ENTRIES
+    use_journal: bool = True # Journal jobs on disk so an interrupted batch can be resumed
+    journal_path: Optional[str] = None # None = default location in the state dir
+    rate_limit: Optional[float] = None # Bytes/s shared by all downloads, None = unlimited
+    bandwidth_profiles: List[str] = field(default_factory=list) # 'HH:MM-HH:MM=RATE', first match overrides rate_limit
+    max_per_host: int = 0 # Concurrent jobs per host, 0 = only limited by worker_count
+    postprocess_workers: int = DEFAULT_POSTPROCESS_WORKERS # Merge/convert off the download threads, 0 = inline
+    postprocess_queue_size: int = DEFAULT_POSTPROCESS_QUEUE_SIZE # Downloads waiting for post-processing before workers block
+    metrics_jsonl_path: Optional[str] = None # Append one JSON line of phase timings per finished item
+    metrics_prometheus_path: Optional[str] = None # Prometheus text file with aggregate phase histograms
+    audio_accepted_codecs: List[str] = field(default_factory=lambda: list(DEFAULT_ACCEPTED_AUDIO_CODECS)) # Copied, not re-encoded; [] = always convert
+    audio_fallback_codec: str = DEFAULT_AUDIO_CODEC # Target for audio in other codecs
+    audio_bitrate: str = DEFAULT_AUDIO_QUALITY # kbit/s for converted audio
+    scratch_path: Optional[str] = None # .part/intermediate files go here, finished files are moved to download_path
+    disk_admission: bool = True # Reserve each item's estimated size against free space before writing
+    min_free_space: int = DEFAULT_MIN_FREE_SPACE # Bytes always left free on the volumes written to
+    max_writes_per_volume: int = 0 # Concurrent file downloads per volume, 0 = no cap
+    max_merges_per_volume: int = 0 # Concurrent merges/conversions/moves per volume, 0 = no cap
+
+    def retry_policy(self) -> RetryPolicy:
+        return RetryPolicy(self.transient_retries, self.rate_limited_retries, self.retry_backoff, self.retry_backoff_max)
+
+    def audio_policy(self) -> AudioPolicy:
+        """
+        Raises:
+            ValueError: Invalid fallback codec or bitrate.
+        """
+        return AudioPolicy(self.audio_accepted_codecs, self.audio_fallback_codec, self.audio_bitrate)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DownloadOptions":
+        """Rebuilds options saved with asdict(), ignoring unknown keys."""
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one DownloadEngine.run() call."""
+    total: int = 0
+    completed: int = 0 # Includes skipped items
+    skipped: int = 0 # Already present according to the DownloadIndex
+    failed_items: List[Dict[str, Any]] = field(default_factory=list) # 'item', 'error', 'category' (ERROR_*), 'attempts', 'key'
+    cancelled: bool = False
+    init_error: Optional[str] = None
+    batch_id: Optional[int] = None # JobJournal batch, when journaling is enabled
+    metadata_cache: Optional[Dict[str, Any]] = None # MetadataCache.stats() for this batch
+    postprocess: Optional[Dict[str, Any]] = None # PostProcessStage.stats(), when pipelined
+    metrics: Optional[Dict[str, Any]] = None # MetricsRecorder.summary() for this batch
+    audio: Optional[Dict[str, int]] = None # Items copied/transcoded, in audio mode
+    disk: Optional[Dict[str, Any]] = None # DiskGuard.stats() for this batch
+    stop_latency: Optional[Dict[str, Any]] = None # StopLatency.stats(): time from cancel requests to stopped
+    retry: Optional[Dict[str, Any]] = None # Retries and final failures per error category, CircuitBreaker.stats()
+    playlists: Optional[List[Dict[str, Any]]] = None # PlaylistStream.summary() of each streamed playlist
+    items: List[ItemRecord] = field(default_factory=list) # Finished entries of streamed playlists, in playlist order
+    peak_rss: Optional[int] = None # Bytes, for the whole process so far
+    failure_report: Optional[str] = None # JSON report of failed_items, re-queueable (retry.load_failure_report)
+
+
+def split_valid_urls(lines: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Basic URL format check (no canonicalization or dedup, see ingest.UrlIngestor).
+
+    Returns:
+        (valid_urls, invalid_lines). Blank lines are dropped.
+    """
+    valid_urls = []
+    invalid_lines = []
+    for line in lines:
+         url = line.strip()
+         if not url:
+             continue
+         if _YOUTUBE_URL_PATTERN.match(url):
+             valid_urls.append(url)
+         else:
+             if "://" in url or "." in url: # Heuristic for other URLs
+                 valid_urls.append(url)
+             else:
+                 invalid_lines.append(url)
+    return valid_urls, invalid_lines
+
+
+def check_download_path(download_path: str) -> Optional[str]:
+    """Returns an error message if download_path is unusable, else None."""
+    if not download_path:
+        return "Please select a download location."
+    if not os.path.isdir(download_path):
+        return f"The selected download path is not a valid directory:\n{download_path}"
+    try: # Test write permissions
+         test_file = os.path.join(download_path, ".permission_test")
+         with open(test_file, "w") as f: f.write("test")
+         os.remove(test_file)
+    except Exception as e:
+         return f"Cannot write to the selected download path:\n{download_path}\nError: {e}"
+    return None
+
+
+def build_ydl_opts(options: DownloadOptions, progress_hook: Callable[[Dict[str, Any]], None], postprocessor_hook: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Translates DownloadOptions into a yt-dlp options dict (audio extraction is added by DownloadEngine, see AudioPolicyPP)."""
+    # --- Base yt-dlp Options ---
+    base_ydl_opts: Dict[str, Any] = {
+        'progress_hooks': [progress_hook],
+        'postprocessor_hooks': [postprocessor_hook] if postprocessor_hook else [],
+        'nocheckcertificate': True,
+        # Each job is a single item now (playlists are fanned out by the
+        # engine), so errors must surface to be counted and retried per item
+        'ignoreerrors': False,
+        'noplaylist': not options.download_playlists,
+        'quiet': True,
+        'verbose': False,
+        'no_warnings': True,
+        'noprogress': True, # Progress is reported via the hook only (keeps CLI stdout clean JSON)
+        'updatetime': False,
+        # Output template is relative to 'home'; .part and intermediate files go to 'temp'
+        'paths': {'home': options.download_path},
+        'continuedl': True, # Resume existing .part files (e.g. after a resumed batch)
+        'postprocessors': [], # Initialize postprocessors list
+        'format': None, # Define later
+        'merge_output_format': None, # Define later
+    }
+
+    # --- Set Output Template ---
+    if options.download_playlists:
+         base_ydl_opts['outtmpl'] = os.path.join(
+             '%(playlist)s',
+             '%(playlist_index)02d - %(title)s [%(id)s].%(ext)s'
+         )
+    else:
+        base_ydl_opts['outtmpl'] = '%(title)s [%(id)s].%(ext)s'
+    if options.scratch_path:
+        base_ydl_opts['paths']['temp'] = os.path.abspath(options.scratch_path) # Moved to 'home' when finished
+
+    # --- Set Format, Merge Format, and Postprocessors ---
+    if options.download_type == VIDEO_TYPE:
+        # Select best formats, preferring widely compatible ones first
+        base_ydl_opts['format'] = 'bestvideo[ext=mp4][vcodec^=avc]+bestaudio[ext=m4a]/bestvideo[vcodec^=avc]+bestaudio/bestvideo+bestaudio/best[ext=mp4]/best'
+
+        # Set merge format based on user selection
+        if options.container_format == 'mkv':
+            base_ydl_opts['merge_output_format'] = 'mkv'
+            # NOTE: Relying on merge_output_format primarily. Omitting explicit remuxer PP for now.
+        else: # Default to mp4
+            base_ydl_opts['merge_output_format'] = 'mp4'
+
+    elif options.download_type == AUDIO_TYPE:
+        # Prefer a source the AudioPolicyPP (added by DownloadEngine) can copy without re-encoding
+        base_ydl_opts['format'] = options.audio_policy().format_selector()
+
+    # Remove unset/empty keys
+    if base_ydl_opts['format'] is None: del base_ydl_opts['format']
+    if base_ydl_opts['merge_output_format'] is None: del base_ydl_opts['merge_output_format']
+    if not base_ydl_opts.get('postprocessors'): # Use .get() for safety
+         if 'postprocessors' in base_ydl_opts:
+             del base_ydl_opts['postprocessors']
+    return base_ydl_opts
+
+
+def playlist_context(playlist: Dict[str, Any]) -> Dict[str, Any]:
+    """Playlist fields yt-dlp adds to each entry's info_dict (the per-entry index/count fields are left to the caller)."""
+    return {
+        'playlist': playlist.get('title') or playlist.get('id'),
+        'playlist_title': playlist.get('title'),
+        'playlist_id': playlist.get('id'),
+        'playlist_uploader': playlist.get('uploader'),
+        'playlist_uploader_id': playlist.get('uploader_id'),
+        'playlist_channel': playlist.get('channel'),
+        'playlist_channel_id': playlist.get('channel_id'),
+        'playlist_webpage_url': playlist.get('webpage_url'),
+    }
+
+
+def _numbered(urls: Iterable[Optional[str]]) -> Iterator[Optional[Tuple[int, str]]]:
+    """(position, url) per input URL, like enumerate(); a None (nothing yet, see DownloadEngine.run) takes no position."""
+    position = 0
+    for url in urls:
+        if url is None:
+            yield None
+            continue
+        yield position, url
+        position += 1
+
+
+class DownloadEngine:
+    """
+    GUI-independent batch downloader.
+
+    Input URLs are pulled from an iterable by a pool of worker threads, each
+    with its own YoutubeDL instance, so extraction round-trips and FFmpeg
+    merges of one item overlap with transfers of the others. High-frequency
+    progress goes to the ProgressBus; lifecycle events (batch_started,
+    item_started, item_finished, item_failed, status, batch_finished) go to
+    the optional on_event callback. Jobs are identified by DownloadJob.key()
+    ('key' in event payloads and progress states), which cancel_job() and
+    retry_job() take.
+
+    Post-processing (merges, audio conversion) is a separate pipeline
+    stage: finished downloads wait in a bounded PostProcessStage queue while
+    the worker moves on with another, idle YoutubeDL instance. Transfers share one BandwidthScheduler (global token bucket, optional
+    time-of-day profiles) and jobs are only handed out while their host has
+    a free HostLimiter slot. Once its formats are chosen, an item's estimated
+    size is reserved against free disk space (DiskGuard) before it writes
+    anything, and writes/merges per volume can be capped.
+
+    Failed attempts are classified (retry.classify_error): transient and
+    rate-limited ones are retried after an exponential backoff with jitter,
+    and rate limiting holds back the whole site through a CircuitBreaker.
+    Final failures are saved to a JSON report that can be re-queued.
+
+    With options.playlist_window set, playlists are streamed: their entries
+    are read and queued one window at a time (see streaming.PlaylistStream),
+    so a batch's memory doesn't grow with the length of its playlists. A
+    streamed playlist is read with a YoutubeDL of its own, not a worker's.
+    """
+    def __init__(self, options: DownloadOptions, on_event: Optional[EventCallback] = None, progress_bus: Optional[ProgressBus] = None, extractors: Optional[List[type]] = None):
+        """
+        Args:
+            options: Download settings.
+            on_event: Optional lifecycle event callback (called from worker threads).
+            progress_bus: Bus to publish progress to (a private one if omitted).
+            extractors: Extra yt-dlp InfoExtractor classes (e.g. the offline
+                benchmark's); they take precedence for URLs they match.
+        """
+        self.options = options
+        self.extractors: List[type] = list(extractors or [])
+        self.on_event = on_event
+        self.progress_bus = progress_bus or ProgressBus()
+        self.cancelled = False # Flag for explicit cancellation
+        self.index: Optional[DownloadIndex] = None # Opened per run when options.use_index
+        self.metadata_cache: Optional[MetadataCache] = None # Opened per run when options.use_metadata_cache
+        self.journal: Optional[JobJournal] = None # Opened per run when options.use_journal
+        self.batch_id: Optional[int] = None
+        self.metrics: Optional[MetricsRecorder] = None # Created per run; kept afterwards for the UI
+        # .job = DownloadJob the current thread is processing, .handed_off = job passed to
+        # the post-processing stage, .transfer = (filename, bytes) last reported
+        self._local = threading.local()
+        self.bandwidth = BandwidthScheduler(options.rate_limit, [BandwidthProfile.parse(p) for p in options.bandwidth_profiles])
+        self.hosts = HostLimiter(options.max_per_host)
+        self.disk = DiskGuard(options.min_free_space, options.max_writes_per_volume, options.max_merges_per_volume)
+        self.retry_policy = options.retry_policy()
+        self.breaker = CircuitBreaker(options.breaker_cooldown, on_change=self._circuit_changed)
+        self._cancelled_keys: Set[str] = set() # Jobs cancelled individually (cancel_job)
+        self._streams: List[PlaylistStream] = [] # Playlists streamed in the current batch
+        self._ydl_opts: Dict[str, Any] = {} # build_ydl_opts() of the current batch (_new_ydl)
+        self._requeue: Optional[Callable[[str], bool]] = None # Set while a batch runs (retry_job)
+        self._drop_queued: Optional[Callable[[str], bool]] = None # Set while a batch runs (cancel_job)
+        # Tokens of running jobs (and of jobs cancelled before they started), by DownloadJob.key()
+        self._tokens: Dict[str, CancelToken] = {}
+        self._tokens_lock = threading.Lock()
+        self._paused = False
+        self._state: Optional[threading.Condition] = None # The running batch's state lock, for wake-ups
+        self._cancel_requested_at: Optional[float] = None
+        self.stop_latency = StopLatency()
+        install_process_tracking() # FFmpeg children become terminable per job
+
+    def cancel(self):
+        """
+        Requests cancellation of the whole batch.
+
+        Workers stop at their next progress hook call or HTTP request, and
+        running FFmpeg children are terminated. Unfinished items keep their
+        journal state (and .part files), so the batch can be resumed.
+        """
+        if self._cancel_requested_at is None:
+            self._cancel_requested_at = time.monotonic()
+        self.cancelled = True
+        with self._tokens_lock:
+            tokens = list(self._tokens.values())
+        for token in tokens:
+            token.cancel()
+        self._wake()
+
+    def cancel_job(self, key: str):
+        """
+        Cancels one job by DownloadJob.key(); the rest of the batch goes on.
+
+        A queued job is dropped right away (or when a worker reads it from
+        the input, if it wasn't read yet). A running one stops at its next
+        progress hook call or HTTP request, and its FFmpeg child is
+        terminated. Either way it is reported as failed with
+        ITEM_CANCELLED_ERROR (and not retried).
+        """
+        self._cancelled_keys.add(key) # Set.add is atomic under the GIL; read from the worker threads
+        with self._tokens_lock:
+            token = self._tokens.setdefault(key, CancelToken())
+        token.cancel()
+        drop_queued = self._drop_queued
+        if drop_queued is not None:
+            drop_queued(key)
+
+    def pause(self):
+        """
+        Pauses the batch: queued jobs are held and running transfers stop at
+        their next progress report. Their .part files are kept and continued
+        after unpause(); extraction and post-processing already under way finish.
+        """
+        if not self._paused:
+            self._paused = True
+            self.update_status("Paused.")
+            self.emit('batch_paused')
+
+    def unpause(self):
+        """Continues a paused batch (see pause(); resume() continues an interrupted one from the journal)."""
+        if self._paused:
+            self._paused = False
+            self.update_status("Resumed.")
+            self.emit('batch_resumed')
+            self._wake()
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    def feed_ready(self):
+        """Tells a running batch whose lazy input yielded None (see run()) that it has URLs again."""
+        self._wake()
+
+    def _wake(self):
+        """Wakes workers waiting for jobs, so they see cancel/resume at once."""
+        state = self._state
+        if state is not None:
+            with state:
+                state.notify_all()
+
+    def _token_for(self, job: DownloadJob) -> CancelToken:
+        with self._tokens_lock:
+            return self._tokens.setdefault(job.key(), CancelToken())
+
+    def _pop_token(self, job: DownloadJob) -> Optional[CancelToken]:
+        with self._tokens_lock:
+            return self._tokens.pop(job.key(), None)
+
+    def retry_job(self, key: str) -> bool:
+        """
+        Puts a job that failed (or was cancelled) in this batch back in the queue.
+
+        Returns:
+            False if there is no such failed job, or the batch is already
+            winding down (start a new batch with its URL instead).
+        """
+        requeue = self._requeue
+        return requeue(key) if requeue is not None else False
+
+    def _job_cancelled(self, job: Optional[DownloadJob]) -> bool:
+        return job is not None and bool(self._cancelled_keys) and job.key() in self._cancelled_keys
+
+    def _stop_requested(self, job: Optional[DownloadJob]) -> bool:
+        return self.cancelled or self._job_cancelled(job)
+
+    def _raise_stopped(self, job: Optional[DownloadJob]):
+        """Stops the current job after a check or a wait was given up (cancel, cancel_job or pause)."""
+        if self._job_cancelled(job):
+            raise JobCancelled()
+        if self.cancelled:
+            raise yt_dlp.utils.DownloadCancelled('Download cancelled by user.')
+        raise JobPaused()
+
+    def _check_request(self):
+        """PipelinedYoutubeDL.before_request: HTTP requests (extraction included) are cancellation points."""
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        if self._stop_requested(job):
+            self._raise_stopped(job)
+
+    def _failure(self, job: DownloadJob, error: str, category: str) -> Dict[str, Any]:
+        """A failed attempt of job, as reported in BatchResult.failed_items."""
+        return {'item': job.url, 'error': error, 'category': category}
+
+    def _circuit_changed(self, change: str, site: str, cooldown: float):
+        """CircuitBreaker.on_change: reports a site being held back (or released)."""
+        if change == 'open':
+            self.update_status(f"Rate limited by {site}: holding its downloads back for {cooldown:.0f}s")
+            self.emit('circuit_open', site=site, cooldown=round(cooldown, 1))
+        else:
+            self.update_status(f"{site} is answering again: resuming its downloads (paced)")
+            self.emit('circuit_closed', site=site)
+        self._wake()
+
+    def _after_stop(self, job: DownloadJob, failure: Optional[Dict[str, Any]], interrupted: bool) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Reclassifies an error caused by stopping job, e.g. its FFmpeg being
+        terminated: a cancelled job fails with ITEM_CANCELLED_ERROR, a job of
+        a cancelled batch is interrupted (resumable).
+
+        Returns:
+            (failure, interrupted)
+        """
+        if self._job_cancelled(job):
+            return self._failure(job, ITEM_CANCELLED_ERROR, ERROR_CANCELLED), False
+        if self.cancelled:
+            return None, True
+        return failure, interrupted
+
+    def emit(self, event: str, **payload: Any):
+        """Forwards a lifecycle event to the on_event callback, if any."""
+        if self.on_event is not None:
+            self.on_event(event, payload)
+
+    def update_status(self, message: str):
+        """Publishes a status line to the bus and as a 'status' event."""
+        self.progress_bus.set_status(message)
+        self.emit('status', message=message)
+
+    def progress_hook(self, d: Dict[str, Any]):
+        """
+        Hook for yt-dlp to update progress, checking for cancellation.
+
+        Runs on the worker thread many times per second, so it only copies the
+        raw fields into the ProgressBus; formatting is left to the consumer.
+        """
+        hook_start = time.perf_counter()
+        if self.cancelled:
+             # Must raise an exception yt-dlp understands to truly stop it
+             raise yt_dlp.utils.DownloadCancelled('Download cancelled by user.')
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        if self._job_cancelled(job):
+            raise JobCancelled()
+
+        status = d.get('status')
+        if self._paused and status == 'downloading' and job is not None:
+            raise JobPaused() # .part file kept; continued when the job runs again
+        if status == 'downloading':
+            self._set_job_state(JOB_DOWNLOADING)
+        elif status == 'finished':
+            self._set_job_state(JOB_POSTPROCESSING) # Merge/convert follows (or the next format part)
+
+        info_dict = d.get('info_dict') or {} # Extract info_dict if available
+        filename = d.get('filename', '')
+        if job is not None and job.metrics is not None:
+            if job.metrics.phase == PHASE_FIRST_BYTE and status == 'downloading':
+                job.metrics.switch(PHASE_TRANSFER)
+            job.metrics.observe(filename, d.get('downloaded_bytes'), d.get('speed'))
+            if job.metrics.title is None:
+                job.metrics.title, job.metrics.video_id = info_dict.get('title'), info_dict.get('id')
+        self.progress_bus.publish(info_dict.get('id') or filename, {
+            'key': job.key() if job is not None else None,
+            'status': status,
+            'filename': filename,
+            'filepath': info_dict.get('filepath'),
+            'title': info_dict.get('title'),
+            'playlist_title': info_dict.get('playlist_title', info_dict.get('playlist')),
+            'playlist_index': info_dict.get('playlist_index'),
+            'n_entries': info_dict.get('n_entries'),
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+        })
+        self.progress_bus.record_hook_time(time.perf_counter() - hook_start)
+        if status == 'downloading':
+            self._throttle(filename, d.get('downloaded_bytes')) # After publishing, so the UI isn't held back
+
+    def _throttle(self, filename: str, downloaded_bytes: Optional[int]):
+        """Charges the bytes received since the last hook call to the shared bandwidth bucket."""
+        if downloaded_bytes is None:
+            return
+        last = getattr(self._local, 'transfer', None)
+        self._local.transfer = (filename, downloaded_bytes)
+        if last is None or last[0] != filename or downloaded_bytes < last[1]:
+            return # First report for this file; its count may include a resumed .part
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        self.bandwidth.consume(downloaded_bytes - last[1], lambda: self._stop_requested(job) or self._paused)
+
+    def postprocessor_hook(self, d: Dict[str, Any]):
+        """Hook for yt-dlp post-processors (merge, FFmpeg conversion)."""
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        if d.get('status') == 'started':
+            if self._job_cancelled(job):
+                raise JobCancelled()
+            self._set_job_state(JOB_POSTPROCESSING)
+        if job is not None and job.metrics is not None:
+            job.metrics.switch(phase_for_postprocessor(d.get('postprocessor') or '') if d.get('status') == 'started' else PHASE_OTHER)
+
+    def _observe_dl(self, filename: str, started: bool):
+        """PipelinedYoutubeDL.on_dl callback: a file's request goes out / its transfer ended."""
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        if job is not None and job.metrics is not None:
+            job.metrics.switch(PHASE_FIRST_BYTE if started else PHASE_OTHER)
+
+    def _admit(self, info: Dict[str, Any]):
+        """PipelinedYoutubeDL.on_admit: reserves the item's estimated bytes on the volumes it writes to."""
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        if job is not None and (self._stop_requested(job) or self._paused):
+            self._raise_stopped(job) # Nothing written yet: the cheapest place to stop or park a job
+        if job is None or not self.options.disk_admission:
+            return
+        size = estimate_size(info)
+        # Merges and audio extraction write a second file before the downloaded ones are deleted
+        creates_file = len(info.get('requested_formats') or ()) > 1 or self.options.download_type == AUDIO_TYPE
+        needs, download_volume = self.disk.plan(size or 0, self.options.scratch_path or self.options.download_path,
+                                                self.options.download_path, creates_file)
+        metrics = job.metrics
+        if not self.disk.reserve(job.key(), needs, download_volume, lambda: metrics.bytes if metrics is not None else 0,
+                                 lambda: self._stop_requested(job) or self._paused,
+                                 on_wait=lambda message: self.update_status(f"{job.label()}: {message}")):
+            self._raise_stopped(job)
+
+    @contextmanager
+    def _io_slot(self, kind: str, path: str) -> Iterator[None]:
+        """PipelinedYoutubeDL.io_slot: holds a DiskGuard write/merge slot for path's volume."""
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        pausable = kind == IO_WRITE # Post-processing runs to the end when paused
+        token = self.disk.acquire_slot(kind, path, lambda: self._stop_requested(job) or (pausable and self._paused))
+        if token is None:
+            self._raise_stopped(job)
+        try:
+            yield
+        finally:
+            self.disk.release_slot(token)
+
+    def _set_job_state(self, state: str):
+        """Journals a state change of the current thread's job (only when it changes)."""
+        job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+        if job is not None and job.state != state:
+            if self.journal is not None:
+                self.journal.set_state(job, state)
+            else:
+                job.state = state
+
+    def run(self, urls: Iterable[str]) -> BatchResult:
+        """
+        Downloads every URL and blocks until the batch is done or cancelled.
+
+        Args:
+            urls: URL strings. May be a lazy iterable (e.g. lines streamed
+                from stdin); the total is then the number consumed so far.
+                A lazy iterable may yield None when it has no URL yet; the
+                batch then asks again after a short wait, or at once after
+                feed_ready().
+
+        Returns:
+            A BatchResult with counters and URL-level failures.
+        """
+        known_total = len(urls) if hasattr(urls, '__len__') else None # type: ignore[arg-type]
+        return self._run_with_state(urls, known_total, resume_batch_id=None)
+
+    def run_jobs(self, jobs: List[DownloadJob]) -> BatchResult:
+        """
+        Downloads jobs built by the caller (e.g. playlist entries found by a
+        PlaylistSyncer) and blocks until the batch is done or cancelled.
+
+        Args:
+            jobs: Jobs with distinct keys; entries carry their playlist
+                fields in extra_info, as if fanned out by the engine.
+
+        Returns:
+            A BatchResult with counters and item-level failures.
+        """
+        return self._run_with_state(None, len(jobs), resume_batch_id=None, jobs=jobs)
+
+    def resume(self, batch_id: int) -> BatchResult:
+        """
+        Continues an interrupted batch from the JobJournal.
+
+        Jobs that were not done or failed are re-queued in their original
+        order; partially downloaded .part files are continued by yt-dlp.
+        The engine should be created with the batch's stored options
+        (see JobJournal.unfinished_batch and DownloadOptions.from_dict).
+        """
+        return self._run_with_state(None, None, resume_batch_id=batch_id)
+
+    def _run_with_state(self, urls: Optional[Iterable[str]], known_total: Optional[int], resume_batch_id: Optional[int],
+                        jobs: Optional[List[DownloadJob]] = None) -> BatchResult:
+        """Opens the index, metadata cache and journal around one batch."""
+        self.cancelled = False
+        self._cancelled_keys.clear() # Keys are per batch
+        self._streams = []
+        self._cancel_requested_at = None
+        self._paused = False
+        self.stop_latency.reset()
+        self.bandwidth.reset()
+        self.disk.reset()
+        self.breaker.reset()
+        result = BatchResult(total=known_total or 0)
+        self.index = DownloadIndex(self.options.index_path) if self.options.use_index else None
+        if self.options.use_metadata_cache:
+            self.metadata_cache = MetadataCache(ttl=self.options.metadata_ttl, max_entries=self.options.metadata_max_entries)
+        if self.options.use_journal or resume_batch_id is not None:
+            self.journal = JobJournal(self.options.journal_path)
+        self.metrics = MetricsRecorder(self.options.metrics_jsonl_path, self.options.metrics_prometheus_path)
+        try:
+            if resume_batch_id is not None:
+                self.batch_id = resume_batch_id
+                feed: Iterable[DownloadJob] = self.journal.load_jobs(resume_batch_id)
+                known_total = result.total = len(feed)
+                self.update_status(f"Resuming batch {resume_batch_id}: {known_total} unfinished item(s)")
+            else:
+                self.batch_id = self.journal.create_batch(asdict(self.options)) if self.journal is not None else None
+                if jobs is not None:
+                    feed = self._prepared_jobs(jobs, result)
+                else:
+                    feed = self._input_jobs(urls, known_total is not None, result)
+            result.batch_id = self.batch_id
+            return self._run_batch(feed, known_total, result)
+        finally:
+            if self.index is not None:
+                self.index.close()
+                self.index = None
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            self.metadata_cache = None
+            self.metrics.close()
+
+    def _input_jobs(self, urls: Iterable[str], in_bulk: bool, result: BatchResult) -> Iterable[DownloadJob]:
+        """Turns input URLs into journaled jobs, after dropping already-indexed ones."""
+        filtered = self._filter_indexed(_numbered(urls), in_bulk, result)
+        if in_bulk:
+            jobs = [DownloadJob(position=position, url=url) for position, url in filtered]
+            if self.journal is not None:
+                self.journal.add_jobs(self.batch_id, jobs)
+            return jobs
+
+        def lazy_jobs():
+            # Consumed under the engine's state lock (see next_job)
+            for entry in filtered:
+                if entry is None:
+                    yield None # The input has nothing yet (see run())
+                    continue
+                position, url = entry
+                job = DownloadJob(position=position, url=url)
+                if self.journal is not None:
+                    self.journal.add_jobs(self.batch_id, [job])
+                yield job
+        return lazy_jobs()
+
+    def _prepared_jobs(self, jobs: List[DownloadJob], result: BatchResult) -> List[DownloadJob]:
+        """Journals run_jobs() input, after dropping already-indexed jobs."""
+        remaining = self._filter_indexed_jobs(jobs, result)
+        result.total -= len(jobs) - len(remaining) # Skipped jobs are already in the known total
+        if self.journal is not None:
+            self.journal.add_jobs(self.batch_id, remaining)
+        return remaining
+
+    def _run_batch(self, feed: Iterable[DownloadJob], known_total: Optional[int], result: BatchResult) -> BatchResult:
+        """Runs the worker pool over feed; index/cache/journal are open (or None)."""
+        self.emit('batch_started', total=known_total, batch_id=self.batch_id)
+        # Not clamped by the input size: one playlist URL may fan out into many jobs
+        worker_count = max(1, min(self.options.worker_count, MAX_WORKER_COUNT))
+
+        # --- Create the yt-dlp instances ---
+        # YoutubeDL keeps per-download state (current info_dict, postprocessor
+        # chain, cookie jar), so instances must not be shared between threads.
+        # A worker takes an idle instance per job. One whose file was handed
+        # to the post-processing stage stays with the stage until that ran, so
+        # there is one instance per worker plus one per task the stage holds.
+        variant = variant_for(self.options.download_type, self.options.container_format)
+        instance_count = worker_count
+        if self.options.postprocess_workers > 0:
+            instance_count += stage_capacity(self.options.postprocess_workers, self.options.postprocess_queue_size)
+        try:
+            self._ydl_opts = build_ydl_opts(self.options, self.progress_hook, self.postprocessor_hook) # Raises ValueError on bad audio options
+            ydl_instances = [self._new_ydl() for _ in range(instance_count)]
+            if self.options.download_type == AUDIO_TYPE:
+                audio_stats = AudioStats()
+                audio_policy = self.options.audio_policy()
+                for ydl in ydl_instances:
+                    ydl.add_post_processor(AudioPolicyPP(audio_policy, audio_stats.record), when='post_process')
+            if self.index is not None:
+                for ydl in ydl_instances:
+                    ydl.add_post_processor(IndexRecorderPP(self.index, variant, ydl), when='after_move')
+        except Exception as e:
+             self.update_status(f"Error initializing yt-dlp: {e}")
+             print(f"yt-dlp Initialization Error:\n{traceback.format_exc()}", file=sys.stderr)
+             result.init_error = str(e)
+             self.emit('batch_finished', **self._summary(result))
+             return result
+
+        # --- Shared Job Queue and Counters ---
+        # Input URLs are read lazily from the feed; jobs fanned out from
+        # playlists (and retries) wait in `pending` and are served first.
+        # A job is only handed out while its host has a free slot (HostLimiter)
+        # and its site's circuit lets it start (CircuitBreaker), and a retry
+        # only once its backoff delay is over; otherwise the feed is read
+        # ahead to find work for another host.
+        job_iter = iter(feed)
+        pending: Deque[DownloadJob] = deque()
+        state = threading.Condition() # Guards job_iter, pending, the counters and result
+        # active: jobs not finished yet, in either stage; downloading: jobs on a download worker
+        # closed: a worker found nothing left to do, so retry_job can no longer requeue
+        counters = {'active': 0, 'downloading': 0, 'feed_done': False, 'closed': False}
+        failed_jobs: Dict[str, DownloadJob] = {} # key -> job that failed for good (retry_job)
+        retries: Dict[str, int] = {} # Error category -> retries scheduled
+        post_stage: Optional[PostProcessStage] = None
+        idle_ydls: Deque[PipelinedYoutubeDL] = deque(ydl_instances) # Guarded by state
+
+        def take(job: DownloadJob, now: float) -> bool:
+            """Claims a host slot and a circuit start for job, if both are free (caller holds state)."""
+            site = host_key(job.url)
+            if not self.hosts.try_acquire(site):
+                return False
+            if not self.breaker.try_start(site, now):
+                self.hosts.release(site)
+                return False
+            return True
+
+        def next_job() -> Optional[DownloadJob]:
+            with state:
+                while not self.cancelled:
+                    if self._paused and (pending or counters['active'] or not counters['feed_done']):
+                        state.wait(timeout=0.5) # unpause() notifies
+                        continue
+                    now = time.monotonic()
+                    for position, job in enumerate(pending):
+                        if job.not_before <= now and take(job, now):
+                            del pending[position]
+                            return job
+                    if not counters['feed_done'] and len(pending) < HOST_LOOKAHEAD:
+                        try:
+                            job = next(job_iter)
+                        except StopIteration:
+                            counters['feed_done'] = True
+                            continue
+                        if job is None:
+                            state.wait(timeout=0.5) # The input has nothing yet; feed_ready() notifies
+                            continue
+                        if known_total is None:
+                            result.total += 1
+                        if take(job, now):
+                            return job
+                        pending.append(job) # Host busy or held back: keep looking ahead
+                        continue
+                    if counters['active'] == 0 and not pending:
+                        counters['closed'] = True
+                        return None # Nothing queued and nobody left who could add jobs
+                    state.wait(timeout=0.5)
+                return None
+
+        def publish_overall():
+            # Caller must hold state
+            stages = {'download_queued': len(pending), 'downloading': counters['downloading']}
+            if post_stage is not None:
+                depths = post_stage.depths()
+                stages['postprocess_queued'] = depths['queued']
+                stages['postprocessing'] = depths['running']
+            self.progress_bus.set_overall(result.completed, result.total, counters['active'], stages)
+
+        def finish_job(job: DownloadJob, failure: Optional[Dict[str, Any]], children: Optional[List[DownloadJob]], interrupted: bool):
+            """Journals, counts and reports a job leaving the pipeline (from either stage)."""
+            self.disk.release(job.key()) # Written, failed or interrupted: a retry reserves again
+            token = self._pop_token(job)
+            if token is not None and token.cancelled and self._job_cancelled(job):
+                self.stop_latency.record(token.latency(), job.label())
+            category = failure['category'] if failure is not None else ERROR_CANCELLED if interrupted else None
+            self.breaker.finished(host_key(job.url), category)
+            delay = None
+            if failure is not None and not interrupted and not self._job_cancelled(job):
+                delay = self.retry_policy.delay(category, job.attempts)
+            retry = delay is not None
+            if job.metrics is not None:
+                if retry:
+                    job.metrics.switch(None) # Clock paused until the next attempt
+                else:
+                    outcome = ('expanded' if children is not None else 'failed' if failure is not None
+                               else 'interrupted' if interrupted else 'done')
+                    self.metrics.finish(job.metrics, outcome, failure['error'] if failure is not None else None)
+                    self.emit('item_metrics', **job.metrics.to_dict())
+            if children is not None:
+                remaining = self._filter_indexed_jobs(children, result)
+                kept = {id(child) for child in remaining}
+                for child in children:
+                    if id(child) not in kept:
+                        self._record_entry(child, RECORD_SKIPPED)
+                children = remaining
+                if self.journal is not None:
+                    self.journal.add_jobs(self.batch_id, children)
+            # Items interrupted by a cancel keep their state and are resumed next time
+            if retry:
+                self._journal_state(job, JOB_PENDING, failure['error'])
+            elif children is not None:
+                self._journal_state(job, JOB_EXPANDED)
+            elif failure is not None:
+                self._journal_state(job, JOB_FAILED, failure['error'])
+                self._record_entry(job, RECORD_CANCELLED if category == ERROR_CANCELLED else RECORD_FAILED)
+            elif not interrupted:
+                self._journal_state(job, JOB_DONE)
+                self._record_entry(job, RECORD_DONE)
+
+            with state:
+                counters['active'] -= 1
+                if retry:
+                    job.not_before = time.monotonic() + delay
+                    retries[category] = retries.get(category, 0) + 1
+                    pending.append(job) # Back of the queue, so a flaky item doesn't stall the rest
+                elif children is not None:
+                    # The playlist job is replaced by its entries (in order, ahead of other input)
+                    result.total += len(children) - 1
+                    pending.extendleft(reversed(children))
+                elif not interrupted:
+                    # Items interrupted by a cancel are not counted as processed
+                    result.completed += 1
+                    if failure is not None:
+                        failure.update(attempts=job.attempts, key=job.key())
+                        result.failed_items.append(failure)
+                        failed_jobs[job.key()] = job
+                publish_overall()
+                state.notify_all()
+
+            if retry:
+                self.update_status(f"Retrying {job.label()} in {delay:.0f}s ({category.replace('_', '-')} error)")
+                self.emit('item_retry', attempt=job.attempts, error=failure['error'], category=category, delay=round(delay, 1), **job.describe())
+            elif children is not None:
+                if job.stream is not None:
+                    # Streamed: entries of this window, then a continuation job unless it was the last one
+                    more = bool(children) and self._window_start(children[-1]) is not None
+                    read = self._window_start(children[-1]) - 1 if more else job.stream.next_index - 1
+                    self.emit('playlist_expanded', entries=len(children) - more, more=more, read=read, **job.describe())
+                else:
+                    self.emit('playlist_expanded', entries=len(children), **job.describe())
+            elif failure is not None:
+                self.emit('item_failed', error=failure['error'], category=category, cancelled=self._job_cancelled(job), **job.describe())
+            elif not interrupted:
+                self.emit('item_finished', **job.describe())
+
+        def requeue(key: str) -> bool:
+            """retry_job: moves a failed job back to the queue with fresh attempts."""
+            with state:
+                job = failed_jobs.get(key)
+                if job is None or counters['closed'] or self.cancelled:
+                    return False
+                del failed_jobs[key]
+                self._cancelled_keys.discard(key)
+                self._pop_token(job)
+                for n, failure in enumerate(result.failed_items):
+                    if failure.get('key') == key: # Not the URL: two jobs may share one
+                        del result.failed_items[n]
+                        break
+                result.completed -= 1
+                job.attempts = 0
+                job.not_before = 0.0
+                job.metrics = None # Timed from scratch
+                self._journal_state(job, JOB_PENDING)
+                pending.append(job)
+                publish_overall()
+                state.notify_all()
+            self.emit('item_requeued', **job.describe())
+            return True
+
+        def drop_queued(key: str) -> bool:
+            """cancel_job: finishes a job still waiting in `pending` as cancelled, without a worker."""
+            with state:
+                for position, job in enumerate(pending):
+                    if job.key() == key:
+                        del pending[position]
+                        counters['active'] += 1 # finish_job counts it out again
+                        break
+                else:
+                    return False
+            self._pop_token(job) # Never started: no stop latency to measure
+            finish_job(job, self._failure(job, ITEM_CANCELLED_ERROR, ERROR_CANCELLED), None, False)
+            return True
+
+        def park(job: DownloadJob):
+            """Puts a job stopped by pause() back at the front of the queue; its .part files are continued later."""
+            self.disk.release(job.key())
+            self._pop_token(job)
+            self.breaker.finished(host_key(job.url), ERROR_CANCELLED) # Says nothing about the site
+            job.attempts -= 1 # A pause isn't a failed attempt
+            if job.metrics is not None:
+                job.metrics.switch(None) # Clock paused until it runs again
+            self._journal_state(job, JOB_PENDING)
+            with state:
+                counters['active'] -= 1
+                pending.appendleft(job)
+                publish_overall()
+                state.notify_all()
+            self.emit('item_paused', **job.describe())
+
+        self._requeue = requeue
+        self._drop_queued = drop_queued
+        self._state = state
+
+        # --- Post-processing Stage ---
+        def hand_off(ydl: PipelinedYoutubeDL, filename: str, info: Dict[str, Any], files_to_move: Optional[Dict[str, str]]) -> bool:
+            """PipelinedYoutubeDL callback: queues the current job's post-processing."""
+            job: Optional[DownloadJob] = getattr(self._local, 'job', None)
+            if post_stage is None or job is None or getattr(self._local, 'handed_off', None) is job:
+                return False # Not a pipelined job (or a second file of it): post-process inline
+            self._set_job_state(JOB_POSTPROCESSING)
+            if job.metrics is not None:
+                job.metrics.switch(PHASE_POSTPROCESS_WAIT) # Includes time blocked on a full queue
+            # Blocks while the stage is full (backpressure on the download workers)
+            if not post_stage.submit(PostProcessTask(job, ydl, filename, info, dict(files_to_move or {})), lambda: self._stop_requested(job)):
+                self._raise_stopped(job)
+            self._local.handed_off = job
+            with state:
+                publish_overall()
+            return True
+
+        def post_process(task: PostProcessTask):
+            """Runs on a PostProcessStage thread; finishes the job like a download worker would."""
+            job = task.job
+            self._local.job = job # For postprocessor_hook
+            set_current_token(self._token_for(job)) # FFmpeg children terminable by cancel_job/cancel
+            if job.metrics is not None:
+                job.metrics.switch(PHASE_OTHER)
+            self.update_status(f"Post-processing {job.label()}")
+            failure: Optional[Dict[str, Any]] = None
+            interrupted = False
+            try:
+                if self._job_cancelled(job):
+                    raise JobCancelled()
+                task.run()
+            except JobCancelled:
+                failure = self._failure(job, ITEM_CANCELLED_ERROR, ERROR_CANCELLED)
+            except yt_dlp.utils.DownloadCancelled:
+                interrupted = True
+            except Exception as e:
+                self.update_status(f"Error post-processing {job.label()} - {type(e).__name__}: {e}")
+                print(f"ERROR post-processing URL: {job.url}\n{traceback.format_exc()}", file=sys.stderr)
+                failure = self._failure(job, f"Post-processing: {e}", classify_error(e, default=ERROR_PERMANENT))
+            if failure is not None and failure['error'] != ITEM_CANCELLED_ERROR and self._stop_requested(job):
+                failure, interrupted = self._after_stop(job, failure, interrupted)
+            self._local.job = None
+            set_current_token(None)
+            with state:
+                idle_ydls.append(task.ydl) # Free for another job now
+            finish_job(job, failure, None, interrupted)
+
+        if self.options.postprocess_workers > 0:
+            post_stage = PostProcessStage(post_process, self.options.postprocess_workers, self.options.postprocess_queue_size)
+            for ydl in ydl_instances:
+                ydl.hand_off = hand_off
+
+        def worker():
+            while not self.cancelled:
+                job = next_job()
+                if job is None:
+                    return
+                if self._job_cancelled(job):
+                    # Cancelled while queued: report it without starting it
+                    with state:
+                        counters['active'] += 1
+                        self.hosts.release(host_key(job.url))
+                    self._pop_token(job) # Never started: no stop latency to measure
+                    finish_job(job, self._failure(job, ITEM_CANCELLED_ERROR, ERROR_CANCELLED), None, False)
+                    continue
+                job.attempts += 1
+                if job.metrics is None:
+                    job.metrics = ItemMetrics(job.url, job.position, playlist_index=(job.extra_info or {}).get('playlist_index'))
+                job.metrics.start_attempt()
+                self._local.job = job
+                self._local.handed_off = None
+                set_current_token(self._token_for(job))
+                self._set_job_state(JOB_EXTRACTING)
+
+                with state:
+                    counters['active'] += 1
+                    counters['downloading'] += 1
+                    ydl = idle_ydls.popleft() # Never empty: see "Create the yt-dlp instances"
+                    publish_overall()
+                self.emit('item_started', **job.describe())
+                self.update_status(f"Processing {job.label()} ({result.completed + 1}/{result.total})")
+
+                failure: Optional[Dict[str, Any]] = None
+                children: Optional[List[DownloadJob]] = None
+                paused = False
+                try:
+                    # Download a single item, or fan a playlist out into jobs
+                    children = self._process_job(ydl, job)
+
+                except JobCancelled:
+                     self.update_status(f"Cancelled {job.label()}")
+                     failure = self._failure(job, ITEM_CANCELLED_ERROR, ERROR_CANCELLED)
+
+                except JobPaused:
+                     paused = True
+
+                except yt_dlp.utils.DownloadCancelled:
+                     self.cancelled = True # Stop the other workers as well
+                     self.update_status("Download cancelled during operation.")
+
+                except (yt_dlp.utils.ExtractorError, yt_dlp.utils.DownloadError) as e:
+                     self.update_status(f"Error processing {job.label()} - {type(e).__name__}: {e}")
+                     print(f"ERROR processing URL: {job.url}\n{traceback.format_exc()}", file=sys.stderr)
+                     failure = self._failure(job, str(e), classify_error(e))
+
+                except Exception as e:
+                    self.update_status(f"Unexpected Error: {job.label()} - {type(e).__name__}: {e}")
+                    print(f"UNEXPECTED ERROR processing URL: {job.url}\n{traceback.format_exc()}", file=sys.stderr)
+                    failure = self._failure(job, f"Unexpected: {e}", classify_error(e, default=ERROR_PERMANENT))
+
+                if failure is not None and failure['error'] != ITEM_CANCELLED_ERROR and self._stop_requested(job):
+                    failure, _ = self._after_stop(job, failure, False) # E.g. inline FFmpeg terminated
+                self._local.job = None
+                set_current_token(None)
+                with state:
+                    counters['downloading'] -= 1
+                    self.hosts.release(host_key(job.url)) # The transfer is over, whatever comes next
+                    if self._local.handed_off is not job:
+                        idle_ydls.append(ydl) # Otherwise the stage gives it back (post_process)
+                if self._local.handed_off is job:
+                    continue # The post-processing stage finishes it
+                if paused:
+                    park(job)
+                    continue
+                finish_job(job, failure, children, self.cancelled)
+
+        # --- Run the Worker Pool ---
+        workers = [
+            threading.Thread(target=worker, name=f"yt-dlp-worker-{n+1}", daemon=True)
+            for n in range(worker_count)
+        ]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        self._requeue = None
+        self._drop_queued = None
+        self._state = None
+        if post_stage is not None:
+            # Idle unless cancelled; queued tasks stay journaled as post-processing for resume
+            post_stage.close()
+            result.postprocess = post_stage.stats()
+            with state:
+                publish_overall() # Final depths, now that the stage threads are gone
+        for ydl in ydl_instances:
+            ydl.close()
+        for stream in self._streams:
+            stream.close() # Streams the batch didn't finish reading (cancelled, or failed for good)
+
+        result.cancelled = self.cancelled
+        if self._cancel_requested_at is not None:
+            self.stop_latency.record(time.monotonic() - self._cancel_requested_at, "the batch")
+        with self._tokens_lock:
+            self._tokens.clear()
+        result.stop_latency = self.stop_latency.stats()
+        result.metrics = self.metrics.summary()
+        result.disk = self.disk.stats()
+        result.retry = {'retries': retries, 'failures': count_by_category(result.failed_items), 'breaker': self.breaker.stats()}
+        if self._streams:
+            result.playlists = [stream.summary() for stream in self._streams]
+            result.items = [record for stream in self._streams for record in sorted(stream.records.values(), key=lambda r: r.index)]
+        result.peak_rss = peak_rss()
+        if result.failed_items:
+            result.failure_report = self._write_failure_report(result)
+        if self.options.download_type == AUDIO_TYPE:
+            result.audio = audio_stats.summary()
+        if self.journal is not None and not result.cancelled:
+            self.journal.finish_batch(self.batch_id)
+        if result.cancelled:
+            self.update_status("Download cancelled by user.")
+        elif self.metadata_cache is not None:
+            result.metadata_cache = self.metadata_cache.stats()
+            self.update_status(
+                f"Metadata cache: {result.metadata_cache['hits']} hit(s), {result.metadata_cache['misses']} miss(es), "
+                f"{result.metadata_cache['stale']} stale"
+            )
+        self.emit('batch_finished', **self._summary(result))
+        return result
+
+    def _new_ydl(self) -> PipelinedYoutubeDL:
+        """A YoutubeDL with the batch's options, hooks and extractors (post-processors are added by _run_batch)."""
+        ydl = PipelinedYoutubeDL(dict(self._ydl_opts))
+        ydl.on_dl = self._observe_dl
+        ydl.on_admit = self._admit
+        ydl.io_slot = self._io_slot
+        ydl.before_request = self._check_request
+        for ie_class in self.extractors:
+            ydl.add_info_extractor(ie_class())
+        return ydl
+
+    def _write_failure_report(self, result: BatchResult) -> Optional[str]:
+        """Saves result.failed_items for a later re-queue; returns the path (None if it couldn't be written)."""
+        path = self.options.failure_report_path or default_report_path()
+        try:
+            return write_failure_report(path, result.failed_items, result.batch_id, self.options.download_path)
+        except OSError as e:
+            print(f"Warning: could not write the failure report {path}: {e}", file=sys.stderr)
+            return None
+
+    def _journal_state(self, job: DownloadJob, state: str, error: Optional[str] = None):
+        """Records a final (or retry) state for job."""
+        if self.journal is not None:
+            self.journal.set_state(job, state, error)
+        else:
+            job.state = state
+
+    def _process_job(self, ydl: yt_dlp.YoutubeDL, job: DownloadJob) -> Optional[List[DownloadJob]]:
+        """
+        Downloads one job, reusing cached metadata when possible.
+
+        Extraction runs with process=False, so single videos can be cached
+        before format selection and playlists come back unresolved. A
+        playlist is not downloaded here; its entries are returned as new jobs
+        (None means the job was a single item).
+        """
+        if self._window_start(job) is not None:
+            return self._next_window(ydl, job)
+        if job.entry is not None:
+            # Entry already resolved by the playlist extractor
+            ydl.process_ie_result(dict(job.entry), download=True, extra_info=job.extra_info)
+            return None
+
+        cache = self.metadata_cache
+        key = cache_key_for(job.url) if cache is not None else None
+        if key is not None:
+            info = cache.get(key)
+            if info is not None:
+                try:
+                    ydl.process_ie_result(info, download=True, extra_info=job.extra_info)
+                    return None
+                except (yt_dlp.utils.DownloadCancelled, InsufficientDiskSpace):
+                    raise
+                except Exception as e:
+                    # Cached format URLs no longer work (same fallback as --load-info-json)
+                    print(f"Cached metadata failed for {job.url} ({type(e).__name__}: {e}); re-extracting", file=sys.stderr)
+                    cache.invalidate(key)
+
+        ie_key = job.ie_key or next((ie.ie_key() for ie in self.extractors if ie.suitable(job.url)), None)
+        ie_result = ydl.extract_info(job.url, download=False, process=False, ie_key=ie_key)
+        if ie_result is None:
+            return None
+        result_type = ie_result.get('_type', 'video')
+        if result_type == 'playlist':
+            return self._expand_playlist(ydl, job, ie_result)
+        if result_type == 'video' and key is not None:
+            cache.put(key, ydl.sanitize_info(ie_result)) # Cached without the playlist extra_info
+        ydl.process_ie_result(ie_result, download=True, extra_info=job.extra_info)
+        return None
+
+    def _expand_playlist(self, ydl: yt_dlp.YoutubeDL, job: DownloadJob, playlist: Dict[str, Any]) -> List[DownloadJob]:
+        """
+        Turns an unresolved playlist/channel into one job per entry.
+
+        Each job carries the playlist fields yt-dlp would have added itself,
+        so the '%(playlist)s/%(playlist_index)02d - ...' layout is unchanged.
+        Streamed playlists only return their first window, followed by a
+        continuation job for the rest.
+        """
+        if self.options.playlist_window > 0:
+            if streamable(playlist_entries(playlist)):
+                return self._start_stream(job, playlist, 1)
+            print(f"Warning: this yt-dlp version can't stream {job.url}; expanding it up front", file=sys.stderr)
+        return self._materialize(ydl, job, playlist, 1)
+
+    def _materialize(self, ydl: yt_dlp.YoutubeDL, job: DownloadJob, playlist: Dict[str, Any], start: int) -> List[DownloadJob]:
+        """One job per entry of playlist from index start on, read with yt-dlp's own PlaylistEntries."""
+        context = playlist_context(playlist)
+        entries = [(index, entry) for index, entry in PlaylistEntries(ydl, playlist).get_requested_items() if entry and index >= start]
+        self.update_status(f"Expanded playlist '{context['playlist']}' into {len(entries)} item(s)")
+        playlist_count = playlist.get('playlist_count') or len(entries)
+        return [self._entry_job(job, context, playlist_index, entry,
+                                n_entries=len(entries), playlist_count=playlist_count, playlist_autonumber=autonumber)
+                for autonumber, (playlist_index, entry) in enumerate(entries, start=1)]
+
+    def _entry_job(self, job: DownloadJob, context: Dict[str, Any], playlist_index: int, entry: Dict[str, Any],
+                   stream: Optional[PlaylistStream] = None, **fields: Any) -> DownloadJob:
+        """Job for one entry of job's playlist, with the playlist fields (plus fields) as extra_info."""
+        extra_info = dict(context, playlist_index=playlist_index, **fields)
+        if entry.get('_type') == 'url':
+            return DownloadJob(job.position, entry['url'], ie_key=entry.get('ie_key'), video_id=entry.get('id'), extra_info=extra_info,
+                               title=entry.get('title'), stream=stream)
+        return DownloadJob(job.position, entry.get('webpage_url') or entry.get('url') or job.url,
+                           ie_key=entry.get('ie_key'), video_id=entry.get('id'), extra_info=extra_info, entry=entry,
+                           title=entry.get('title'), stream=stream)
+
+    def _start_stream(self, job: DownloadJob, playlist: Dict[str, Any], start: int) -> List[DownloadJob]:
+        """Streams playlist (streamable entries) from index start on; returns its first window."""
+        entries = playlist_entries(playlist)
+        ie_key = playlist.get('extractor_key') or job.ie_key # Input URLs were matched without one
+        ydl: Optional[PipelinedYoutubeDL] = None
+        if not isinstance(entries, (list, tuple)):
+            # Lazy entries fetch pages through the YoutubeDL that extracted them, and the
+            # continuation jobs run on any worker: extract again with one of the stream's own
+            ydl = self._new_ydl()
+            try:
+                playlist = self._extract_playlist(ydl, job.url, ie_key)
+            except Exception:
+                ydl.close()
+                raise
+            entries = playlist_entries(playlist)
+        stream = PlaylistStream(job.url, playlist_context(playlist), entries, start=start,
+                                playlist_count=playlist.get('playlist_count'), ie_key=ie_key, ydl=ydl)
+        try:
+            children = self._read_window(job, stream)
+        except Exception:
+            stream.close()
+            raise
+        job.stream = stream
+        self._streams.append(stream) # Only once its first window could be read (a retry starts over)
+        return children
+
+    @staticmethod
+    def _extract_playlist(ydl: yt_dlp.YoutubeDL, url: str, ie_key: Optional[str]) -> Dict[str, Any]:
+        """
+        Raises:
+            DownloadError: url doesn't return a playlist (any more).
+        """
+        playlist = ydl.extract_info(url, download=False, process=False, ie_key=ie_key)
+        if playlist is None or playlist.get('_type') != 'playlist':
+            raise yt_dlp.utils.DownloadError(f"{url} no longer returns a playlist")
+        return playlist
+
+    @staticmethod
+    def _window_start(job: DownloadJob) -> Optional[int]:
+        """Index the continuation job of a streamed playlist reads from next (None for other jobs)."""
+        return job.extra_info.get(WINDOW_START_KEY) if job.extra_info else None
+
+    def _read_window(self, job: DownloadJob, stream: PlaylistStream) -> List[DownloadJob]:
+        """The next window of stream as entry jobs, plus a continuation job unless the playlist is exhausted."""
+        window = stream.read_window(self.options.playlist_window)
+        playlist_count = stream.playlist_count
+        children = [self._entry_job(job, stream.context, playlist_index, entry, stream=stream,
+                                    **({'n_entries': playlist_count, 'playlist_count': playlist_count} if playlist_count else {}))
+                    for playlist_index, entry in window]
+        if stream.exhausted:
+            stream.close()
+        else:
+            children.append(DownloadJob(job.position, stream.url, ie_key=stream.ie_key, extra_info={WINDOW_START_KEY: stream.next_index}, stream=stream))
+        if window:
+            self.update_status(f"Read items {window[0][0]}-{window[-1][0]} of playlist '{stream.context['playlist']}'"
+                               + ("" if stream.exhausted else " (streaming)"))
+        return children
+
+    def _next_window(self, ydl: yt_dlp.YoutubeDL, job: DownloadJob) -> List[DownloadJob]:
+        """
+        Continuation job: reads the next window of its playlist.
+
+        The playlist is extracted again when its stream is gone (resumed
+        batch) or broke on an earlier attempt, and read from where it stopped.
+        ydl (the worker's) is only used to start a stream for a resumed batch.
+        """
+        stream: Optional[PlaylistStream] = job.stream
+        if stream is None:
+            playlist = self._extract_playlist(ydl, job.url, job.ie_key)
+            if streamable(playlist_entries(playlist)):
+                return self._start_stream(job, playlist, self._window_start(job))
+            return self._materialize(ydl, job, playlist, self._window_start(job))
+        if not stream.open:
+            if stream.ydl is None:
+                stream.ydl = self._new_ydl()
+            playlist = self._extract_playlist(stream.ydl, job.url, job.ie_key)
+            stream.reopen(playlist_entries(playlist))
+        return self._read_window(job, stream)
+
+    def _record_entry(self, job: DownloadJob, state: str):
+        """Keeps the compact record of a finished entry of a streamed playlist."""
+        index = job.extra_info.get('playlist_index') if job.extra_info else None
+        if job.stream is not None and index is not None:
+            job.stream.record(job.video_id, index, job.title, state)
+
+    def _filter_indexed_jobs(self, jobs: List[DownloadJob], result: BatchResult) -> List[DownloadJob]:
+        """Drops fanned-out jobs the DownloadIndex already has (one bulk lookup)."""
+        if self.index is None:
+            return jobs
+        variant = variant_for(self.options.download_type, self.options.container_format)
+        found = self.index.lookup_many(((j.ie_key, j.video_id) for j in jobs if j.ie_key and j.video_id), variant)
+        remaining = []
+        for job in jobs:
+            key = (job.ie_key, job.video_id)
+            if not (job.ie_key and job.video_id and self._skip_if_present(job.position, job.url, key, found.get(key), result, job.key())):
+                remaining.append(job)
+        # Skipped entries still count towards the total (as completed)
+        result.total += len(jobs) - len(remaining)
+        return remaining
+
+    def _filter_indexed(self, entries: Iterable[Optional[Tuple[int, str]]], in_bulk: bool, result: BatchResult) -> Iterable[Optional[Tuple[int, str]]]:
+        """
+        Drops (position, url) entries whose file the DownloadIndex already has.
+
+        With a known-size batch all keys are looked up in one bulk query before
+        any network work and a list is returned; streamed input is checked
+        lazily, one indexed lookup per URL.
+        """
+        if self.index is None:
+            return list(entries) if in_bulk else entries
+        variant = variant_for(self.options.download_type, self.options.container_format)
+
+        if in_bulk:
+            keyed = [(position, url, match_extractor(url)) for position, url in entries]
+            found = self.index.lookup_many((key for _, _, key in keyed if key), variant)
+            remaining = []
+            for position, url, key in keyed:
+                if not (key and self._skip_if_present(position, url, key, found.get(key), result)):
+                    remaining.append((position, url))
+            return remaining
+
+        def lazy_filter():
+            for entry in entries:
+                if entry is None:
+                    yield None
+                    continue
+                position, url = entry
+                key = match_extractor(url)
+                found = self.index.lookup_many([key], variant) if key else {}
+                if key and self._skip_if_present(position, url, key, found.get(key), result):
+                    result.total += 1 # Runs under the engine's state lock (see next_job)
+                    continue
+                yield position, url
+        return lazy_filter()
+
+    def _skip_if_present(self, position: int, url: str, key: Tuple[str, str], record: Optional[Dict[str, Any]], result: BatchResult,
+                         job_key: Optional[str] = None) -> bool:
+        """Counts url as skipped if record points at an existing file in the output folder."""
+        if record is None:
+            return False
+        output_path = record['output_path']
+        download_root = os.path.abspath(self.options.download_path) + os.sep
+        if not output_path.startswith(download_root) or not os.path.exists(output_path):
+            return False # Deleted or downloaded elsewhere: fetch again
+        result.skipped += 1
+        result.completed += 1
+        self.emit('item_skipped', key=job_key or str(position), index=position, url=url, extractor=key[0], id=key[1], path=output_path)
+        return True
+
+    def _summary(self, result: BatchResult) -> Dict[str, Any]:
+        """Payload for the batch_finished event."""
+        return {
+            'total': result.total,
+            'completed': result.completed,
+            'skipped': result.skipped,
+            'failed': len(result.failed_items),
+            'cancelled': result.cancelled,
+            'init_error': result.init_error,
+            'batch_id': result.batch_id,
+            'progress_bus': self.progress_bus.stats(),
+            'metadata_cache': result.metadata_cache,
+            'bandwidth': self.bandwidth.stats(),
+            'postprocess': result.postprocess,
+            'metrics': result.metrics,
+            'audio': result.audio,
+            'disk': result.disk,
+            'stop_latency': result.stop_latency,
+            'retry': result.retry,
+            'failure_report': result.failure_report,
+            'playlists': result.playlists,
+            'peak_rss': result.peak_rss,
+        }
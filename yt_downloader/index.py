@@ -0,0 +1,157 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterable, Tuple # For type hinting
+
+import yt_dlp
+
+from .state import state_path
+
+DEFAULT_INDEX_FILENAME = "download_index.sqlite3"
+LOOKUP_CHUNK_SIZE = 500 # Stay well below SQLite's bound-parameter limit
+
+AUDIO_EXTENSIONS = {'mp3', 'm4a', 'opus', 'ogg', 'aac', 'flac', 'wav'}
+# Trailing "[<id>].<ext>" produced by this app's output templates
+_OUTPUT_ID_PATTERN = re.compile(r"\[([A-Za-z0-9_-]+)\]\.([A-Za-z0-9]+)$")
+_YOUTUBE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_TEMP_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp')
+
+IndexKey = Tuple[str, str, str] # (extractor, video_id, variant)
+
+
+def variant_for(download_type: str, container_format: Optional[str]) -> str:
+    """
+    Output variant stored alongside each key, so an audio download doesn't
+    count as already having the video (and MP4 doesn't satisfy MKV).
+    """
+    if download_type == "audio":
+        return "audio"
+    return f"video:{container_format or 'mp4'}"
+
+
+class DownloadIndex:
+    """
+    Persistent SQLite index of completed downloads.
+
+    Rows are keyed by (extractor, video id, variant) and record the output
+    path, size, format and completion time. One connection is shared by all
+    worker threads behind a lock; lookups are done in bulk with IN queries.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or state_path(DEFAULT_INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            " extractor TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " variant TEXT NOT NULL,"
+            " output_path TEXT NOT NULL,"
+            " size INTEGER,"
+            " format TEXT,"
+            " completed_at REAL NOT NULL,"
+            " PRIMARY KEY (extractor, video_id, variant))"
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, extractor: str, video_id: str, variant: str, output_path: str, size: Optional[int] = None, format_id: Optional[str] = None, completed_at: Optional[float] = None):
+        """Inserts or replaces the entry for one finished download."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (extractor, video_id, variant, os.path.abspath(output_path), size, format_id, completed_at or time.time()),
+            )
+            self._conn.commit()
+
+    def forget(self, keys: Iterable[IndexKey]):
+        """Removes entries (e.g. whose files were deleted)."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM downloads WHERE extractor=? AND video_id=? AND variant=?", list(keys))
+            self._conn.commit()
+
+    def lookup_many(self, ids: Iterable[Tuple[str, str]], variant: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Bulk lookup of (extractor, video_id) pairs for one variant.
+
+        Returns:
+            Mapping of found pairs to their row (output_path, size, format, completed_at).
+        """
+        wanted = list(dict.fromkeys(ids))
+        found: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(wanted), LOOKUP_CHUNK_SIZE):
+                chunk = wanted[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("(?, ?)" for _ in chunk)
+                params: List[Any] = []
+                for extractor, video_id in chunk:
+                    params.extend((extractor, video_id))
+                params.append(variant)
+                # Joined rather than "IN (VALUES ...)", which scans the whole table per chunk
+                rows = self._conn.execute(
+                    "SELECT d.extractor, d.video_id, d.output_path, d.size, d.format, d.completed_at"
+                    f" FROM (VALUES {placeholders}) AS wanted JOIN downloads d"
+                    " ON d.extractor = wanted.column1 AND d.video_id = wanted.column2 AND d.variant = ?",
+                    params,
+                )
+                for extractor, video_id, output_path, size, format_id, completed_at in rows:
+                    found[(extractor, video_id)] = {
+                        'output_path': output_path, 'size': size,
+                        'format': format_id, 'completed_at': completed_at,
+                    }
+        return found
+
+    def rebuild(self, directories: Iterable[str]) -> int:
+        """
+        Re-indexes finished files found under the given download directories.
+
+        Only names ending in "[<id>].<ext>" with a YouTube-style 11 character
+        id are picked up, and all of them are indexed as YouTube downloads:
+        the extractor can't be recovered from a filename, so files from other
+        sites are left out (--rebuild-index says so in its help). Returns the
+        number of files indexed.
+        """
+        rows = []
+        for directory in directories:
+            for dirpath, _dirnames, filenames in os.walk(directory):
+                for name in filenames:
+                    if name.endswith(_TEMP_SUFFIXES):
+                        continue
+                    match = _OUTPUT_ID_PATTERN.search(name)
+                    if not match or not _YOUTUBE_ID_PATTERN.match(match.group(1)):
+                        continue
+                    video_id, ext = match.group(1), match.group(2).lower()
+                    variant = "audio" if ext in AUDIO_EXTENSIONS else f"video:{ext}"
+                    path = os.path.abspath(os.path.join(dirpath, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    rows.append(('Youtube', video_id, variant, path, stat.st_size, None, stat.st_mtime))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+        return len(rows)
+
+
+class IndexRecorderPP(yt_dlp.postprocessor.PostProcessor):
+    """Records each file in the DownloadIndex once it reached its final path."""
+    def __init__(self, index: DownloadIndex, variant: str, downloader=None):
+        super().__init__(downloader)
+        self.index = index
+        self.variant = variant
+
+    def run(self, info: Dict[str, Any]):
+        filepath = info.get('filepath')
+        if filepath and info.get('extractor_key') and info.get('id') and os.path.exists(filepath):
+            self.index.record(
+                info['extractor_key'], str(info['id']), self.variant, filepath,
+                size=os.path.getsize(filepath), format_id=info.get('format_id'),
+            )
+        return [], info
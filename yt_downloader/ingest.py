@@ -0,0 +1,286 @@
+"""
+Bulk URL ingestion for pastes and imported files.
+
+Every line is scanned once with precompiled patterns. URLs are canonicalized
+to extractor+id (so youtu.be/X, watch?v=X&t=30 and shorts/X become a single
+job), deduplicated and classified as video, playlist or channel before
+anything is queued.
+"""
+import csv
+import html
+import io
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Callable, Iterable, Iterator, Tuple # For type hinting
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .urls import match_extractor
+
+# --- Kinds ---
+KIND_VIDEO = "video"
+KIND_PLAYLIST = "playlist"
+KIND_CHANNEL = "channel"
+KIND_OTHER = "other" # No specific extractor; handed to yt-dlp's generic extractor
+KINDS = (KIND_VIDEO, KIND_PLAYLIST, KIND_CHANNEL, KIND_OTHER)
+
+# --- Import Formats ---
+FORMAT_TEXT = "text" # One URL per line ('#' comments), also used for pastes
+FORMAT_CSV = "csv" # Any cell holding a URL
+FORMAT_HTML = "html" # Exported browser bookmarks (<A HREF="...">)
+FILE_FORMATS = {'.txt': FORMAT_TEXT, '.list': FORMAT_TEXT, '.csv': FORMAT_CSV, '.tsv': FORMAT_CSV, '.html': FORMAT_HTML, '.htm': FORMAT_HTML}
+
+PROGRESS_EVERY = 500 # Lines between on_progress calls
+
+# URLs inside free text: anything with a scheme, plus scheme-less YouTube links
+_URL_IN_TEXT = re.compile(
+    r"""(?:https?://|\b(?:(?:www|m|music)\.)?(?:youtube\.com|youtu\.be)/)[^\s"'<>]+""",
+    re.IGNORECASE,
+)
+_HREF = re.compile(r"""\bhref\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+_TRAILING_PUNCTUATION = ".,;:!?)]}'\""
+_YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtu.be', 'www.youtu.be'}
+_YOUTUBE_VIDEO_PATH = re.compile(r"^/(?:shorts|embed|live|v|e)/([\w-]{11})(?:[/?#]|$)")
+_YOUTUBE_VIDEO_ID = re.compile(r"^[\w-]{11}$")
+_YOUTUBE_CHANNEL_PATH = re.compile(r"^/(?:@[^/]+|channel/[\w-]+|c/[^/]+|user/[^/]+)(?:/(\w+))?")
+_TRACKING_PARAMS = re.compile(r"^(?:utm_\w+|fbclid|gclid|si|feature|pp)$")
+# Extractor name fragments that denote lists of videos (for non-YouTube sites)
+_PLAYLIST_IE_HINTS = ('Playlist', 'Album', 'Set', 'Collection', 'Series', 'Season', 'Show')
+_CHANNEL_IE_HINTS = ('Channel', 'User', 'Profile', 'Tab')
+
+
+@dataclass
+class IngestedUrl:
+    """One unique URL ready to be queued."""
+    url: str # Canonical form, what gets downloaded
+    key: str # 'Extractor:id' (or the normalized URL for generic links), the dedup key
+    kind: str # KIND_VIDEO, KIND_PLAYLIST, KIND_CHANNEL or KIND_OTHER
+    source: str # As found in the input
+
+
+@dataclass
+class IngestReport:
+    """Result of an ingestion pass, shown to the user before queuing."""
+    urls: List[IngestedUrl] = field(default_factory=list)
+    lines: int = 0
+    duplicates: int = 0
+    invalid_lines: List[str] = field(default_factory=list)
+    cancelled: bool = False
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(KINDS, 0)
+        for item in self.urls:
+            counts[item.kind] += 1
+        return counts
+
+    def summary_text(self) -> str:
+        """Multi-line summary for the confirmation dialog."""
+        counts = self.counts()
+        lines = [f"Read {self.lines} line(s): {len(self.urls)} unique URL(s)."]
+        kinds = [f"{counts[KIND_VIDEO]} video(s)", f"{counts[KIND_PLAYLIST]} playlist(s)", f"{counts[KIND_CHANNEL]} channel(s)"]
+        if counts[KIND_OTHER]:
+            kinds.append(f"{counts[KIND_OTHER]} other link(s)")
+        lines.append(", ".join(kinds))
+        if self.duplicates:
+            lines.append(f"{self.duplicates} duplicate(s) removed.")
+        if self.invalid_lines:
+            lines.append(f"{len(self.invalid_lines)} line(s) without a URL skipped.")
+        return "\n".join(lines)
+
+
+def _strip_trailing_punctuation(url: str) -> str:
+    """Drops sentence punctuation glued to a URL, keeping balanced closing parentheses."""
+    while url and url[-1] in _TRAILING_PUNCTUATION:
+        if url[-1] == ')' and url.count('(') >= url.count(')'):
+            break
+        url = url[:-1]
+    return url
+
+
+def normalize_url(url: str) -> str:
+    """Adds a missing scheme, lowercases the host and drops the fragment and tracking parameters."""
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k)]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+
+def _youtube_video_id(parts) -> Optional[str]:
+    """Video id of a plain (list-less) YouTube video URL, without consulting yt-dlp."""
+    if parts.netloc.endswith('youtu.be'):
+        candidate = parts.path.strip('/').split('/')[0]
+        return candidate if _YOUTUBE_VIDEO_ID.match(candidate) else None
+    if parts.path == '/watch':
+        video_ids = [v for k, v in parse_qsl(parts.query) if k == 'v']
+        return video_ids[0] if video_ids and _YOUTUBE_VIDEO_ID.match(video_ids[0]) else None
+    match = _YOUTUBE_VIDEO_PATH.match(parts.path)
+    return match.group(1) if match else None
+
+
+def _kind_for_extractor(ie_key: str) -> str:
+    if any(hint in ie_key for hint in _CHANNEL_IE_HINTS):
+        return KIND_CHANNEL
+    if any(hint in ie_key for hint in _PLAYLIST_IE_HINTS):
+        return KIND_PLAYLIST
+    return KIND_VIDEO
+
+
+def canonicalize(url: str) -> Tuple[str, str, str]:
+    """
+    Canonical form of one URL.
+
+    Plain YouTube video links are recognized with local patterns; everything
+    else goes through yt-dlp's URL regexes (match_extractor). No network
+    access happens here.
+
+    Returns:
+        (canonical_url, dedup_key, kind)
+    """
+    url = normalize_url(url)
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+
+    if parts.netloc in _YOUTUBE_HOSTS and 'list' not in query:
+        video_id = _youtube_video_id(parts)
+        if video_id:
+            return f"https://www.youtube.com/watch?v={video_id}", f"Youtube:{video_id}", KIND_VIDEO
+
+    match = match_extractor(url)
+    if match is None:
+        return url, url, KIND_OTHER
+    ie_key, item_id = match
+    if ie_key == 'Youtube':
+        return f"https://www.youtube.com/watch?v={item_id}", f"Youtube:{item_id}", KIND_VIDEO
+    if ie_key == 'YoutubeTab':
+        channel = _YOUTUBE_CHANNEL_PATH.match(parts.path)
+        if channel and 'list' not in query:
+            tab = channel.group(1) or 'featured'
+            path = parts.path if channel.group(1) else channel.group(0)
+            return f"https://www.youtube.com{path.rstrip('/')}", f"YoutubeTab:{item_id}/{tab}", KIND_CHANNEL
+        if 'v' in query and 'list' in query:
+            # Video inside a playlist: whether the list is expanded is up to the download options
+            return f"https://www.youtube.com/watch?v={query['v']}&list={query['list']}", f"YoutubeTab:{query['list']}:{query['v']}", KIND_PLAYLIST
+        return f"https://www.youtube.com/playlist?list={item_id}", f"YoutubeTab:{item_id}", KIND_PLAYLIST
+    return url, f"{ie_key}:{item_id}", _kind_for_extractor(ie_key)
+
+
+class UrlIngestor:
+    """
+    Incremental canonicalize + dedup pass.
+
+    Feed it text with add_text() (streaming callers like the CLI) or use
+    ingest_lines()/ingest_file() for a whole paste or file.
+    """
+    def __init__(self):
+        self.report = IngestReport()
+        self._seen_keys: Dict[str, str] = {} # dedup key -> canonical URL
+        self._seen_raw: Dict[str, str] = {} # normalized input -> dedup key (skips re-matching exact repeats)
+
+    def add_url(self, raw: str) -> Optional[IngestedUrl]:
+        """Canonicalizes one URL; returns None if it duplicates an earlier one."""
+        normalized = normalize_url(raw)
+        key = self._seen_raw.get(normalized)
+        if key is not None:
+            self.report.duplicates += 1
+            return None
+        canonical, key, kind = canonicalize(normalized)
+        self._seen_raw[normalized] = key
+        if key in self._seen_keys:
+            self.report.duplicates += 1
+            return None
+        self._seen_keys[key] = canonical
+        item = IngestedUrl(url=canonical, key=key, kind=kind, source=raw)
+        self.report.urls.append(item)
+        return item
+
+    def add_text(self, text: str, strict: bool = True) -> List[IngestedUrl]:
+        """
+        Ingests every URL in one line or cell.
+
+        Args:
+            text: A line of a paste or file.
+            strict: Record non-blank, non-comment text without a URL as an
+                invalid line (False for markup and CSV cells).
+
+        Returns:
+            The new unique URLs, in input order.
+        """
+        self.report.lines += 1
+        text = text.strip()
+        if not text or text.startswith('#'):
+            return []
+        found = [_strip_trailing_punctuation(m.group(0)) for m in _URL_IN_TEXT.finditer(text)]
+        if not found and '.' in text and not any(c.isspace() for c in text):
+            found = [text] # Scheme-less link to another site, e.g. vimeo.com/123
+        if not found:
+            if strict:
+                self.report.invalid_lines.append(text)
+            return []
+        new_items = []
+        for url in found:
+            item = self.add_url(url)
+            if item is not None:
+                new_items.append(item)
+        return new_items
+
+
+def ingest_lines(lines: Iterable[str], fmt: str = FORMAT_TEXT,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None) -> IngestReport:
+    """
+    Canonicalizes and deduplicates all URLs in lines (one pass).
+
+    Args:
+        lines: Text lines of a paste or an imported file.
+        fmt: FORMAT_TEXT, FORMAT_CSV or FORMAT_HTML.
+        on_progress: Called as on_progress(lines_read, unique_urls) every PROGRESS_EVERY lines.
+        should_stop: Polled as often as on_progress; ingestion stops early when it returns True.
+
+    Returns:
+        An IngestReport (cancelled=True if should_stop ended it early).
+    """
+    ingestor = UrlIngestor()
+    report = ingestor.report
+    for n, text in enumerate(_texts(lines, fmt), start=1):
+        ingestor.add_text(text, strict=fmt == FORMAT_TEXT)
+        if n % PROGRESS_EVERY == 0:
+            if should_stop is not None and should_stop():
+                report.cancelled = True
+                break
+            if on_progress is not None:
+                on_progress(report.lines, len(report.urls))
+    return report
+
+
+def _texts(lines: Iterable[str], fmt: str) -> Iterator[str]:
+    """Units of text to scan for URLs: lines, CSV cells or bookmark HREFs."""
+    if fmt == FORMAT_CSV:
+        for row in csv.reader(lines):
+            yield " ".join(row)
+    elif fmt == FORMAT_HTML:
+        for line in lines:
+            for match in _HREF.finditer(line):
+                yield html.unescape(match.group(1) if match.group(1) is not None else match.group(2))
+    else:
+        yield from lines
+
+
+def format_for_path(path: str) -> str:
+    """Import format implied by a file's extension (plain text when unknown)."""
+    return FILE_FORMATS.get(os.path.splitext(path)[1].lower(), FORMAT_TEXT)
+
+
+def ingest_file(path: str, **kwargs) -> IngestReport:
+    """
+    Reads a .txt, .csv or bookmarks .html file and ingests it (see ingest_lines).
+
+    Raises:
+        OSError: The file could not be read.
+    """
+    fmt = format_for_path(path)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    text = raw.decode('utf-8-sig', errors='replace') # Tolerate BOMs and stray bytes in exports
+    return ingest_lines(io.StringIO(text, newline=''), fmt, **kwargs)
@@ -0,0 +1,190 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional # For type hinting
+
+from .metrics import ItemMetrics
+from .state import state_path
+
+DEFAULT_JOURNAL_FILENAME = "jobs.sqlite3"
+
+# --- Job States ---
+JOB_PENDING = "pending"
+JOB_EXTRACTING = "extracting"
+JOB_DOWNLOADING = "downloading"
+JOB_POSTPROCESSING = "post-processing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_EXPANDED = "expanded" # Playlist job replaced by its entry jobs
+TERMINAL_STATES = (JOB_DONE, JOB_FAILED, JOB_EXPANDED)
+
+
+@dataclass
+class DownloadJob:
+    """One unit of work: an input URL, or an entry fanned out from a playlist."""
+    position: int # Index of the input URL this job came from
+    url: str
+    ie_key: Optional[str] = None # Extractor hint from the playlist entry
+    video_id: Optional[str] = None
+    extra_info: Optional[Dict[str, Any]] = None # Playlist fields for fanned-out entries
+    entry: Optional[Dict[str, Any]] = None # Entry already resolved by the playlist extractor
+    attempts: int = 0
+    job_id: Optional[int] = None # Row id in the JobJournal, if journaled
+    state: str = JOB_PENDING
+    metrics: Optional[ItemMetrics] = field(default=None, repr=False, compare=False) # Not journaled
+    not_before: float = field(default=0.0, repr=False, compare=False) # time.monotonic() a retry may start at; not journaled
+    title: Optional[str] = field(default=None, repr=False, compare=False) # Entry title from the playlist; not journaled
+    stream: Optional[Any] = field(default=None, repr=False, compare=False) # PlaylistStream of a streamed playlist's jobs; not journaled
+
+    def key(self) -> str:
+        """Identifies the job within its batch: '<position>', or '<position>.<playlist_index>' for entries."""
+        if self.extra_info and self.extra_info.get('playlist_index') is not None:
+            return f"{self.position}.{self.extra_info['playlist_index']}"
+        return str(self.position)
+
+    def label(self) -> str:
+        """Short human-readable description for status lines."""
+        if self.extra_info and self.extra_info.get('playlist_index') is not None:
+            count = self.extra_info.get('n_entries')
+            return f"'{self.extra_info.get('playlist')}' item {self.extra_info['playlist_index']}{f'/{count}' if count else ''}: {self.url}"
+        return f"input URL {self.position + 1}: {self.url}"
+
+    def describe(self) -> Dict[str, Any]:
+        """Event payload identifying this job."""
+        payload: Dict[str, Any] = {'key': self.key(), 'index': self.position, 'url': self.url}
+        if self.extra_info:
+            payload['playlist'] = self.extra_info.get('playlist')
+            payload['playlist_index'] = self.extra_info.get('playlist_index')
+        return payload
+
+
+class JobJournal:
+    """
+    On-disk journal of batches and their jobs (SQLite, WAL mode).
+
+    Every job row moves through pending -> extracting -> downloading ->
+    post-processing -> done/failed, so a batch interrupted by a close, crash
+    or cancel can be reloaded with load_jobs() and resumed. Batches keep the
+    DownloadOptions they were started with.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or state_path(DEFAULT_JOURNAL_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; WAL keeps it consistent
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " batch_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created_at REAL NOT NULL,"
+            " finished_at REAL,"
+            " options TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " batch_id INTEGER NOT NULL REFERENCES batches(batch_id),"
+            " position INTEGER NOT NULL,"
+            " url TEXT NOT NULL,"
+            " ie_key TEXT,"
+            " video_id TEXT,"
+            " extra_info TEXT,"
+            " entry TEXT,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS jobs_by_batch_state ON jobs (batch_id, state);"
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def create_batch(self, options: Dict[str, Any]) -> int:
+        """Starts a new batch and returns its id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO batches (created_at, options) VALUES (?, ?)",
+                (time.time(), json.dumps(options)),
+            )
+            self._conn.commit()
+            return int(cursor.lastrowid)
+
+    def finish_batch(self, batch_id: int):
+        """Marks a batch as complete (nothing left to resume)."""
+        with self._lock:
+            self._conn.execute("UPDATE batches SET finished_at=? WHERE batch_id=?", (time.time(), batch_id))
+            self._conn.commit()
+
+    def add_jobs(self, batch_id: int, jobs: List[DownloadJob]):
+        """Journals new jobs and assigns their job_id."""
+        now = time.time()
+        with self._lock:
+            for job in jobs:
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (batch_id, position, url, ie_key, video_id, extra_info, entry, state, attempts, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (batch_id, job.position, job.url, job.ie_key, job.video_id,
+                     json.dumps(job.extra_info) if job.extra_info else None,
+                     json.dumps(job.entry, default=repr) if job.entry else None,
+                     job.state, job.attempts, now),
+                )
+                job.job_id = int(cursor.lastrowid)
+            self._conn.commit()
+
+    def set_state(self, job: DownloadJob, state: str, error: Optional[str] = None):
+        """Records a state transition for a journaled job."""
+        job.state = state
+        if job.job_id is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state=?, attempts=?, error=?, updated_at=? WHERE job_id=?",
+                (state, job.attempts, error, time.time(), job.job_id),
+            )
+            self._conn.commit()
+
+    def unfinished_batch(self) -> Optional[Dict[str, Any]]:
+        """
+        The most recent batch that still has non-terminal jobs, if any.
+
+        Returns:
+            Dict with batch_id, created_at, options and remaining (job count).
+        """
+        placeholders = ",".join("?" for _ in TERMINAL_STATES)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT b.batch_id, b.created_at, b.options, COUNT(j.job_id) FROM batches b"
+                f" JOIN jobs j ON j.batch_id = b.batch_id AND j.state NOT IN ({placeholders})"
+                " WHERE b.finished_at IS NULL GROUP BY b.batch_id ORDER BY b.batch_id DESC LIMIT 1",
+                TERMINAL_STATES,
+            ).fetchone()
+        if row is None:
+            return None
+        batch_id, created_at, options, remaining = row
+        return {'batch_id': batch_id, 'created_at': created_at, 'options': json.loads(options), 'remaining': remaining}
+
+    def load_jobs(self, batch_id: int) -> List[DownloadJob]:
+        """
+        Non-terminal jobs of a batch, reset to pending, in their original order.
+
+        Attempts start from zero again: an interrupted job hasn't failed.
+        """
+        placeholders = ",".join("?" for _ in TERMINAL_STATES)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, position, url, ie_key, video_id, extra_info, entry FROM jobs"
+                f" WHERE batch_id=? AND state NOT IN ({placeholders}) ORDER BY position, job_id",
+                (batch_id, *TERMINAL_STATES),
+            ).fetchall()
+        return [
+            DownloadJob(
+                position=position, url=url, ie_key=ie_key, video_id=video_id,
+                extra_info=json.loads(extra_info) if extra_info else None,
+                entry=json.loads(entry) if entry else None,
+                job_id=job_id,
+            )
+            for job_id, position, url, ie_key, video_id, extra_info, entry in rows
+        ]
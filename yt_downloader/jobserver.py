@@ -0,0 +1,928 @@
+"""
+Job server: one batch spread over several worker processes or machines.
+
+    python -m yt_downloader.jobserver serve --port 8700
+    python -m yt_downloader.jobserver worker --server http://127.0.0.1:8700 --processes 4
+    python -m yt_downloader urls.txt --server http://127.0.0.1:8700
+
+The server only queues URLs and relays events over a small JSON/HTTP API;
+it imports yt-dlp only to validate a submitted batch's options. Workers lease jobs and download them with their
+own DownloadEngine (one YoutubeDL per download thread, as in the GUI), so
+extraction work is spread over processes and hosts. A batch only says
+what to download and in which format and quality (BATCH_OPTIONS); where
+files go (--output, --scratch-dir) and everything else is each worker's
+own setting, so a client can't choose where the worker hosts write. Events
+and progress frames flow back through the server to the client that
+submitted the batch.
+
+The server listens on the loopback interface unless told otherwise, and
+refuses other addresses without a token.
+
+A job's lease is renewed by every report of the worker holding it; a job
+whose worker disappears goes back to the queue after LEASE_SECONDS. A
+finished batch is dropped DELIVERED_RETENTION seconds after a client
+polled its end, or after BATCH_RETENTION; requests for it then get 404.
+"""
+import argparse
+import hmac
+import http.server
+import importlib
+import ipaddress
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Callable, Deque, Iterator, Set # For type hinting
+from urllib.parse import urlsplit, parse_qs
+
+from .constants import VIDEO_TYPE, AUDIO_TYPE, DEFAULT_WORKER_COUNT, MAX_WORKER_COUNT
+from .jobs import JOB_PENDING, JOB_DONE
+
+DEFAULT_SERVER_PORT = 8700
+LEASE_SECONDS = 60.0 # A leased job returns to the queue if its worker is silent this long
+MAX_LEASES = 3 # A job lost by this many workers fails instead of being leased again
+REPORT_INTERVAL = 0.5 # Seconds between a worker's event/progress reports
+POLL_WAIT = 10.0 # Longest a lease or event request waits for something to happen
+TOP_UP_TIMEOUT = 5.0 # HTTP timeout of a worker's top-up lease (it doesn't wait for work)
+MAX_EVENTS = 10000 # Events kept per batch for clients that poll late
+BATCH_RETENTION = 3600.0 # Seconds a finished batch is kept for clients that haven't read its end yet
+DELIVERED_RETENTION = 60.0 # ... once its batch_finished was polled (a client retrying that poll still gets it)
+TOKEN_HEADER = 'X-Job-Token'
+WORKER_LOST_ERROR = "Lost by its workers (crashed or disconnected)"
+
+JOB_LEASED = "leased"
+
+# DownloadOptions fields a batch may set; workers ignore the rest of a batch's options
+BATCH_OPTIONS = (
+    'download_type', 'container_format', 'download_playlists', 'playlist_window',
+    'audio_accepted_codecs', 'audio_fallback_codec', 'audio_bitrate',
+)
+
+_ITEM_DONE_EVENTS = ('item_finished', 'item_skipped', 'item_failed')
+_JOB_CLOSED_EVENTS = _ITEM_DONE_EVENTS + ('playlist_expanded',) # A worker's input job needs no download thread any more
+_LOCAL_EVENTS = ('batch_started', 'batch_finished') # A worker's own engine batches, not the server's
+
+
+class JobServerError(Exception):
+    """The job server refused a request (HTTP status in `status`) or couldn't be reached (status None)."""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class RemoteJob:
+    """One input URL of a server batch, and what its current lease has counted so far."""
+    key: str # Position in the batch, as DownloadJob.key() of input URLs
+    url: str
+    state: str = JOB_PENDING # JOB_PENDING, JOB_LEASED or JOB_DONE
+    worker: Optional[str] = None
+    lease_until: float = 0.0 # time.monotonic()
+    leases: int = 0
+    reported: bool = False # The worker reported the job itself finished, failed or expanded
+    completed: int = 0 # Items (the job, or its playlist entries) counted in the batch totals
+    skipped: int = 0
+    extra: int = 0 # Playlist entries added to the batch total, minus the playlist job itself
+
+
+class ServerBatch:
+    """A submitted batch: its queue, counters and event log."""
+    def __init__(self, batch_id: int, urls: List[str], options: Dict[str, Any]):
+        self.batch_id = batch_id
+        self.options = options # BATCH_OPTIONS fields of DownloadOptions, applied by the workers
+        self.jobs: Dict[str, RemoteJob] = {str(n): RemoteJob(str(n), url) for n, url in enumerate(urls)}
+        self.queue: Deque[str] = deque(self.jobs)
+        self.total = len(urls)
+        self.completed = 0
+        self.skipped = 0
+        self.failed_items: List[Dict[str, Any]] = []
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=MAX_EVENTS)
+        self.next_seq = 0
+        self.progress: Dict[str, Dict[str, Any]] = {} # Item key -> latest progress state
+        self.workers: Set[str] = set()
+        self.cancelled = False
+        self.finished = False
+        self.created_at = time.time()
+        self.drop_at: Optional[float] = None # time.monotonic() after which a finished batch is dropped
+
+    def leased(self) -> List[RemoteJob]:
+        return [job for job in self.jobs.values() if job.state == JOB_LEASED]
+
+    def overall(self) -> Dict[str, Any]:
+        return {'completed': self.completed, 'total': self.total, 'queued': len(self.queue),
+                'leased': len(self.leased()), 'workers': sorted(self.workers)}
+
+    def summary(self) -> Dict[str, Any]:
+        """Payload of the server's batch_finished event (a subset of the local engine's)."""
+        return {'batch_id': self.batch_id, 'total': self.total, 'completed': self.completed, 'skipped': self.skipped,
+                'failed': len(self.failed_items), 'failed_items': self.failed_items, 'cancelled': self.cancelled,
+                'workers': sorted(self.workers)}
+
+
+def validate_batch_options(options: Dict[str, Any]):
+    """
+    Checks BATCH_OPTIONS values the way a worker's engine would use them.
+
+    Raises:
+        ValueError: A value is of the wrong type or not supported.
+    """
+    from .engine import DownloadOptions # Imports yt-dlp (AudioPolicy)
+    try:
+        parsed = DownloadOptions.from_dict(dict(options, download_path=''))
+    except TypeError as e:
+        raise ValueError(f"Invalid options: {e}") from e
+    if parsed.download_type not in (VIDEO_TYPE, AUDIO_TYPE):
+        raise ValueError(f"Unknown download_type {parsed.download_type!r}")
+    if not isinstance(parsed.playlist_window, int) or parsed.playlist_window < 0:
+        raise ValueError("playlist_window must be a non-negative integer")
+    if not isinstance(parsed.audio_accepted_codecs, list):
+        raise ValueError("audio_accepted_codecs must be a list")
+    parsed.audio_policy() # Unknown fallback codec or bad bitrate
+
+
+def _root_key(key: Any) -> str:
+    """'3.12' (entry 12 of input URL 3) -> '3'."""
+    return str(key).split('.', 1)[0]
+
+
+class JobServer:
+    """
+    Thread-safe batch queue behind the HTTP API.
+
+    Jobs are leased to workers in input order, from the oldest batch with
+    queued jobs. Workers report events in batches; item events update the
+    batch counters (so playlist entries fanned out on a worker are counted
+    as in a local run) and are appended to the batch's event log, which
+    clients read with poll().
+    """
+    def __init__(self, lease_seconds: float = LEASE_SECONDS, retention: float = BATCH_RETENTION):
+        self.lease_seconds = lease_seconds
+        self.retention = retention
+        self._cond = threading.Condition()
+        self._batches: Dict[int, ServerBatch] = {}
+        self._next_batch_id = 1
+        self.workers: Dict[str, float] = {} # Worker name -> time.time() last heard from
+
+    def _batch(self, batch_id: int) -> ServerBatch:
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            raise KeyError(f"No batch {batch_id}")
+        return batch
+
+    def _append_event(self, batch: ServerBatch, event: str, payload: Dict[str, Any]):
+        record = dict(payload)
+        record.update(event=event, seq=batch.next_seq)
+        batch.next_seq += 1
+        batch.events.append(record)
+        self._cond.notify_all()
+
+    def _seen(self, worker: str):
+        self.workers[worker] = time.time()
+
+    def submit(self, urls: List[str], options: Dict[str, Any]) -> int:
+        """
+        Queues a batch; returns its id. Options other than BATCH_OPTIONS are dropped.
+
+        Raises:
+            ValueError: The options would fail on every worker (e.g. an unknown audio codec).
+        """
+        options = {name: value for name, value in options.items() if name in BATCH_OPTIONS}
+        validate_batch_options(options)
+        with self._cond:
+            batch_id = self._next_batch_id
+            self._next_batch_id += 1
+            batch = self._batches[batch_id] = ServerBatch(batch_id, urls, options)
+            self._append_event(batch, 'batch_started', {'total': batch.total, 'batch_id': batch_id})
+            self._finish_if_done(batch) # An empty batch is done right away
+            return batch_id
+
+    def lease(self, worker: str, max_jobs: int, batch_id: Optional[int] = None, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """
+        Hands up to max_jobs queued jobs of one batch to worker.
+
+        Args:
+            batch_id: Only lease from this batch (a worker topping up its running engine).
+            wait: Seconds to wait for work if nothing is queued.
+
+        Returns:
+            {'batch_id', 'options', 'jobs': [{'key', 'url'}]}, or None if there was no work.
+        """
+        deadline = time.monotonic() + wait
+        with self._cond:
+            self._seen(worker)
+            while True:
+                self._expire_leases()
+                if batch_id is None:
+                    candidates = list(self._batches.values())
+                else:
+                    candidates = [self._batches[batch_id]] if batch_id in self._batches else []
+                for batch in candidates:
+                    if batch.queue and not batch.cancelled:
+                        return self._lease_from(batch, worker, max(1, max_jobs))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(remaining, 1.0)) # Wakes up for lease expiry too
+
+    def _lease_from(self, batch: ServerBatch, worker: str, max_jobs: int) -> Dict[str, Any]:
+        jobs = []
+        until = time.monotonic() + self.lease_seconds
+        while batch.queue and len(jobs) < max_jobs:
+            job = batch.jobs[batch.queue.popleft()]
+            job.state, job.worker, job.lease_until = JOB_LEASED, worker, until
+            job.leases += 1
+            jobs.append({'key': job.key, 'url': job.url})
+        batch.workers.add(worker)
+        self._append_event(batch, 'jobs_leased', {'worker': worker, 'keys': [job['key'] for job in jobs]})
+        return {'batch_id': batch.batch_id, 'options': batch.options, 'jobs': jobs}
+
+    def _expire_leases(self):
+        """
+        Re-queues (or fails) jobs whose worker stopped reporting, and drops
+        finished batches whose retention is over. Caller holds the lock.
+        """
+        now = time.monotonic()
+        for batch in list(self._batches.values()):
+            if batch.finished:
+                if batch.drop_at is not None and batch.drop_at <= now:
+                    del self._batches[batch.batch_id]
+                continue
+            for job in reversed(batch.leased()): # Re-queued at the front, in input order
+                if job.lease_until < now:
+                    self._release(batch, job, f"lease of {job.worker} expired")
+            self._finish_if_done(batch)
+
+    def _release(self, batch: ServerBatch, job: RemoteJob, reason: str):
+        """Takes an unfinished job back from its worker, undoing what it counted."""
+        batch.completed -= job.completed
+        batch.skipped -= job.skipped
+        batch.total -= job.extra
+        batch.failed_items = [f for f in batch.failed_items if _root_key(f.get('key')) != job.key]
+        for key in [k for k in batch.progress if _root_key(k) == job.key]:
+            del batch.progress[key]
+        worker = job.worker
+        job.completed = job.skipped = job.extra = 0
+        job.reported = False
+        job.worker = None
+        if batch.cancelled:
+            job.state = JOB_DONE
+        elif job.leases >= MAX_LEASES:
+            self._fail(batch, job, WORKER_LOST_ERROR)
+        else:
+            job.state = JOB_PENDING
+            batch.queue.appendleft(job.key)
+            self._append_event(batch, 'item_requeued', {'key': job.key, 'index': int(job.key), 'url': job.url, 'worker': worker, 'reason': reason})
+
+    def _fail(self, batch: ServerBatch, job: RemoteJob, error: str):
+        job.state = JOB_DONE
+        batch.completed += 1
+        failure = {'item': job.url, 'error': error, 'category': 'transient', 'key': job.key}
+        batch.failed_items.append(failure)
+        self._append_event(batch, 'item_failed', {'key': job.key, 'index': int(job.key), 'url': job.url, 'error': error, 'category': 'transient', 'cancelled': False})
+
+    def _finish_if_done(self, batch: ServerBatch):
+        if batch.finished or batch.queue or batch.leased():
+            return
+        batch.finished = True
+        batch.drop_at = time.monotonic() + self.retention
+        batch.progress.clear()
+        self._append_event(batch, 'batch_finished', batch.summary())
+
+    def report(self, worker: str, batch_id: int, events: List[Dict[str, Any]], progress: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Takes a worker's events and progress states (keys already mapped to
+        this batch's) and renews its leases.
+
+        Returns:
+            {'cancelled': bool}: the worker should stop the batch.
+        """
+        with self._cond:
+            self._seen(worker)
+            batch = self._batch(batch_id)
+            mine = {job.key: job for job in batch.leased() if job.worker == worker}
+            until = time.monotonic() + self.lease_seconds
+            for job in mine.values():
+                job.lease_until = until
+            for record in events:
+                record = dict(record)
+                event = record.pop('event', None)
+                if not event:
+                    continue
+                record['worker'] = worker
+                if 'key' in record:
+                    job = mine.get(_root_key(record['key']))
+                    if job is None:
+                        continue # Stale: its lease expired and the job went to another worker
+                    self._count(batch, job, event, record)
+                self._append_event(batch, event, record)
+            for state in progress.values():
+                key = state.get('key')
+                if key is not None and _root_key(key) in mine:
+                    batch.progress[str(key)] = state
+            return {'cancelled': batch.cancelled}
+
+    def _count(self, batch: ServerBatch, job: RemoteJob, event: str, payload: Dict[str, Any]):
+        """Updates the batch counters for an item event of job (or of one of its playlist entries)."""
+        own = str(payload['key']) == job.key
+        if event in _ITEM_DONE_EVENTS:
+            batch.completed += 1
+            job.completed += 1
+            batch.progress.pop(str(payload['key']), None)
+            if event == 'item_skipped':
+                batch.skipped += 1
+                job.skipped += 1
+                if not own:
+                    # A playlist entry already downloaded: dropped before playlist_expanded counts the rest
+                    batch.total += 1
+                    job.extra += 1
+            elif event == 'item_failed':
+                batch.failed_items.append({'item': payload.get('url'), 'error': payload.get('error'),
+                                           'category': payload.get('category'), 'key': str(payload['key'])})
+            job.reported = job.reported or own
+        elif event == 'playlist_expanded':
+            # A streamed playlist's continuation job ('more') counts until it expands in turn
+            extra = int(payload.get('entries') or 0) + bool(payload.get('more')) - 1
+            batch.total += extra
+            job.extra += extra
+            job.reported = job.reported or own
+
+    def complete(self, worker: str, batch_id: int, keys: List[str], interrupted: bool, error: Optional[str] = None):
+        """
+        A worker's engine is done with keys.
+
+        Args:
+            interrupted: The engine was cancelled; unfinished jobs go back to the queue.
+            error: Why the engine failed as a whole (e.g. yt-dlp couldn't be initialized).
+        """
+        with self._cond:
+            self._seen(worker)
+            batch = self._batch(batch_id)
+            for key in keys:
+                job = batch.jobs.get(key)
+                if job is None or job.state != JOB_LEASED or job.worker != worker:
+                    continue
+                if job.reported and job.completed >= job.extra + 1: # Every entry of a playlist job, too
+                    job.state = JOB_DONE
+                elif batch.cancelled:
+                    job.state = JOB_DONE # Counted as far as it got, like a cancelled local batch
+                elif interrupted:
+                    job.leases -= 1 # Handed back, not lost
+                    self._release(batch, job, f"{worker} stopped")
+                elif job.reported:
+                    job.state = JOB_DONE # Entries the engine didn't report can't be told apart any more
+                else:
+                    self._fail(batch, job, error or "Worker finished without reporting the item")
+            self._finish_if_done(batch)
+            self._cond.notify_all()
+
+    def cancel(self, batch_id: int) -> bool:
+        """Cancels a batch: queued jobs are dropped and workers stop at their next report."""
+        with self._cond:
+            batch = self._batch(batch_id)
+            if batch.finished or batch.cancelled:
+                return False
+            batch.cancelled = True
+            for key in batch.queue:
+                batch.jobs[key].state = JOB_DONE
+            batch.queue.clear()
+            self._append_event(batch, 'status', {'message': "Download cancelled by user."})
+            self._finish_if_done(batch)
+            return True
+
+    def poll(self, batch_id: int, since: int = 0, wait: float = 0.0) -> Dict[str, Any]:
+        """
+        Events with seq >= since (waiting up to wait seconds for one), plus
+        the current progress states and counters.
+        """
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                self._expire_leases()
+                batch = self._batch(batch_id)
+                if batch.next_seq > since or batch.finished:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(min(remaining, 1.0))
+            events = [e for e in batch.events if e['seq'] >= since]
+            if batch.finished and any(e['event'] == 'batch_finished' for e in events):
+                # The client has the batch's end: keep it a little longer only
+                batch.drop_at = min(batch.drop_at, time.monotonic() + min(DELIVERED_RETENTION, self.retention))
+            first = batch.events[0]['seq'] if batch.events else batch.next_seq
+            return {'events': events, 'next': batch.next_seq, 'dropped': max(0, first - since),
+                    'progress': dict(batch.progress), 'overall': batch.overall(), 'finished': batch.finished}
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            self._expire_leases()
+            now = time.time()
+            return {
+                'batches': [dict(batch.overall(), batch_id=batch.batch_id, finished=batch.finished, cancelled=batch.cancelled)
+                            for batch in self._batches.values()],
+                'workers': {name: round(now - seen, 1) for name, seen in self.workers.items()},
+            }
+
+
+# --- HTTP API ---
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    POST /batches {urls, options}            -> {batch_id}
+    GET  /batches/<id>/events?since=&wait=    -> JobServer.poll()
+    POST /batches/<id>/cancel                 -> {cancelled}
+    POST /lease {worker, max_jobs, batch_id, wait} -> lease or {}
+    POST /batches/<id>/report {worker, events, progress}
+    POST /batches/<id>/complete {worker, keys, interrupted, error}
+    GET  /status
+    """
+    server: "JobHTTPServer"
+
+    def log_message(self, format: str, *args: Any):
+        pass # Requests are frequent; errors are reported to the caller
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _reply(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), token):
+            self._reply(401, {'error': "Missing or wrong job server token"})
+            return
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            body: Dict[str, Any] = {}
+            if method == 'POST':
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            self._reply(200, self._route(method, parts, query, body))
+        except KeyError as e:
+            self._reply(404, {'error': str(e.args[0]) if e.args else "Not found"})
+        except (ValueError, TypeError) as e:
+            self._reply(400, {'error': f"Bad request: {e}"})
+
+    def _route(self, method: str, parts: List[str], query: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        jobs = self.server.job_server
+        if method == 'GET' and parts == ['status']:
+            return jobs.status()
+        if method == 'POST' and parts == ['batches']:
+            urls = body['urls']
+            if not isinstance(urls, list):
+                raise ValueError("urls must be a list")
+            return {'batch_id': jobs.submit([str(u) for u in urls], dict(body.get('options') or {}))}
+        if method == 'POST' and parts == ['lease']:
+            wait = min(float(body.get('wait', 0)), POLL_WAIT)
+            lease = jobs.lease(str(body['worker']), int(body.get('max_jobs', 1)), body.get('batch_id'), wait)
+            return lease or {}
+        if len(parts) == 3 and parts[0] == 'batches':
+            batch_id = int(parts[1])
+            if method == 'GET' and parts[2] == 'events':
+                return jobs.poll(batch_id, int(query.get('since', 0)), min(float(query.get('wait', 0)), POLL_WAIT))
+            if method == 'POST' and parts[2] == 'cancel':
+                return {'cancelled': jobs.cancel(batch_id)}
+            if method == 'POST' and parts[2] == 'report':
+                return jobs.report(str(body['worker']), batch_id, list(body.get('events') or []), dict(body.get('progress') or {}))
+            if method == 'POST' and parts[2] == 'complete':
+                jobs.complete(str(body['worker']), batch_id, [str(k) for k in body.get('keys') or []],
+                              bool(body.get('interrupted')), body.get('error'))
+                return {}
+        raise KeyError(f"No such endpoint: {method} /{'/'.join(parts)}")
+
+
+class JobHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, job_server: JobServer, token: Optional[str] = None):
+        super().__init__(address, _Handler)
+        self.job_server = job_server
+        self.token = token
+
+
+def is_loopback(host: str) -> bool:
+    """True if host (an address or name) only resolves to loopback addresses."""
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        pass
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except OSError:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(a.split('%', 1)[0]).is_loopback for a in addresses)
+
+
+def serve(host: str = '127.0.0.1', port: int = DEFAULT_SERVER_PORT, token: Optional[str] = None,
+          job_server: Optional[JobServer] = None) -> JobHTTPServer:
+    """
+    Starts the HTTP API on a daemon thread; call shutdown() on the result to stop it.
+
+    Raises:
+        ValueError: host is reachable from other machines and there is no token.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"Refusing to listen on {host or 'all interfaces'} without a token: anyone who can reach it could "
+                         "submit batches and lease jobs. Set --token (or $YT_DOWNLOADER_JOB_TOKEN), or listen on 127.0.0.1.")
+    httpd = JobHTTPServer((host, port), job_server or JobServer(), token)
+    threading.Thread(target=httpd.serve_forever, name="job-server", daemon=True).start()
+    return httpd
+
+
+class JobServerClient:
+    """Calls a job server's HTTP API (standard library only, so the CLI and workers share it)."""
+    def __init__(self, url: str, token: Optional[str] = None):
+        self.url = url.rstrip('/')
+        self.token = token
+
+    def _call(self, method: str, path: str, body: Optional[Dict[str, Any]] = None, timeout: float = POLL_WAIT + 20) -> Dict[str, Any]:
+        """
+        Raises:
+            JobServerError: HTTP error or the server can't be reached.
+        """
+        data = json.dumps(body, default=str).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(f"{self.url}{path}", data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header(TOKEN_HEADER, self.token)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error')
+            except ValueError:
+                message = None
+            raise JobServerError(f"Job server: {message or e}", e.code) from e
+        except (OSError, ValueError) as e:
+            raise JobServerError(f"Job server {self.url} unreachable: {e}") from e
+
+    def submit(self, urls: List[str], options: Dict[str, Any]) -> int:
+        return self._call('POST', '/batches', {'urls': urls, 'options': options})['batch_id']
+
+    def lease(self, worker: str, max_jobs: int, batch_id: Optional[int] = None, wait: float = 0.0,
+              timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        lease = self._call('POST', '/lease', {'worker': worker, 'max_jobs': max_jobs, 'batch_id': batch_id, 'wait': wait},
+                           timeout=timeout or wait + 20)
+        return lease or None
+
+    def report(self, worker: str, batch_id: int, events: List[Dict[str, Any]], progress: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        return self._call('POST', f'/batches/{batch_id}/report', {'worker': worker, 'events': events, 'progress': progress})
+
+    def complete(self, worker: str, batch_id: int, keys: List[str], interrupted: bool, error: Optional[str] = None):
+        self._call('POST', f'/batches/{batch_id}/complete', {'worker': worker, 'keys': keys, 'interrupted': interrupted, 'error': error})
+
+    def cancel(self, batch_id: int) -> bool:
+        return self._call('POST', f'/batches/{batch_id}/cancel', {})['cancelled']
+
+    def poll(self, batch_id: int, since: int, wait: float) -> Dict[str, Any]:
+        return self._call('GET', f'/batches/{batch_id}/events?since={since}&wait={wait}')
+
+    def status(self) -> Dict[str, Any]:
+        return self._call('GET', '/status')
+
+
+# --- Worker ---
+
+class RemoteWorker:
+    """
+    Leases jobs from a job server and downloads them with a local DownloadEngine.
+
+    The first lease takes up to worker_count jobs. When the engine's input
+    feed runs out of them, a lease thread tops it up with more jobs of the
+    same batch; the feed never waits for the server (the engine reads it
+    under its state lock) but yields None until they arrive. Jobs leased and
+    not yet finished or expanded into playlist entries are capped at
+    worker_count, so the engine's read-ahead (looking for a job of a host
+    with a free slot) can't hold on to more of the batch than this worker
+    has download threads for. Event
+    keys and positions are mapped from the engine's (local) ones to the
+    server batch's before they are reported.
+
+    A lease's options only supply BATCH_OPTIONS fields; paths and all
+    other settings come from the worker's overrides (or the defaults).
+    """
+    def __init__(self, client: JobServerClient, name: Optional[str] = None, worker_count: Optional[int] = None,
+                 overrides: Optional[Dict[str, Any]] = None, extractors: Optional[List[type]] = None):
+        """
+        Args:
+            client: Job server connection.
+            name: Unique worker name (default: host-pid).
+            worker_count: Download threads (default: DownloadOptions' default).
+            overrides: This worker's DownloadOptions fields; must include download_path.
+            extractors: Extra yt-dlp InfoExtractor classes for this worker's engines.
+        """
+        self.client = client
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        # Download threads of each engine, as DownloadEngine clamps them; the first lease fills them all
+        self.worker_count = max(1, min(worker_count or DEFAULT_WORKER_COUNT, MAX_WORKER_COUNT))
+        self.overrides = dict(overrides or {})
+        self.extractors = list(extractors or [])
+        self.stop = threading.Event()
+
+    def run(self, once: bool = False):
+        """Leases and runs jobs until stop is set (or, with once, until no work is left)."""
+        delay = 1.0
+        while not self.stop.is_set():
+            try:
+                lease = self.client.lease(self.name, self.worker_count, wait=POLL_WAIT)
+                delay = 1.0
+            except JobServerError as e:
+                print(f"Worker {self.name}: {e}; retrying in {delay:.0f}s", file=sys.stderr)
+                self.stop.wait(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            if lease is None:
+                if once:
+                    return
+                continue
+            self.run_lease(lease)
+
+    def run_lease(self, lease: Dict[str, Any]):
+        """Downloads a lease's jobs (and whatever else of its batch the engine asks for)."""
+        from .engine import DownloadEngine, DownloadOptions
+        data = {name: value for name, value in (lease.get('options') or {}).items() if name in BATCH_OPTIONS}
+        data.update(self.overrides) # Paths are never taken from the batch
+        batch_id = lease['batch_id']
+        leased: List[str] = [job['key'] for job in lease['jobs']] # Including top-ups; all of them are completed
+        keys: List[str] = [] # Engine position -> server key
+        ready: Deque[Dict[str, Any]] = deque(lease['jobs']) # Leased, not read by the engine yet
+        open_keys: Set[str] = set() # Server keys read by the engine and not finished or expanded yet
+        held_lock = threading.Lock() # Guards ready and open_keys together
+        wanted = threading.Event() # The feed ran out of ready jobs, or a job was closed
+        drained = threading.Event() # Nothing more to lease for this engine
+        finished = threading.Event() # The engine is done
+        buffer: List[Dict[str, Any]] = []
+        buffer_lock = threading.Lock()
+
+        def feed() -> Iterator[Optional[str]]:
+            # Read under the engine's state lock, so it only takes jobs from memory
+            while True:
+                ending = drained.is_set() or self.stop.is_set() or engine.cancelled # Checked before ready: no job is missed
+                with held_lock:
+                    job = ready.popleft() if ready else None
+                    if job is not None:
+                        open_keys.add(job['key'])
+                if job is not None:
+                    keys.append(job['key'])
+                    yield job['url']
+                elif ending:
+                    return
+                else:
+                    wanted.set()
+                    yield None # The engine asks again after feed_ready() or a short wait
+
+        def top_up():
+            while not (drained.is_set() or finished.is_set()):
+                if not wanted.wait(REPORT_INTERVAL):
+                    continue
+                wanted.clear()
+                with held_lock:
+                    want = self.worker_count - len(open_keys) - len(ready)
+                if want <= 0:
+                    continue # Every download thread has a job; the next one closed sets wanted again
+                try:
+                    more = self.client.lease(self.name, want, batch_id=batch_id, timeout=TOP_UP_TIMEOUT)
+                except JobServerError as e:
+                    print(f"Worker {self.name}: {e}", file=sys.stderr)
+                    more = None
+                jobs = more['jobs'] if more else []
+                if not jobs:
+                    drained.set() # The batch's queue is empty (or the server is gone)
+                leased.extend(job['key'] for job in jobs)
+                with held_lock:
+                    ready.extend(jobs)
+                engine.feed_ready()
+
+        def on_event(event: str, payload: Dict[str, Any]):
+            if event in _LOCAL_EVENTS:
+                return
+            record = self._to_server(payload, keys)
+            record['event'] = event
+            with buffer_lock:
+                buffer.append(record)
+            if event in _JOB_CLOSED_EVENTS and '.' not in str(payload.get('key')):
+                with held_lock:
+                    open_keys.discard(str(record['key']))
+                wanted.set()
+
+        outcome: Dict[str, Any] = {}
+        try:
+            options = DownloadOptions.from_dict(data)
+            options.worker_count = self.worker_count
+            options.use_journal = False # The server keeps track of the batch
+            engine = DownloadEngine(options, on_event=on_event, extractors=self.extractors)
+        except Exception as e:
+            print(f"Worker {self.name}: can't run batch {batch_id}:\n{traceback.format_exc()}", file=sys.stderr)
+            self._complete(batch_id, leased, False, f"Worker error: {type(e).__name__}: {e}")
+            return
+
+        def run_engine():
+            try:
+                outcome['result'] = engine.run(feed())
+            except Exception as e:
+                print(f"Worker {self.name}: batch {batch_id} failed:\n{traceback.format_exc()}", file=sys.stderr)
+                outcome['error'] = f"Worker error: {type(e).__name__}: {e}"
+
+        thread = threading.Thread(target=run_engine, name=f"worker-batch-{batch_id}", daemon=True)
+        thread.start()
+        lease_thread = threading.Thread(target=top_up, name=f"worker-lease-{batch_id}", daemon=True)
+        lease_thread.start()
+
+        def flush():
+            with buffer_lock:
+                events = list(buffer)
+                buffer.clear()
+            items, _status, _overall = engine.progress_bus.drain()
+            progress = {}
+            for item, state in items.items():
+                state.pop('_seq', None)
+                if state.get('key') is not None:
+                    progress[item] = self._to_server(state, keys)
+            try:
+                reply = self.client.report(self.name, batch_id, events, progress)
+            except JobServerError as e:
+                print(f"Worker {self.name}: {e}", file=sys.stderr)
+                with buffer_lock:
+                    buffer[:0] = events # Sent with the next report
+                return
+            if reply.get('cancelled'):
+                engine.cancel()
+
+        while thread.is_alive():
+            thread.join(REPORT_INTERVAL)
+            if self.stop.is_set():
+                engine.cancel()
+            flush()
+        finished.set()
+        lease_thread.join() # Its last top-up (if any) is in leased
+        result = outcome.get('result')
+        if result is not None:
+            interrupted, error = result.cancelled, result.init_error
+        else:
+            interrupted, error = 'error' not in outcome, outcome.get('error')
+        # Not just keys: jobs the engine never read from the feed (e.g. after an init error) must not stay leased
+        self._complete(batch_id, leased, interrupted, error)
+
+    def _complete(self, batch_id: int, keys: List[str], interrupted: bool, error: Optional[str]):
+        try:
+            self.client.complete(self.name, batch_id, keys, interrupted=interrupted, error=error)
+        except JobServerError as e:
+            print(f"Worker {self.name}: {e} (the server re-queues the jobs when their lease expires)", file=sys.stderr)
+
+    @staticmethod
+    def _to_server(payload: Dict[str, Any], keys: List[str]) -> Dict[str, Any]:
+        """Copy of an event payload or progress state with the engine's keys replaced by the server's."""
+        record = dict(payload)
+        key = record.get('key')
+        if key is not None:
+            root, _, rest = str(key).partition('.')
+            if root.isdigit() and int(root) < len(keys):
+                record['key'] = keys[int(root)] + (f".{rest}" if rest else "")
+        index = record.get('index')
+        if isinstance(index, int) and index < len(keys):
+            record['index'] = int(keys[index])
+        return record
+
+
+def _run_worker_process(url: str, token: Optional[str], name: str, worker_count: Optional[int], overrides: Dict[str, Any], once: bool,
+                        extractors: List[type]):
+    """Target of the processes started by --processes."""
+    worker = RemoteWorker(JobServerClient(url, token), name, worker_count, overrides, extractors)
+    _run_until_interrupted(worker.run, worker.stop, once)
+
+
+def _load_extractor(spec: str) -> type:
+    """
+    Imports an InfoExtractor class named as 'package.module:ClassName'.
+
+    Raises:
+        ValueError: spec is malformed or doesn't name an importable class.
+    """
+    module_name, _, class_name = spec.partition(':')
+    if not module_name or not class_name:
+        raise ValueError(f"Extractor {spec!r} is not of the form module:ClassName")
+    try:
+        ie_class = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Can't load extractor {spec!r}: {e}") from e
+    if not isinstance(ie_class, type):
+        raise ValueError(f"Extractor {spec!r} is not a class")
+    return ie_class
+
+
+def _run_until_interrupted(target: Callable[[bool], None], stop: threading.Event, once: bool):
+    """Runs target on a thread so Ctrl+C can stop it cleanly (running jobs are handed back)."""
+    done = threading.Event()
+
+    def run():
+        try:
+            target(once)
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name="job-worker", daemon=True).start()
+    # Event.wait, unlike an interrupted Thread.join, is safe to re-enter
+    try:
+        done.wait()
+    except KeyboardInterrupt:
+        stop.set()
+        done.wait()
+
+
+# --- Command Line ---
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m yt_downloader.jobserver",
+                                     description="Run a job server, or a worker downloading its jobs.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="Queue batches submitted with `python -m yt_downloader --server URL`.")
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help="Address to listen on; use 0.0.0.0 for workers on other hosts (default: %(default)s).")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_SERVER_PORT, help="Port (default: %(default)s).")
+    serve_parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS,
+                              help="Seconds a silent worker keeps its jobs before they are re-queued (default: %(default)s).")
+    serve_parser.add_argument('--token', default=os.environ.get('YT_DOWNLOADER_JOB_TOKEN'),
+                              help="Shared secret clients and workers must send (default: $YT_DOWNLOADER_JOB_TOKEN); "
+                                   "required unless listening on a loopback address.")
+    worker_parser = commands.add_parser('worker', help="Download jobs leased from a job server.")
+    worker_parser.add_argument('--server', default=f"http://127.0.0.1:{DEFAULT_SERVER_PORT}", help="Job server URL (default: %(default)s).")
+    worker_parser.add_argument('--token', default=os.environ.get('YT_DOWNLOADER_JOB_TOKEN'), help="Job server token.")
+    worker_parser.add_argument('--processes', type=int, default=1, help="Worker processes to start (default: %(default)s).")
+    worker_parser.add_argument('-w', '--workers', type=int, default=None,
+                               help=f"Download threads per process, 1-{MAX_WORKER_COUNT} (default: {DEFAULT_WORKER_COUNT}).")
+    worker_parser.add_argument('-o', '--output', required=True,
+                               help="Folder this worker saves to, e.g. where the shared output folder is mounted on this host.")
+    worker_parser.add_argument('--scratch-dir', default=None, help="Local scratch directory for .part files.")
+    worker_parser.add_argument('--extractor', action='append', default=[], metavar='MODULE:CLASS',
+                               help="Extra yt-dlp extractor class to load, e.g. benchmarks.fake_extractor:BenchIE (repeatable).")
+    worker_parser.add_argument('--once', action='store_true', help="Exit once the server has no work left.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'serve':
+        try:
+            httpd = serve(args.host, args.port, args.token, JobServer(lease_seconds=args.lease_seconds))
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        print(f"Job server listening on http://{args.host}:{httpd.server_address[1]}", file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            httpd.shutdown()
+        return 0
+
+    try:
+        extractors = [_load_extractor(spec) for spec in args.extractor]
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    overrides: Dict[str, Any] = {'download_path': os.path.abspath(args.output)}
+    if args.scratch_dir:
+        overrides['scratch_path'] = os.path.abspath(args.scratch_dir)
+    base_name = f"{socket.gethostname()}-{os.getpid()}"
+    if args.processes <= 1:
+        worker = RemoteWorker(JobServerClient(args.server, args.token), base_name, args.workers, overrides, extractors)
+        _run_until_interrupted(worker.run, worker.stop, args.once)
+        return 0
+    processes = [
+        multiprocessing.Process(target=_run_worker_process, name=f"job-worker-{n + 1}",
+                                args=(args.server, args.token, f"{base_name}.{n + 1}", args.workers, overrides, args.once, extractors))
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join() # Each process got the Ctrl+C too and hands its jobs back
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional # For type hinting
+from urllib.parse import urlsplit, urlunsplit
+
+from .state import state_dir
+from .urls import match_extractor
+
+DEFAULT_METADATA_TTL = 3600.0 # Seconds; YouTube format URLs live ~6 h, keep well below
+DEFAULT_METADATA_MAX_ENTRIES = 2000
+DEFAULT_METADATA_MAX_BYTES = 256 * 1024 * 1024
+EXPIRY_MARGIN = 300.0 # Treat format URLs expiring within this many seconds as stale
+
+_EXPIRE_PARAM = re.compile(r"[?&/]expire[=/](\d{9,11})")
+
+
+def cache_key_for(url: str) -> str:
+    """Cache key: extractor+id when yt-dlp can derive one, else the normalized URL."""
+    match = match_extractor(url)
+    if match:
+        return f"{match[0]}:{match[1]}"
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+
+def earliest_format_expiry(info: Dict[str, Any]) -> Optional[float]:
+    """Smallest 'expire' timestamp found in the format URLs of an info_dict, if any."""
+    expiries = []
+    for fmt in info.get('formats') or [info]:
+        match = _EXPIRE_PARAM.search(fmt.get('url') or '')
+        if match:
+            expiries.append(float(match.group(1)))
+    return min(expiries) if expiries else None
+
+
+class MetadataCache:
+    """
+    On-disk cache of raw (unprocessed) yt-dlp info_dicts.
+
+    One JSON file per key in <state dir>/metadata/. Entries expire after the
+    TTL or once any signed format URL is about to expire, and the cache is
+    kept under max_entries/max_bytes by evicting the least recently used
+    entry. Recency lives in an in-memory OrderedDict; on disk a file's mtime
+    is when it was stored (for the TTL) and its atime when it was last read,
+    which seeds the order after a restart.
+    """
+    def __init__(self, directory: Optional[str] = None, ttl: float = DEFAULT_METADATA_TTL, max_entries: int = DEFAULT_METADATA_MAX_ENTRIES, max_bytes: int = DEFAULT_METADATA_MAX_BYTES):
+        self.directory = directory or os.path.join(state_dir(), "metadata")
+        os.makedirs(self.directory, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # filename -> (stored_at, size), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        # --- Counters ---
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0 # Found but expired (TTL or format URL expiry)
+        self.evictions = 0
+        self._load_existing()
+
+    def _load_existing(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((stat.st_atime, stat.st_mtime, name, stat.st_size))
+        for _atime, mtime, name, size in sorted(found): # Least recently used first
+            self._entries[name] = (mtime, size)
+            self._total_bytes += size
+        with self._lock:
+            self._evict_locked()
+
+    @staticmethod
+    def _filename(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns a fresh cached info_dict for key, or None (counted as a miss)."""
+        name = self._filename(key)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, _size = entry
+            if time.time() - stored_at > self.ttl:
+                self.stale += 1
+                self._remove_locked(name)
+                return None
+            self._entries.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+                self._remove_locked(name)
+            return None
+
+        expiry = earliest_format_expiry(info)
+        with self._lock:
+            if expiry is not None and expiry - time.time() < EXPIRY_MARGIN:
+                self.stale += 1
+                self._remove_locked(name)
+                return None
+            self.hits += 1
+        try:
+            # Explicit atime (noatime/relatime mounts skip it); mtime stays the store time
+            os.utime(os.path.join(self.directory, name), (time.time(), stored_at))
+        except OSError:
+            pass # Evicted meanwhile; recency is only a hint
+        return info
+
+    def put(self, key: str, info: Dict[str, Any]):
+        """Stores a JSON-serializable (sanitized) info_dict under key."""
+        name = self._filename(key)
+        path = os.path.join(self.directory, name)
+        data = json.dumps(info, ensure_ascii=False).encode('utf-8')
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path) # Atomic, so readers never see partial JSON
+        with self._lock:
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[name] = (time.time(), len(data))
+            self._total_bytes += len(data)
+            self._evict_locked()
+
+    def invalidate(self, key: str):
+        """Drops the entry for key (e.g. its format URLs stopped working)."""
+        with self._lock:
+            self._remove_locked(self._filename(key))
+
+    def _remove_locked(self, name: str):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            name = next(iter(self._entries))
+            self._remove_locked(name)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'stale': self.stale,
+                'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self._total_bytes,
+            }
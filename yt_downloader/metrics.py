@@ -0,0 +1,300 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Deque, TextIO # For type hinting
+
+# --- Phases ---
+# Every second of an item's processing is charged to exactly one phase.
+PHASE_EXTRACTION = "extraction" # Metadata/format extraction (network round-trips)
+PHASE_FIRST_BYTE = "first_byte" # Request sent, waiting for the first byte of a file
+PHASE_TRANSFER = "transfer"
+PHASE_POSTPROCESS_WAIT = "postprocess_wait" # Downloaded, queued for the post-processing stage
+PHASE_MERGE = "merge" # FFmpeg merging video+audio formats
+PHASE_TRANSCODE = "transcode" # FFmpeg conversion (audio extraction, fixups)
+PHASE_OTHER = "other" # Format selection, moving files, index updates, ...
+PHASES = (PHASE_EXTRACTION, PHASE_FIRST_BYTE, PHASE_TRANSFER, PHASE_POSTPROCESS_WAIT, PHASE_MERGE, PHASE_TRANSCODE, PHASE_OTHER)
+
+# Post-processor keys (PostProcessor.pp_key()) charged to merge/transcode
+MERGE_POSTPROCESSORS = {'Merger'}
+TRANSCODE_POSTPROCESSORS = {'ExtractAudio', 'VideoConvertor', 'VideoRemuxer'}
+
+# Upper bounds (seconds) of the exported histogram buckets
+HISTOGRAM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+PROMETHEUS_WRITE_INTERVAL = 5.0 # Seconds between rewrites of the text file during a batch
+RECENT_ITEMS = 1000 # Finished items kept for the UI
+
+
+def phase_for_postprocessor(pp_key: str) -> str:
+    """Phase a post-processor's run time is charged to."""
+    if pp_key in MERGE_POSTPROCESSORS:
+        return PHASE_MERGE
+    if pp_key in TRANSCODE_POSTPROCESSORS or pp_key.startswith('Fixup'):
+        return PHASE_TRANSCODE
+    return PHASE_OTHER
+
+
+@dataclass
+class ItemMetrics:
+    """Timing breakdown and transfer statistics of one job, across its attempts."""
+    url: str
+    position: int
+    playlist_index: Optional[int] = None
+    title: Optional[str] = None
+    video_id: Optional[str] = None
+    attempts: int = 0
+    phases: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(PHASES, 0.0))
+    bytes: int = 0
+    peak_speed: float = 0.0 # Bytes/s, as reported by yt-dlp
+    outcome: Optional[str] = None # done, failed, expanded or interrupted
+    error: Optional[str] = None
+    started_at: Optional[float] = None # Wall clock
+    finished_at: Optional[float] = None
+    _phase: Optional[str] = field(default=None, repr=False) # None = clock paused
+    _since: float = field(default=0.0, repr=False)
+    _file_bytes: Dict[str, int] = field(default_factory=dict, repr=False) # Largest count per file
+
+    def switch(self, phase: Optional[str]):
+        """Charges the time since the last switch to the current phase and enters phase."""
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] += now - self._since
+        self._phase = phase
+        self._since = now
+
+    @property
+    def phase(self) -> Optional[str]:
+        return self._phase
+
+    def start_attempt(self):
+        self.attempts += 1
+        if self.started_at is None:
+            self.started_at = time.time()
+        self.switch(PHASE_EXTRACTION)
+
+    def observe(self, filename: str, downloaded_bytes: Optional[int], speed: Optional[float]):
+        """Records a progress report for one file of this item."""
+        if downloaded_bytes and downloaded_bytes > self._file_bytes.get(filename, 0):
+            self.bytes += downloaded_bytes - self._file_bytes.get(filename, 0)
+            self._file_bytes[filename] = downloaded_bytes
+        if speed and speed > self.peak_speed:
+            self.peak_speed = speed
+
+    @property
+    def avg_speed(self) -> Optional[float]:
+        """Bytes/s over the time spent transferring."""
+        transfer = self.phases[PHASE_TRANSFER]
+        return self.bytes / transfer if transfer > 0 and self.bytes else None
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phases.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'url': self.url, 'index': self.position, 'playlist_index': self.playlist_index,
+            'title': self.title, 'id': self.video_id, 'outcome': self.outcome, 'error': self.error,
+            'attempts': self.attempts, 'retries': max(0, self.attempts - 1),
+            'started_at': self.started_at, 'finished_at': self.finished_at,
+            'seconds': round(self.total_seconds, 4),
+            'phases': {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+            'bytes': self.bytes,
+            'avg_speed': round(self.avg_speed) if self.avg_speed else None,
+            'peak_speed': round(self.peak_speed) if self.peak_speed else None,
+        }
+
+    def summary_line(self) -> str:
+        """One-line breakdown for the log panel."""
+        name = self.title or self.url
+        parts = [f"{phase.replace('_', ' ')} {seconds:.1f}s" for phase, seconds in self.phases.items() if seconds >= 0.05]
+        line = f"[{self.outcome}] {name} - {self.total_seconds:.1f}s"
+        if parts:
+            line += f" ({', '.join(parts)})"
+        if self.bytes:
+            line += f" | {self.bytes / 1024 / 1024:.1f} MB"
+            if self.avg_speed:
+                line += f", avg {self.avg_speed / 1024 / 1024:.2f} MB/s"
+            if self.peak_speed:
+                line += f", peak {self.peak_speed / 1024 / 1024:.2f} MB/s"
+        if self.attempts > 1:
+            line += f" | {self.attempts - 1} retr{'y' if self.attempts == 2 else 'ies'}"
+        if self.error:
+            line += f" | {self.error}"
+        return line
+
+
+class _Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+    def __init__(self):
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for n, bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bound:
+                self.buckets[n] += 1
+
+
+class MetricsRecorder:
+    """
+    Collects finished ItemMetrics for a batch.
+
+    Each finished item is appended to a JSON lines file (if configured) and
+    folded into aggregate histograms that are written as a Prometheus text
+    exposition file (node_exporter textfile-collector style), rewritten
+    every few seconds and at close(). Recently finished items are kept for
+    the UI's log panel (drain_finished).
+    """
+    def __init__(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._jsonl: Optional[TextIO] = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            self._jsonl = open(jsonl_path, 'a', encoding='utf-8')
+        self._unread: Deque[ItemMetrics] = deque(maxlen=RECENT_ITEMS)
+        self._last_prometheus_write = 0.0
+        # --- Aggregates ---
+        self.phase_histograms = {phase: _Histogram() for phase in PHASES}
+        self.item_histogram = _Histogram()
+        self.outcomes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.total_retries = 0
+        self.peak_speed = 0.0
+
+    def finish(self, metrics: ItemMetrics, outcome: str, error: Optional[str] = None):
+        """Stops the item's clock and records it."""
+        metrics.switch(None)
+        metrics.outcome = outcome
+        metrics.error = error
+        metrics.finished_at = time.time()
+        record = json.dumps(metrics.to_dict(), ensure_ascii=False)
+        with self._lock:
+            for phase, seconds in metrics.phases.items():
+                self.phase_histograms[phase].observe(seconds)
+            self.item_histogram.observe(metrics.total_seconds)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.total_bytes += metrics.bytes
+            self.total_retries += max(0, metrics.attempts - 1)
+            self.peak_speed = max(self.peak_speed, metrics.peak_speed)
+            self._unread.append(metrics)
+            if self._jsonl is not None:
+                self._jsonl.write(record + "\n")
+                self._jsonl.flush()
+            due = time.monotonic() - self._last_prometheus_write >= PROMETHEUS_WRITE_INTERVAL
+        if due and self.prometheus_path:
+            self.write_prometheus()
+
+    def drain_finished(self) -> List[ItemMetrics]:
+        """Items finished since the previous call (at most RECENT_ITEMS)."""
+        with self._lock:
+            items = list(self._unread)
+            self._unread.clear()
+        return items
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate totals, e.g. for the batch_finished event."""
+        with self._lock:
+            return {
+                'items': self.item_histogram.count,
+                'outcomes': dict(self.outcomes),
+                'bytes': self.total_bytes,
+                'retries': self.total_retries,
+                'peak_speed': round(self.peak_speed) if self.peak_speed else None,
+                'phase_seconds': {phase: round(h.total, 3) for phase, h in self.phase_histograms.items()},
+            }
+
+    def prometheus_text(self) -> str:
+        """Aggregates in the Prometheus text exposition format."""
+        lines = []
+
+        def histogram(name: str, help_text: str, series: Dict[str, _Histogram], label: Optional[str]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for value, h in series.items():
+                labels = f'{label}="{value}",' if label else ''
+                for bound, count in zip(HISTOGRAM_BUCKETS, h.buckets):
+                    lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {h.count}')
+                suffix = f"{{{labels.rstrip(',')}}}" if label else ''
+                lines.append(f"{name}_sum{suffix} {h.total:.6f}")
+                lines.append(f"{name}_count{suffix} {h.count}")
+
+        with self._lock:
+            histogram("ytdl_item_phase_seconds", "Time items spent in each processing phase.", self.phase_histograms, 'phase')
+            histogram("ytdl_item_seconds", "Total processing time per item.", {'': self.item_histogram}, None)
+            lines.append("# HELP ytdl_items_total Finished items by outcome.")
+            lines.append("# TYPE ytdl_items_total counter")
+            for outcome, count in sorted(self.outcomes.items()):
+                lines.append(f'ytdl_items_total{{outcome="{outcome}"}} {count}')
+            lines.append("# HELP ytdl_downloaded_bytes_total Bytes downloaded by finished items.")
+            lines.append("# TYPE ytdl_downloaded_bytes_total counter")
+            lines.append(f"ytdl_downloaded_bytes_total {self.total_bytes}")
+            lines.append("# HELP ytdl_item_retries_total Extra attempts made by finished items.")
+            lines.append("# TYPE ytdl_item_retries_total counter")
+            lines.append(f"ytdl_item_retries_total {self.total_retries}")
+            lines.append("# HELP ytdl_item_peak_speed_bytes Highest per-item download speed seen (bytes/s).")
+            lines.append("# TYPE ytdl_item_peak_speed_bytes gauge")
+            lines.append(f"ytdl_item_peak_speed_bytes {self.peak_speed:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Optional[str] = None):
+        """Atomically (re)writes the Prometheus text file."""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        text = self.prometheus_text()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path) # Scrapers never see a half-written file
+        with self._lock:
+            self._last_prometheus_write = time.monotonic()
+
+    def close(self):
+        """Writes the final Prometheus file and closes the JSON lines file."""
+        self.write_prometheus()
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes (None if the platform doesn't say)."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return _windows_peak_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Bytes on macOS, KiB elsewhere
+
+
+def _windows_peak_rss() -> Optional[int]:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (AttributeError, OSError):
+        return None
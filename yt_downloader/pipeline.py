@@ -0,0 +1,196 @@
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, ContextManager # For type hinting
+
+import yt_dlp
+
+from .jobs import DownloadJob
+from .storage import IO_WRITE, IO_MERGE
+
+DEFAULT_POSTPROCESS_WORKERS = 2 # Concurrent FFmpeg merges/conversions
+DEFAULT_POSTPROCESS_QUEUE_SIZE = 4 # Finished downloads allowed to wait for post-processing
+MAX_POSTPROCESS_WORKERS = 8
+_QUEUE_POLL = 0.2 # Seconds; blocked producers/consumers re-check cancellation this often
+
+# Called by PipelinedYoutubeDL.post_process; returns True if the work was queued
+HandOff = Callable[["PipelinedYoutubeDL", str, Dict[str, Any], Optional[Dict[str, str]]], bool]
+# Called by PipelinedYoutubeDL.dl with (filename, started) around every file download
+DownloadObserver = Callable[[str, bool], None]
+# Called by PipelinedYoutubeDL.process_info with the item's info_dict once its formats are chosen
+AdmissionCheck = Callable[[Dict[str, Any]], None]
+# Returns a context manager held while writing to path: io_slot(IO_WRITE or IO_MERGE, path)
+IoSlot = Callable[[str, str], ContextManager[Any]]
+# Called before every HTTP request (extraction and downloads); may raise to stop the job
+RequestCheck = Callable[[], None]
+
+
+class PipelinedYoutubeDL(yt_dlp.YoutubeDL):
+    """
+    YoutubeDL whose post-processing can be taken off the download thread.
+
+    yt-dlp calls post_process() once a file (or all formats to merge) is
+    downloaded; it runs the merger, FFmpegExtractAudio, the move to the
+    final path and 'after_move' post-processors. When a hand_off callback
+    accepts the file, this instance returns right away and the download
+    thread can start the next item. Without one it behaves like YoutubeDL.
+
+    on_dl, if set, is told when each file download (one per format) starts
+    and ends, which is when the request goes out and the transfer is over.
+    on_admit, if set, sees each item after format selection and before
+    anything is written, and may raise to stop it (disk space admission).
+    io_slot, if set, wraps every file download and post-processing run
+    (per-volume I/O caps). before_request, if set, runs before every HTTP
+    request, which makes extraction cancellable between round-trips.
+    """
+    hand_off: Optional[HandOff] = None
+    on_dl: Optional[DownloadObserver] = None
+    on_admit: Optional[AdmissionCheck] = None
+    io_slot: Optional[IoSlot] = None
+    before_request: Optional[RequestCheck] = None
+
+    def urlopen(self, req):
+        if self.before_request is not None:
+            self.before_request()
+        return super().urlopen(req)
+
+    def io(self, kind: str, path: str) -> ContextManager[Any]:
+        """io_slot(kind, path), or a no-op without one."""
+        return self.io_slot(kind, path) if self.io_slot is not None else nullcontext()
+
+    def process_info(self, info_dict):
+        if self.on_admit is not None:
+            self.on_admit(info_dict)
+        return super().process_info(info_dict)
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if test: # Format availability checks
+            return super().dl(name, info, subtitle, test)
+        with self.io(IO_WRITE, name):
+            if self.on_dl is None:
+                return super().dl(name, info, subtitle, test)
+            self.on_dl(name, True)
+            try:
+                return super().dl(name, info, subtitle, test)
+            finally:
+                self.on_dl(name, False)
+
+    def post_process(self, filename, info, files_to_move=None):
+        if self.hand_off is not None and self.hand_off(self, filename, dict(info), files_to_move):
+            info['filepath'] = filename # Final path is only known once the stage ran
+            return info
+        with self.io(IO_MERGE, filename):
+            return super().post_process(filename, info, files_to_move)
+
+
+def stage_capacity(workers: int, max_queued: int) -> int:
+    """Most tasks a PostProcessStage(workers, max_queued) holds at once (queued plus running)."""
+    return max(1, min(workers, MAX_POSTPROCESS_WORKERS)) + max(1, max_queued)
+
+
+@dataclass
+class PostProcessTask:
+    """A downloaded job waiting for its post-processors."""
+    job: DownloadJob
+    # Instance that downloaded it (owns the post-processors). It is only
+    # used by the stage until the task ran: no download worker takes it
+    # for another job meanwhile.
+    ydl: PipelinedYoutubeDL
+    filename: str
+    info: Dict[str, Any] # Shallow copy, so the download thread can't see it change
+    files_to_move: Dict[str, str] = field(default_factory=dict)
+
+    def run(self) -> Dict[str, Any]:
+        """Runs yt-dlp's own post-processing for this file; returns the final info_dict."""
+        with self.ydl.io(IO_MERGE, self.filename):
+            return yt_dlp.YoutubeDL.post_process(self.ydl, self.filename, self.info, self.files_to_move)
+
+
+class PostProcessStage:
+    """
+    Bounded second pipeline stage for merges and conversions.
+
+    Download workers submit() finished files; a few stage threads drain the
+    queue, each driving FFmpeg child processes with the task's own
+    YoutubeDL (see PostProcessTask.ydl). submit() blocks while the
+    queue is full, which stops downloads from running ahead and piling up
+    temporary files the stage can't keep up with.
+    """
+    def __init__(self, run_task: Callable[[PostProcessTask], None], workers: int = DEFAULT_POSTPROCESS_WORKERS, max_queued: int = DEFAULT_POSTPROCESS_QUEUE_SIZE):
+        self.run_task = run_task
+        self._queue: "queue.Queue[PostProcessTask]" = queue.Queue(maxsize=max(1, max_queued)) # Sized as in stage_capacity()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._closed = threading.Event()
+        # --- Counters ---
+        self.submitted = 0
+        self.blocked_seconds = 0.0 # Time download workers spent waiting for queue room
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"yt-dlp-postprocess-{n+1}", daemon=True)
+            for n in range(max(1, min(workers, MAX_POSTPROCESS_WORKERS)))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, task: PostProcessTask, should_stop: Callable[[], bool]) -> bool:
+        """
+        Queues task, waiting for room (backpressure).
+
+        Returns:
+            False if should_stop() became true before the task was queued.
+        """
+        started = time.monotonic()
+        while True:
+            try:
+                self._queue.put(task, timeout=_QUEUE_POLL)
+                break
+            except queue.Full:
+                if should_stop():
+                    return False
+        with self._lock:
+            self.submitted += 1
+            self.blocked_seconds += time.monotonic() - started
+        return True
+
+    def _worker(self):
+        while not self._closed.is_set():
+            try:
+                task = self._queue.get(timeout=_QUEUE_POLL)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self._running += 1
+            try:
+                self.run_task(task) # Reports its own errors
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    def depths(self) -> Dict[str, int]:
+        """Current queue depth and number of tasks being post-processed."""
+        with self._lock:
+            return {'queued': self._queue.qsize(), 'running': self._running}
+
+    def close(self) -> List[PostProcessTask]:
+        """
+        Stops the stage threads after their current task.
+
+        Returns:
+            Tasks that were still queued (only possible after a cancel).
+        """
+        self._closed.set()
+        for t in self._threads:
+            t.join()
+        dropped = []
+        while True:
+            try:
+                dropped.append(self._queue.get_nowait())
+            except queue.Empty:
+                return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'submitted': self.submitted, 'blocked_seconds': round(self.blocked_seconds, 3)}
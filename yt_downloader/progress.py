@@ -0,0 +1,142 @@
+import os
+import threading
+from typing import Dict, Any, Optional, Tuple # For type hinting
+
+
+class ProgressBus:
+    """
+    Coalescing mailbox between download workers and the UI (Tk or CLI).
+
+    Workers overwrite the latest state per item (and the latest status line)
+    under a short lock; the consumer drains whatever changed once per frame.
+    A write that replaces a state the consumer has not drained yet is counted
+    as coalesced, so hook overhead and the work saved can be measured.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._pending_items: Dict[str, Dict[str, Any]] = {}
+        self._pending_status: Optional[Tuple[int, str]] = None
+        self._pending_overall: Optional[Tuple[int, int, int, Dict[str, int]]] = None
+        # --- Counters (read via stats()) ---
+        self.updates_published = 0
+        self.updates_coalesced = 0
+        self.frames_drained = 0
+        self.hook_calls = 0
+        self.hook_seconds = 0.0
+
+    def publish(self, key: str, state: Dict[str, Any]):
+        """Stores the latest raw progress state for one item."""
+        with self._lock:
+            self._seq += 1
+            self.updates_published += 1
+            if self._pending_items.pop(key, None) is not None:
+                self.updates_coalesced += 1
+            state['_seq'] = self._seq
+            self._pending_items[key] = state # Re-insert so the newest item is last
+
+    def set_status(self, message: str):
+        """Stores the latest free-form status line."""
+        with self._lock:
+            self._seq += 1
+            self.updates_published += 1
+            if self._pending_status is not None:
+                self.updates_coalesced += 1
+            self._pending_status = (self._seq, message)
+
+    def set_overall(self, current: int, total: int, active: int = 0, stages: Optional[Dict[str, int]] = None):
+        """Stores the latest overall X/Y counter and per-stage queue depths."""
+        with self._lock:
+            self.updates_published += 1
+            if self._pending_overall is not None:
+                self.updates_coalesced += 1
+            self._pending_overall = (current, total, active, stages or {})
+
+    def record_hook_time(self, seconds: float):
+        """Accumulates time spent inside the yt-dlp progress hook."""
+        with self._lock:
+            self.hook_calls += 1
+            self.hook_seconds += seconds
+
+    def drain(self) -> Tuple[Dict[str, Dict[str, Any]], Optional[Tuple[int, str]], Optional[Tuple[int, int, int, Dict[str, int]]]]:
+        """Returns and clears everything published since the previous drain."""
+        with self._lock:
+            items, self._pending_items = self._pending_items, {}
+            status, self._pending_status = self._pending_status, None
+            overall, self._pending_overall = self._pending_overall, None
+            if items or status or overall:
+                self.frames_drained += 1
+        return items, status, overall
+
+    def reset(self):
+        """Drops pending item/overall state (the last status line is kept)."""
+        with self._lock:
+            self._pending_items.clear()
+            self._pending_overall = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the bus counters."""
+        with self._lock:
+            return {
+                'updates_published': self.updates_published,
+                'updates_coalesced': self.updates_coalesced,
+                'frames_drained': self.frames_drained,
+                'hook_calls': self.hook_calls,
+                'hook_avg_us': (self.hook_seconds / self.hook_calls * 1e6) if self.hook_calls else 0.0,
+            }
+
+
+def format_item_status(state: Dict[str, Any]) -> Tuple[float, str]:
+    """Builds the progress percentage and status line for one item state."""
+    status = state.get('status')
+    filename = os.path.basename(state.get('filename') or '')
+    # Get title from info_dict preferably, fallback to filename
+    title = state.get('title') or (os.path.splitext(filename)[0] if filename else 'Unknown Title')
+
+    # Construct prefix for status messages if part of a playlist download
+    status_prefix = ""
+    playlist_title = state.get('playlist_title')
+    playlist_index = state.get('playlist_index')
+    if playlist_title and playlist_index is not None:
+         status_prefix = f"Playlist '{playlist_title}' ({playlist_index}/{state.get('n_entries') or '?'}): "
+
+    if status == 'downloading':
+        total_bytes = state.get('total_bytes')
+        downloaded_bytes = state.get('downloaded_bytes')
+        if total_bytes and downloaded_bytes:
+            percentage = (downloaded_bytes / total_bytes) * 100
+            speed = state.get('speed')
+            eta = state.get('eta')
+            speed_str = f"{speed / 1024 / 1024:.2f} MB/s" if speed else "..."
+            eta_str = f"{eta}s" if eta is not None else "..." # Handle None eta
+            return percentage, f"Downloading: {status_prefix}{title} | {percentage:.1f}% ({speed_str}, ETA: {eta_str})"
+        # Sometimes only filename is available initially
+        return 0.0, f"Downloading: {status_prefix}{title} (Waiting for size info...)"
+
+    if status == 'finished':
+        # Get final filename from info_dict if possible (often includes path)
+        final_filename = os.path.basename(state.get('filepath') or filename)
+        if not final_filename: # Fallback if filepath isn't in info_dict yet
+             final_filename = title
+        # Reset progress bar for the next file in the loop (or completion)
+        return 0.0, f"Finished: {status_prefix}{final_filename}"
+
+    # status == 'error': include prefix if available, otherwise just title
+    display_name = f"{status_prefix}{title}" if status_prefix else title
+    return 0.0, f"Error downloading: {display_name}"
+
+
+def format_throughput(rate: float, limit: Optional[float] = None) -> str:
+    """Builds the aggregate throughput line, e.g. '3.20 MB/s (limit 4.00 MB/s)'."""
+    text = f"{rate / 1024 / 1024:.2f} MB/s"
+    if limit:
+        text += f" (limit {limit / 1024 / 1024:.2f} MB/s)"
+    return text
+
+
+def format_stage_depths(stages: Dict[str, int]) -> str:
+    """Builds the per-stage queue line, e.g. 'Download: 3 active, 12 queued | Post-process: 1 active, 2 queued'."""
+    parts = [f"Download: {stages.get('downloading', 0)} active, {stages.get('download_queued', 0)} queued"]
+    if 'postprocessing' in stages:
+        parts.append(f"Post-process: {stages['postprocessing']} active, {stages.get('postprocess_queued', 0)} queued")
+    return " | ".join(parts)
@@ -0,0 +1,220 @@
+"""
+Per-item queue state for list views (the GUI's queue table).
+
+Fed from DownloadEngine events and ProgressBus states on the UI thread; has
+no Tk dependency. Rows are keyed by DownloadJob.key().
+"""
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable, Tuple # For type hinting
+
+from .jobs import JOB_PENDING, JOB_EXTRACTING, JOB_DOWNLOADING, JOB_POSTPROCESSING, JOB_DONE, JOB_FAILED, JOB_EXPANDED
+
+# --- Row States (job states plus outcomes only the UI distinguishes) ---
+ROW_QUEUED = JOB_PENDING
+ROW_RETRYING = "retrying"
+ROW_SKIPPED = "skipped" # Already downloaded (DownloadIndex)
+ROW_CANCELLED = "cancelled"
+ROW_PAUSED = "paused" # Transfer stopped by DownloadEngine.pause(), .part file kept
+ROW_STATES = (ROW_QUEUED, JOB_EXTRACTING, JOB_DOWNLOADING, JOB_POSTPROCESSING, ROW_RETRYING, ROW_PAUSED,
+              JOB_DONE, ROW_SKIPPED, JOB_FAILED, ROW_CANCELLED, JOB_EXPANDED)
+ACTIVE_STATES = (JOB_EXTRACTING, JOB_DOWNLOADING, JOB_POSTPROCESSING)
+WAITING_STATES = (ROW_QUEUED, ROW_RETRYING, ROW_PAUSED) # In the engine's queue, no worker yet
+RETRYABLE_STATES = (JOB_FAILED, ROW_CANCELLED)
+CANCELLABLE_STATES = WAITING_STATES + ACTIVE_STATES
+
+SORT_COLUMNS = ('title', 'state', 'percent', 'speed', 'eta', 'size', 'error')
+
+
+@dataclass
+class QueueRow:
+    """Display state of one job."""
+    key: str
+    url: str
+    order: int # Insertion order, the default sort
+    title: Optional[str] = None
+    state: str = ROW_QUEUED
+    percent: Optional[float] = None
+    speed: Optional[float] = None # Bytes/s
+    eta: Optional[int] = None # Seconds
+    size: Optional[int] = None # Bytes (estimate while downloading)
+    error: Optional[str] = None
+    playlist: Optional[str] = None
+
+
+def _format_size(size: Optional[float]) -> str:
+    if not size:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return ""
+
+
+def format_queue_row(row: QueueRow) -> Tuple[str, ...]:
+    """Cell texts for (title, state, %, speed, ETA, size, error)."""
+    title = row.title or row.url
+    if row.playlist:
+        title = f"{row.playlist} > {title}"
+    active = row.state == JOB_DOWNLOADING
+    return (
+        title,
+        row.state,
+        f"{row.percent:.1f}" if row.percent is not None else "",
+        f"{_format_size(row.speed)}/s" if active and row.speed else "",
+        f"{row.eta}s" if active and row.eta is not None else "",
+        _format_size(row.size),
+        row.error or "",
+    )
+
+
+class QueueModel:
+    """
+    Rows for every job of the current batch.
+
+    view() returns the filtered/sorted rows; it is cached until the set of
+    rows or a value that the current sort/filter depends on changes.
+    """
+    def __init__(self):
+        self.rows: Dict[str, QueueRow] = {}
+        self._next_order = 0
+        self.version = 0 # Bumped on any change (repaint needed)
+        self._structure_version = 0 # Bumped when rows are added or change state (re-filter/re-sort needed)
+        self._view_cache: Optional[Tuple[Tuple[Any, ...], List[QueueRow]]] = None
+
+    def clear(self):
+        self.rows.clear()
+        self._next_order = 0
+        self._changed(structure=True)
+
+    def _changed(self, structure: bool = False):
+        self.version += 1
+        if structure:
+            self._structure_version += 1
+
+    def _row(self, key: str, url: str = "") -> QueueRow:
+        row = self.rows.get(key)
+        if row is None:
+            row = QueueRow(key=key, url=url, order=self._next_order)
+            self._next_order += 1
+            self.rows[key] = row
+            self._changed(structure=True)
+        return row
+
+    def add_urls(self, urls: Iterable[str]):
+        """Rows for a batch's input URLs (keys are their positions, as in DownloadJob.key())."""
+        for position, url in enumerate(urls):
+            self._row(str(position), url)
+
+    def _set_state(self, row: QueueRow, state: str):
+        if row.state != state:
+            row.state = state
+            self._changed(structure=True)
+
+    def apply_event(self, event: str, payload: Dict[str, Any]):
+        """Updates rows from a DownloadEngine on_event callback."""
+        key = payload.get('key')
+        if key is None:
+            return # Batch-level event
+        row = self._row(key, payload.get('url') or "")
+        if payload.get('playlist') and not row.playlist:
+            row.playlist = payload['playlist']
+        if event == 'item_started':
+            self._set_state(row, JOB_EXTRACTING)
+            row.error = None
+        elif event == 'item_retry':
+            self._set_state(row, ROW_RETRYING)
+            row.error = payload.get('error')
+            if payload.get('delay') is not None:
+                row.error = f"{row.error} (retry in {payload['delay']:.0f}s)"
+        elif event == 'item_paused':
+            self._set_state(row, ROW_PAUSED)
+            row.speed = row.eta = None
+        elif event == 'item_requeued':
+            self._set_state(row, ROW_QUEUED)
+            row.error = None
+            row.percent = row.speed = row.eta = None
+        elif event == 'item_finished':
+            self._set_state(row, JOB_DONE)
+            row.percent = 100.0
+        elif event == 'item_failed':
+            self._set_state(row, ROW_CANCELLED if payload.get('cancelled') else JOB_FAILED)
+            row.error = payload.get('error')
+        elif event == 'item_skipped':
+            self._set_state(row, ROW_SKIPPED)
+            row.percent = 100.0
+        elif event == 'playlist_expanded':
+            self._set_state(row, JOB_EXPANDED)
+            row.error = None
+            if payload.get('read') is not None: # Streamed, one window at a time
+                row.title = f"{row.url} ({payload['read']}{'+' if payload.get('more') else ''} entries read)"
+            else:
+                row.title = row.title or f"{row.url} ({payload.get('entries')} entries)"
+        self._changed()
+
+    def apply_progress(self, state: Dict[str, Any]):
+        """Updates a row from a ProgressBus item state (see DownloadEngine.progress_hook)."""
+        key = state.get('key')
+        row = self.rows.get(key) if key is not None else None
+        if row is None or row.state in (JOB_DONE, JOB_FAILED, ROW_CANCELLED, ROW_PAUSED):
+            return # Late update for a finished (or parked) job
+        if state.get('title'):
+            row.title = state['title']
+        status = state.get('status')
+        if status == 'downloading':
+            self._set_state(row, JOB_DOWNLOADING)
+            total, downloaded = state.get('total_bytes'), state.get('downloaded_bytes')
+            row.size = total or row.size
+            row.percent = downloaded / total * 100 if total and downloaded is not None else row.percent
+            row.speed, row.eta = state.get('speed'), state.get('eta')
+        elif status == 'finished':
+            self._set_state(row, JOB_POSTPROCESSING)
+            row.percent = 100.0
+        self._changed()
+
+    def mark_cancelling(self, keys: Iterable[str]) -> List[str]:
+        """Shows queued rows as cancelled right away; returns the keys that can be cancelled."""
+        cancellable = []
+        for key in keys:
+            row = self.rows.get(key)
+            if row is None or row.state not in CANCELLABLE_STATES:
+                continue
+            cancellable.append(key)
+            if row.state in WAITING_STATES:
+                self._set_state(row, ROW_CANCELLED) # Dropped from the engine's queue
+        self._changed()
+        return cancellable
+
+    def retryable(self, keys: Iterable[str]) -> List[QueueRow]:
+        return [self.rows[key] for key in keys if key in self.rows and self.rows[key].state in RETRYABLE_STATES]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of rows per state."""
+        counts: Dict[str, int] = {}
+        for row in self.rows.values():
+            counts[row.state] = counts.get(row.state, 0) + 1
+        return counts
+
+    def view(self, state_filter: Optional[str] = None, sort_column: Optional[str] = None, descending: bool = False) -> List[QueueRow]:
+        """
+        Rows matching state_filter (None = all), sorted by sort_column (None = queue order).
+
+        The result is shared with the cache; don't modify it.
+        """
+        cache_key = (self._structure_version if sort_column in (None, 'state') else self.version,
+                     state_filter, sort_column, descending)
+        if self._view_cache is not None and self._view_cache[0] == cache_key:
+            return self._view_cache[1]
+        rows = [row for row in self.rows.values() if state_filter is None or row.state == state_filter]
+        if sort_column is None:
+            rows.sort(key=lambda row: row.order, reverse=descending)
+        elif sort_column == 'title':
+            rows.sort(key=lambda row: (row.title or row.url).lower(), reverse=descending)
+        else:
+            # Empty cells last in either direction
+            missing = [row for row in rows if getattr(row, sort_column) is None]
+            present = [row for row in rows if getattr(row, sort_column) is not None]
+            present.sort(key=lambda row: getattr(row, sort_column), reverse=descending)
+            rows = present + missing
+        self._view_cache = (cache_key, rows)
+        return rows
@@ -0,0 +1,344 @@
+"""
+Error classification, retry backoff, per-site circuit breaking and the
+re-queueable failure report.
+
+Every failed attempt is put into one of the ERROR_* categories. Only
+transient and rate-limited failures are retried; the delay before the next
+attempt grows exponentially with random jitter, so items that failed
+together don't all come back at the same moment. Rate limiting also opens
+the site's circuit (CircuitBreaker), which holds back every queued job for
+that site, not just the one that hit the limit.
+"""
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple # For type hinting
+
+import yt_dlp
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+
+from .state import state_path
+from .storage import InsufficientDiskSpace
+
+DEFAULT_FAILURE_REPORT_FILENAME = "last_failures.json"
+
+# --- Error Categories ---
+ERROR_TRANSIENT = "transient" # Timeouts, dropped connections, 5xx: retried with backoff
+ERROR_RATE_LIMITED = "rate_limited" # HTTP 429, bot checks: retried later, opens the site's circuit
+ERROR_RESTRICTED = "restricted" # Geo-blocked, private, members-only, login or age gates
+ERROR_PERMANENT = "permanent" # Removed, unsupported, no usable format, disk full, post-processing
+ERROR_CANCELLED = "cancelled" # Cancelled by the user
+ERROR_CATEGORIES = (ERROR_TRANSIENT, ERROR_RATE_LIMITED, ERROR_RESTRICTED, ERROR_PERMANENT, ERROR_CANCELLED)
+REQUEUE_CATEGORIES = (ERROR_TRANSIENT, ERROR_RATE_LIMITED) # Worth another batch later by default
+
+# --- Retry Defaults ---
+DEFAULT_TRANSIENT_RETRIES = 3
+DEFAULT_RATE_LIMITED_RETRIES = 5
+DEFAULT_RETRY_BACKOFF = 2.0 # Seconds before the first retry, doubled per attempt
+DEFAULT_RETRY_BACKOFF_MAX = 300.0
+RATE_LIMITED_BACKOFF_FACTOR = 5 # Rate-limited items wait this many times longer
+DEFAULT_BREAKER_COOLDOWN = 30.0 # Seconds a site's circuit stays open after its first rate limit
+MAX_BREAKER_COOLDOWN = 900.0
+MIN_PACE = 0.5 # Start spacing (seconds) below which a recovered site is no longer paced
+
+# Messages checked in this order when the exception itself says nothing (lowercased)
+_MESSAGE_RULES: List[Tuple[str, "re.Pattern[str]"]] = [
+    (ERROR_RATE_LIMITED, re.compile(
+        r"http error 429|too many requests|rate.?limit|not a bot|not a robot|captcha|slow down")),
+    (ERROR_RESTRICTED, re.compile(
+        r"not available (in your country|from your location)|geo.?restrict|private video|members.only"
+        r"|join this channel|confirm your age|age.restricted|inappropriate for some users|login required"
+        r"|requires? (authentication|login|a login)|sign in|log in|premium|payment|purchase"
+        r"|http error 40[13]|forbidden|unauthorized")),
+    (ERROR_PERMANENT, re.compile(
+        r"unsupported url|is not a valid url|video unavailable|has been removed|no longer available|does not exist"
+        r"|account (has been|was) terminated|copyright|no video formats found|requested format is not available"
+        r"|http error 40[04]|http error 410|not found|post-processing|ffmpeg|ffprobe|not enough disk space")),
+    (ERROR_TRANSIENT, re.compile(
+        r"timed? ?out|connection (reset|refused|aborted)|remote end closed|incomplete ?read|broken pipe"
+        r"|temporary failure|name resolution|network is unreachable|ssl|eof occurred|http error 5\d\d"
+        r"|content too short|did not get any data|giving up after")),
+]
+
+
+def _exception_chain(exc: BaseException) -> Iterable[BaseException]:
+    """exc and the errors it wraps (DownloadError.exc_info, ExtractorError.cause, __cause__/__context__)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        wrapped = getattr(exc, 'exc_info', None)
+        if isinstance(wrapped, tuple) and len(wrapped) > 1 and isinstance(wrapped[1], BaseException):
+            exc = wrapped[1]
+        elif isinstance(getattr(exc, 'cause', None), BaseException):
+            exc = exc.cause
+        else:
+            exc = exc.__cause__ or exc.__context__
+
+
+def _classify_exception(exc: BaseException) -> Optional[str]:
+    """Category from the exception type alone (None if it doesn't tell)."""
+    if isinstance(exc, yt_dlp.utils.GeoRestrictedError):
+        return ERROR_RESTRICTED
+    if isinstance(exc, (yt_dlp.utils.UnsupportedError, InsufficientDiskSpace, yt_dlp.utils.PostProcessingError)):
+        return ERROR_PERMANENT
+    if isinstance(exc, HTTPError):
+        if exc.status == 429:
+            return ERROR_RATE_LIMITED
+        if exc.status in (401, 403):
+            return ERROR_RESTRICTED
+        if exc.status in (404, 410):
+            return ERROR_PERMANENT
+        if exc.status >= 500 or exc.status == 408:
+            return ERROR_TRANSIENT
+        return None
+    if isinstance(exc, (TransportError, TimeoutError, ConnectionError, socket.timeout, socket.gaierror,
+                        http.client.IncompleteRead, yt_dlp.utils.ContentTooShortError)):
+        return ERROR_TRANSIENT
+    return None
+
+
+def classify_error(exc: BaseException, default: str = ERROR_TRANSIENT) -> str:
+    """
+    Puts a failed attempt's exception into an ERROR_* category.
+
+    The exception and the errors it wraps are checked first (HTTP status,
+    geo restriction, network errors), then the message of the outermost
+    one, which is what yt-dlp puts its own explanations in.
+
+    Args:
+        exc: The error the attempt failed with.
+        default: Category for errors nothing matches (unknown extraction
+            and download errors are assumed to be worth a retry).
+    """
+    for error in _exception_chain(exc):
+        category = _classify_exception(error)
+        if category is not None:
+            return category
+    return classify_message(str(exc), default)
+
+
+def classify_message(message: str, default: str = ERROR_TRANSIENT) -> str:
+    """Category for an error message (e.g. a failure loaded from a report)."""
+    message = message.lower()
+    for category, pattern in _MESSAGE_RULES:
+        if pattern.search(message):
+            return category
+    return default
+
+
+@dataclass
+class RetryPolicy:
+    """How often, and after how long, failed items are tried again."""
+    transient_retries: int = DEFAULT_TRANSIENT_RETRIES
+    rate_limited_retries: int = DEFAULT_RATE_LIMITED_RETRIES
+    backoff: float = DEFAULT_RETRY_BACKOFF # Seconds before the first retry
+    backoff_max: float = DEFAULT_RETRY_BACKOFF_MAX
+
+    def delay(self, category: str, attempts: int) -> Optional[float]:
+        """
+        Seconds to wait before the next attempt of an item.
+
+        The cap doubles with every attempt (backoff, 2*backoff, 4*backoff, ...
+        up to backoff_max, rate-limited items RATE_LIMITED_BACKOFF_FACTOR
+        times longer); the delay is drawn from the upper half of it ("equal
+        jitter"), so it never drops to zero.
+
+        Args:
+            category: ERROR_* category of the attempt that just failed.
+            attempts: Attempts made so far (1 after the first failure).
+
+        Returns:
+            The delay, or None if the item shouldn't be retried.
+        """
+        if category == ERROR_TRANSIENT:
+            retries, base = self.transient_retries, self.backoff
+        elif category == ERROR_RATE_LIMITED:
+            retries, base = self.rate_limited_retries, self.backoff * RATE_LIMITED_BACKOFF_FACTOR
+        else:
+            return None
+        if attempts > retries:
+            return None
+        cap = min(self.backoff_max, base * 2 ** (attempts - 1))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+
+@dataclass
+class _Circuit:
+    """Throttling state of one site."""
+    trips: int = 0 # Consecutive rate-limit trips without a success in between
+    open_until: float = 0.0 # time.monotonic() the cooldown ends
+    half_open: bool = False # Cooldown over, waiting for a probe job to succeed
+    probing: bool = False # The probe job is running
+    pace: float = 0.0 # Minimum seconds between job starts
+    last_start: float = 0.0
+
+
+class CircuitBreaker:
+    """
+    Per-site throttle that slows the whole queue down once a site rate-limits.
+
+    A rate-limited failure opens the site's circuit: no job for it starts
+    until a cooldown has passed (doubling with every consecutive trip, with
+    jitter, up to max_cooldown). Then a single probe job may start
+    (half-open); while it runs, other jobs for the site wait. If the probe
+    succeeds the circuit closes, but job starts for that site stay spaced
+    out by a pacing interval that halves with every success, so the queue
+    ramps back up instead of hammering the site again. Jobs for other sites
+    are not affected.
+    """
+    def __init__(self, cooldown: float = DEFAULT_BREAKER_COOLDOWN, max_cooldown: float = MAX_BREAKER_COOLDOWN,
+                 on_change: Optional[Callable[[str, str, float], None]] = None):
+        """
+        Args:
+            cooldown: Seconds the circuit stays open after the first trip (0 disables the breaker).
+            max_cooldown: Upper bound for the doubled cooldowns.
+            on_change: Called as on_change('open' or 'closed', site, cooldown seconds).
+        """
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._circuits: Dict[str, _Circuit] = {}
+        # --- Counters ---
+        self.trips = 0
+        self.open_seconds = 0.0 # Sum of the cooldowns
+
+    def try_start(self, site: str, now: Optional[float] = None) -> bool:
+        """True if a job for site may start now (it is then counted as started)."""
+        if self.cooldown <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            circuit = self._circuits.get(site)
+            if circuit is None:
+                return True
+            if now < circuit.open_until or (circuit.half_open and circuit.probing) or now - circuit.last_start < circuit.pace:
+                return False
+            if circuit.half_open:
+                circuit.probing = True
+            circuit.last_start = now
+            return True
+
+    def finished(self, site: str, category: Optional[str]):
+        """
+        Records how a job for site ended.
+
+        Args:
+            category: None for a success, else the failure's ERROR_* category
+                (ERROR_CANCELLED for jobs that were stopped, which says nothing
+                about the site).
+        """
+        if self.cooldown <= 0:
+            return
+        change: Optional[Tuple[str, float]] = None
+        with self._lock:
+            circuit = self._circuits.get(site)
+            now = time.monotonic()
+            if category == ERROR_RATE_LIMITED:
+                if circuit is None:
+                    circuit = self._circuits[site] = _Circuit()
+                if now < circuit.open_until:
+                    return # Already open: jobs that were running when it tripped don't extend it
+                circuit.trips += 1
+                cooldown = min(self.max_cooldown, self.cooldown * 2 ** (circuit.trips - 1))
+                cooldown *= random.uniform(0.8, 1.2)
+                circuit.open_until = now + cooldown
+                circuit.half_open = True
+                circuit.probing = False
+                circuit.pace = max(circuit.pace, cooldown / 10)
+                self.trips += 1
+                self.open_seconds += cooldown
+                change = ('open', cooldown)
+            elif circuit is not None:
+                if circuit.half_open:
+                    circuit.probing = False # Another probe may start
+                    if category is None:
+                        circuit.half_open = False
+                        circuit.trips = 0
+                        change = ('closed', 0.0)
+                if category is None:
+                    circuit.pace = circuit.pace / 2 if circuit.pace / 2 >= MIN_PACE else 0.0
+                    if not circuit.half_open and circuit.pace == 0.0:
+                        del self._circuits[site]
+        if change is not None and self.on_change is not None:
+            self.on_change(change[0], site, change[1])
+
+    def reset(self):
+        """Closes every circuit and clears the counters for a new batch."""
+        with self._lock:
+            self._circuits.clear()
+            self.trips = 0
+            self.open_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'trips': self.trips, 'open_seconds': round(self.open_seconds, 1),
+                'open_sites': sorted(site for site, c in self._circuits.items() if c.open_until > now),
+                'paced_sites': sorted(site for site, c in self._circuits.items() if c.pace > 0),
+            }
+
+
+# --- Failure Report ---
+
+def default_report_path() -> str:
+    return state_path(DEFAULT_FAILURE_REPORT_FILENAME)
+
+
+def write_failure_report(path: str, failures: List[Dict[str, Any]], batch_id: Optional[int] = None,
+                         download_path: Optional[str] = None) -> str:
+    """
+    Saves a batch's final failures as JSON (written to a temp file, then renamed).
+
+    Args:
+        failures: BatchResult.failed_items ('item', 'error', 'category', ...).
+
+    Returns:
+        path
+    """
+    report = {
+        'created_at': time.time(), 'batch_id': batch_id, 'download_path': download_path,
+        'counts': count_by_category(failures), 'failures': failures,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_failure_report(path: str, categories: Iterable[str] = REQUEUE_CATEGORIES) -> List[str]:
+    """
+    URLs of a failure report's items in the given categories, for a new batch.
+
+    Raises:
+        OSError, ValueError: The report can't be read or isn't a failure report.
+    """
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    if not isinstance(report, dict) or not isinstance(report.get('failures'), list):
+        raise ValueError(f"{path} is not a failure report")
+    wanted = set(categories)
+    urls: Dict[str, None] = {} # Ordered set
+    for failure in report['failures']:
+        category = failure.get('category') or classify_message(failure.get('error', ''))
+        if category in wanted and failure.get('item'):
+            urls[failure['item']] = None
+    return list(urls)
+
+
+def count_by_category(failures: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Failures per ERROR_* category, in ERROR_CATEGORIES order."""
+    counts = {category: 0 for category in ERROR_CATEGORIES}
+    for failure in failures:
+        category = failure.get('category') or classify_message(failure.get('error', ''))
+        counts[category] = counts.get(category, 0) + 1
+    return {category: n for category, n in counts.items() if n}
@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Callable, Deque, Iterable, Tuple # For type hinting
+from urllib.parse import urlsplit
+
+from yt_dlp.utils import parse_bytes
+
+BURST_SECONDS = 1.0 # Bucket capacity, in seconds of the current rate
+MIN_BURST_BYTES = 64 * 1024
+THROUGHPUT_WINDOW = 3.0 # Seconds averaged for the aggregate throughput
+SLEEP_SLICE = 0.2 # Throttled threads re-check cancellation this often
+
+_PROFILE_PATTERN = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\S+)\s*$")
+_UNLIMITED = ('0', 'none', 'off', 'unlimited')
+# Hosts that serve the same site under another name
+_HOST_ALIASES = {'youtu.be': 'youtube.com', 'music.youtube.com': 'youtube.com'}
+
+
+def parse_rate(text: str) -> Optional[float]:
+    """
+    Parses a rate such as '2M', '500K' or '1048576' (bytes per second).
+
+    Returns:
+        The rate, or None for '0'/'unlimited'. Raises ValueError if malformed.
+    """
+    text = text.strip()
+    if text.lower() in _UNLIMITED:
+        return None
+    rate = parse_bytes(text)
+    if rate is None or rate <= 0:
+        raise ValueError(f"Invalid rate: {text!r} (expected e.g. 500K, 2M or unlimited)")
+    return float(rate)
+
+
+@dataclass
+class BandwidthProfile:
+    """Rate limit applied during a daily time window (local time, may wrap past midnight)."""
+    start_minute: int # Minutes after midnight, inclusive
+    end_minute: int # Exclusive; <= start_minute means the window wraps past midnight
+    rate: Optional[float] # Bytes/s, None = unlimited
+
+    @classmethod
+    def parse(cls, text: str) -> "BandwidthProfile":
+        """Parses 'HH:MM-HH:MM=RATE', e.g. '09:00-18:00=2M' or '18:00-09:00=unlimited'."""
+        match = _PROFILE_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Invalid bandwidth profile: {text!r} (expected HH:MM-HH:MM=RATE)")
+        start_h, start_m, end_h, end_m, rate = match.groups()
+        if int(start_h) > 23 or int(end_h) > 24 or int(start_m) > 59 or int(end_m) > 59:
+            raise ValueError(f"Invalid time in bandwidth profile: {text!r}")
+        return cls(int(start_h) * 60 + int(start_m), int(end_h) * 60 + int(end_m), parse_rate(rate))
+
+    def covers(self, minute: int) -> bool:
+        if self.end_minute > self.start_minute:
+            return self.start_minute <= minute < self.end_minute
+        return minute >= self.start_minute or minute < self.end_minute
+
+
+def host_key(url: str) -> str:
+    """Host a job connects to, normalized so 'www.youtube.com' and 'youtu.be' share a slot pool."""
+    host = (urlsplit(url if '://' in url else f"https://{url}").hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return _HOST_ALIASES.get(host, host)
+
+
+class BandwidthScheduler:
+    """
+    Global token bucket shared by every active download.
+
+    Workers report the bytes they received from the progress hook (which
+    yt-dlp calls synchronously after every block) and sleep there while the
+    bucket is in debt, so the sum of all transfers stays at the current
+    limit. The limit comes from the first time-of-day profile covering the
+    current local time, else the default rate. Aggregate throughput over the
+    last few seconds is tracked for the status bar, limited or not.
+    """
+    def __init__(self, rate: Optional[float] = None, profiles: Iterable[BandwidthProfile] = ()):
+        self.default_rate = rate
+        self.profiles: List[BandwidthProfile] = list(profiles)
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self._window: Deque[Tuple[float, int]] = deque() # (monotonic time, bytes)
+        self._window_bytes = 0
+        # --- Counters ---
+        self.total_bytes = 0
+        self.throttled_seconds = 0.0
+
+    def current_limit(self, now: Optional[float] = None) -> Optional[float]:
+        """Rate limit in effect at wall-clock time now (bytes/s, None = unlimited)."""
+        if self.profiles:
+            local = time.localtime(now)
+            minute = local.tm_hour * 60 + local.tm_min
+            for profile in self.profiles:
+                if profile.covers(minute):
+                    return profile.rate
+        return self.default_rate
+
+    def consume(self, nbytes: int, should_stop: Optional[Callable[[], bool]] = None):
+        """
+        Takes nbytes from the bucket, sleeping while it is in debt.
+
+        Args:
+            nbytes: Bytes just received by the calling download.
+            should_stop: Polled while sleeping; returning True ends the wait early.
+        """
+        if nbytes <= 0:
+            return
+        rate = self.current_limit()
+        with self._lock:
+            now = time.monotonic()
+            self._record_locked(now, nbytes)
+            if rate is None:
+                self._tokens = 0.0
+                self._last_refill = now
+                return
+            capacity = max(rate * BURST_SECONDS, MIN_BURST_BYTES)
+            self._tokens = min(capacity, self._tokens + (now - self._last_refill) * rate)
+            self._last_refill = now
+            self._tokens -= nbytes # May go negative: later callers wait for the debt too
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait <= 0:
+            return
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (should_stop is not None and should_stop()):
+                break
+            time.sleep(min(remaining, SLEEP_SLICE))
+        with self._lock:
+            self.throttled_seconds += wait
+
+    def _record_locked(self, now: float, nbytes: int):
+        self.total_bytes += nbytes
+        self._window.append((now, nbytes))
+        self._window_bytes += nbytes
+        self._expire_locked(now)
+
+    def _expire_locked(self, now: float):
+        while self._window and now - self._window[0][0] > THROUGHPUT_WINDOW:
+            self._window_bytes -= self._window.popleft()[1]
+
+    def throughput(self) -> float:
+        """Aggregate transfer rate of all downloads over the last few seconds (bytes/s)."""
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            return self._window_bytes / THROUGHPUT_WINDOW
+
+    def reset(self):
+        """Clears the bucket and counters for a new batch."""
+        with self._lock:
+            self._tokens = 0.0
+            self._last_refill = time.monotonic()
+            self._window.clear()
+            self._window_bytes = 0
+            self.total_bytes = 0
+            self.throttled_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        limit = self.current_limit()
+        with self._lock:
+            return {
+                'limit': limit, 'total_bytes': self.total_bytes,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+            }
+
+
+class HostLimiter:
+    """
+    Caps how many jobs talk to the same host at once (0 = no cap).
+
+    Slots are taken when a job is handed to a worker and released when it
+    finishes, so the engine can pick a job for another host instead of
+    blocking a worker on a busy one.
+    """
+    def __init__(self, max_per_host: int = 0):
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+
+    def try_acquire(self, host: str) -> bool:
+        with self._lock:
+            count = self._active.get(host, 0)
+            if self.max_per_host > 0 and count >= self.max_per_host:
+                return False
+            self._active[host] = count + 1
+            return True
+
+    def release(self, host: str):
+        with self._lock:
+            count = self._active.get(host, 0) - 1
+            if count > 0:
+                self._active[host] = count
+            else:
+                self._active.pop(host, None)
+
+    def active(self) -> Dict[str, int]:
+        """Current number of jobs per host."""
+        with self._lock:
+            return dict(self._active)
@@ -0,0 +1,17 @@
+import os
+
+# Per-user directory for the index, caches and journals. Override with the
+# YT_DOWNLOADER_STATE_DIR environment variable (e.g. on shared batch boxes).
+STATE_DIR_ENV = "YT_DOWNLOADER_STATE_DIR"
+
+
+def state_dir() -> str:
+    """Returns (and creates) the directory holding persistent app state."""
+    path = os.environ.get(STATE_DIR_ENV) or os.path.join(os.path.expanduser("~"), ".yt_downloader")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def state_path(filename: str) -> str:
+    """Absolute path of a file inside the state directory."""
+    return os.path.join(state_dir(), filename)
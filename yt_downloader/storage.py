@@ -0,0 +1,271 @@
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Callable, Tuple # For type hinting
+
+import yt_dlp
+from yt_dlp.utils import parse_bytes
+
+DEFAULT_MIN_FREE_SPACE = 512 * 1024 * 1024 # Bytes left free on every volume a batch writes to
+WAIT_SLICE = 0.2 # Waiting threads re-check cancellation this often
+
+# --- I/O Kinds (capped separately per volume) ---
+IO_WRITE = "write" # A file download writing its .part file
+IO_MERGE = "merge" # Post-processing: merges, conversions and the move to the output folder
+
+SlotToken = Tuple[str, Optional[int]] # (kind, volume); volume None = uncapped
+
+
+class InsufficientDiskSpace(yt_dlp.utils.DownloadError):
+    """A job's estimated size doesn't fit on a volume, even with no other job in flight."""
+
+
+def volume_of(path: str) -> int:
+    """Device id of the filesystem path is on (or would be created on)."""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+
+def estimate_size(info: Dict[str, Any]) -> Optional[int]:
+    """
+    Bytes yt-dlp will download for a processed info_dict.
+
+    Uses filesize, else filesize_approx, of every requested format (both
+    halves of a video+audio merge). None if any of them is unknown.
+    """
+    total = 0
+    for fmt in info.get('requested_formats') or [info]:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size:
+            return None
+        total += int(size)
+    return total
+
+
+def parse_size(text: str) -> int:
+    """Parses a size such as '2G', '500M' or '0' (bytes). Raises ValueError if malformed."""
+    size = parse_bytes(text.strip())
+    if size is None or size < 0:
+        raise ValueError(f"Invalid size: {text!r} (expected e.g. 500M or 2G)")
+    return size
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return ""
+
+
+@dataclass
+class Reservation:
+    """Bytes a running job is expected to write, per volume."""
+    needs: Dict[int, int] # Volume -> bytes
+    download_volume: int # Volume the .part files go to
+    written: Callable[[], int] # Bytes downloaded so far, already taken from download_volume's free space
+
+    def outstanding(self, volume: int) -> int:
+        """Bytes still to be written to volume."""
+        need = self.needs.get(volume, 0)
+        if volume == self.download_volume:
+            need -= self.written()
+        return max(0, need)
+
+
+class DiskGuard:
+    """
+    Per-volume admission control and I/O concurrency caps.
+
+    reserve() is called once a job's formats are chosen and before anything
+    is written: its estimated bytes must fit into the volume's free space,
+    minus min_free and minus what jobs admitted earlier still have to write.
+    A job that doesn't fit waits for those jobs to finish; with nothing else
+    in flight on that volume it fails with InsufficientDiskSpace instead of
+    filling the disk partway through a playlist.
+
+    acquire_slot() caps concurrent file downloads (IO_WRITE) and
+    post-processing runs (IO_MERGE) writing to the same volume, so merges
+    onto a slow disk don't compete with each other and with transfers
+    (0 = no cap).
+    """
+    def __init__(self, min_free: int = DEFAULT_MIN_FREE_SPACE, max_writes: int = 0, max_merges: int = 0):
+        self.min_free = min_free
+        self.limits = {IO_WRITE: max_writes, IO_MERGE: max_merges}
+        self._cond = threading.Condition()
+        self._reservations: Dict[str, Reservation] = {} # Job key -> reservation
+        self._volume_paths: Dict[int, str] = {} # For messages and disk_usage()
+        self._slots: Dict[Tuple[str, int], int] = {} # (kind, volume) -> running
+        # --- Counters ---
+        self.admitted = 0
+        self.rejected = 0
+        self.admission_waits = 0
+        self.admission_wait_seconds = 0.0
+        self.slot_waits = 0
+        self.slot_wait_seconds = 0.0
+        self.peak_reserved = 0
+
+    def plan(self, size: int, download_dir: str, output_dir: str, creates_file: bool) -> Tuple[Dict[int, int], int]:
+        """
+        Bytes per volume for a download of size bytes.
+
+        Args:
+            size: Estimated download size (0 if unknown: only min_free is checked).
+            download_dir: Where .part and intermediate files go (scratch dir or output dir).
+            output_dir: Where the final file ends up.
+            creates_file: A merge or conversion writes a new file next to the
+                downloaded ones (so the download volume needs room for both).
+
+        Returns:
+            (needs, download_volume) for reserve().
+        """
+        download_volume = volume_of(download_dir)
+        output_volume = volume_of(output_dir)
+        with self._cond:
+            self._volume_paths.setdefault(download_volume, download_dir)
+            self._volume_paths.setdefault(output_volume, output_dir)
+        needs = {download_volume: size * 2 if creates_file else size}
+        if output_volume != download_volume:
+            needs[output_volume] = size # Moved (copied) across volumes at the end
+        return needs, download_volume
+
+    def _shortfall_locked(self, key: str, needs: Dict[int, int]) -> Optional[Tuple[str, bool]]:
+        """(message, others_in_flight) for the first volume needs don't fit on, else None."""
+        for volume, need in needs.items():
+            others = [r for k, r in self._reservations.items() if k != key and volume in r.needs]
+            committed = sum(r.outstanding(volume) for r in others)
+            free = shutil.disk_usage(self._volume_paths[volume]).free
+            if need <= free - committed - self.min_free:
+                continue
+            message = f"Not enough disk space on {self._volume_paths[volume]}: {_format_bytes(free)} free"
+            if committed:
+                message += f", {_format_bytes(committed)} reserved by running downloads"
+            if need:
+                message += f", needs about {_format_bytes(need)}"
+            message += f" (keeping {_format_bytes(self.min_free)} free)"
+            return message, bool(others)
+        return None
+
+    def reserve(self, key: str, needs: Dict[int, int], download_volume: int, written: Callable[[], int],
+                should_stop: Callable[[], bool], on_wait: Optional[Callable[[str], None]] = None) -> bool:
+        """
+        Admits a job, waiting while jobs already admitted hold the space it needs.
+
+        A second reservation for the same key (e.g. another video of a
+        multi-video item) adds to the first.
+
+        Args:
+            key: DownloadJob.key(), for release().
+            needs, download_volume: From plan().
+            written: Returns the bytes the job has downloaded so far.
+            should_stop: Polled while waiting; returning True gives up.
+            on_wait: Called once with a message if the job has to wait.
+
+        Returns:
+            False if should_stop() became true while waiting.
+
+        Raises:
+            InsufficientDiskSpace: The job can't fit even once the others are done.
+        """
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            previous = self._reservations.get(key)
+            if previous is not None:
+                needs = {volume: needs.get(volume, 0) + previous.needs.get(volume, 0) for volume in set(needs) | set(previous.needs)}
+            while True:
+                shortfall = self._shortfall_locked(key, needs)
+                if shortfall is None:
+                    break
+                message, others = shortfall
+                if not others:
+                    self.rejected += 1
+                    raise InsufficientDiskSpace(message)
+                if should_stop():
+                    return False
+                if not waited:
+                    waited = True
+                    self.admission_waits += 1
+                    if on_wait is not None:
+                        on_wait(f"{message}; waiting for running downloads")
+                self._cond.wait(WAIT_SLICE)
+            self._reservations[key] = Reservation(needs, download_volume, written)
+            self.admitted += 1
+            reserved = sum(sum(r.needs.values()) for r in self._reservations.values())
+            self.peak_reserved = max(self.peak_reserved, reserved)
+            if waited:
+                self.admission_wait_seconds += time.monotonic() - started
+        return True
+
+    def release(self, key: str):
+        """Drops a job's reservation (its files are written, or it stopped)."""
+        with self._cond:
+            if self._reservations.pop(key, None) is not None:
+                self._cond.notify_all()
+
+    def acquire_slot(self, kind: str, path: str, should_stop: Callable[[], bool]) -> Optional[SlotToken]:
+        """
+        Waits for a free IO_WRITE/IO_MERGE slot on the volume path is on.
+
+        Returns:
+            A token for release_slot(), or None if should_stop() became true.
+        """
+        limit = self.limits[kind]
+        if limit <= 0:
+            return (kind, None)
+        volume = volume_of(os.path.dirname(os.path.abspath(path)))
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while self._slots.get((kind, volume), 0) >= limit:
+                if should_stop():
+                    return None
+                waited = True
+                self._cond.wait(WAIT_SLICE)
+            self._slots[(kind, volume)] = self._slots.get((kind, volume), 0) + 1
+            if waited:
+                self.slot_waits += 1
+                self.slot_wait_seconds += time.monotonic() - started
+        return (kind, volume)
+
+    def release_slot(self, token: SlotToken):
+        kind, volume = token
+        if volume is None:
+            return
+        with self._cond:
+            self._slots[(kind, volume)] -= 1
+            self._cond.notify_all()
+
+    def reserved(self) -> Dict[str, int]:
+        """Bytes admitted jobs still have to write, per volume path."""
+        with self._cond:
+            return {path: sum(r.outstanding(volume) for r in self._reservations.values())
+                    for volume, path in self._volume_paths.items()}
+
+    def reset(self):
+        """Clears reservations and counters for a new batch."""
+        with self._cond:
+            self._reservations.clear()
+            self._slots.clear()
+            self.admitted = self.rejected = self.admission_waits = self.slot_waits = 0
+            self.admission_wait_seconds = self.slot_wait_seconds = 0.0
+            self.peak_reserved = 0
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'admitted': self.admitted, 'rejected': self.rejected,
+                'admission_waits': self.admission_waits, 'admission_wait_seconds': round(self.admission_wait_seconds, 3),
+                'slot_waits': self.slot_waits, 'slot_wait_seconds': round(self.slot_wait_seconds, 3),
+                'peak_reserved_bytes': self.peak_reserved,
+            }
@@ -0,0 +1,159 @@
+"""
+Streaming playlist expansion with bounded memory.
+
+By default a playlist is expanded into one job per entry up front, and
+yt-dlp's PlaylistEntries caches every entry (and every fetched page) while
+doing so, so memory grows with the playlist's length. With a window size
+set (DownloadOptions.playlist_window), the engine instead reads a fixed
+number of entries at a time, without caching what it already read, and
+queues a continuation job behind them that reads the next window once a
+worker reaches it. Finished entries are reduced to an ItemRecord.
+
+Lazy entries fetch their pages through the YoutubeDL that extracted them,
+and the continuation job runs on whichever worker picks it up, so a
+streamed playlist is extracted with a YoutubeDL of its own that no worker
+downloads with. Reading without the caches relies on yt-dlp internals of
+PagedList and LazyList; streamable() checks they are there, and the engine
+expands the playlist up front otherwise.
+"""
+import threading
+from typing import List, Dict, Any, Optional, Iterator, NamedTuple, Tuple # For type hinting
+
+import yt_dlp
+from yt_dlp.utils import LazyList, PagedList
+
+WINDOW_START_KEY = 'playlist_window_start' # extra_info of continuation jobs: index of the next entry to read
+
+# --- Record States (finished entries) ---
+RECORD_DONE = "done"
+RECORD_FAILED = "failed"
+RECORD_SKIPPED = "skipped" # Already downloaded (DownloadIndex)
+RECORD_CANCELLED = "cancelled"
+
+
+class ItemRecord(NamedTuple):
+    """What is kept of a streamed playlist entry once it finished."""
+    id: Optional[str]
+    index: int # playlist_index
+    title: Optional[str]
+    state: str # RECORD_*
+
+
+def playlist_entries(playlist: Dict[str, Any]) -> Any:
+    """playlist['entries'] (or []), without truth-testing it: bool() of a PagedList fetches its first page."""
+    entries = playlist.get('entries')
+    return [] if entries is None else entries
+
+
+def streamable(entries: Any) -> bool:
+    """False if iter_entries() can't read entries without its cache in this yt-dlp version."""
+    if isinstance(entries, PagedList):
+        return hasattr(entries, '_use_cache') and callable(getattr(entries, '_getslice', None))
+    if isinstance(entries, LazyList):
+        return hasattr(entries, '_cache') and hasattr(entries, '_iterable')
+    return True
+
+
+def iter_entries(entries: Any, start: int = 1) -> Iterator[Tuple[int, Any]]:
+    """
+    Yields (playlist_index, entry) from index start on, keeping nothing
+    (entries must be streamable()).
+
+    Generators are consumed as they are; paged lists are walked page by
+    page with their page cache turned off (pages before start are skipped
+    without being fetched). Entries that are already a list are in memory
+    anyway and just indexed.
+    """
+    if isinstance(entries, PagedList):
+        entries._use_cache = False # Otherwise every fetched page is kept for random access
+        yield from enumerate(entries._getslice(start - 1, None), start=start)
+        return
+    if isinstance(entries, (list, tuple)):
+        for index in range(start, len(entries) + 1):
+            yield index, entries[index - 1]
+        return
+    if isinstance(entries, LazyList) and not entries._cache:
+        entries = entries._iterable # Read past its cache
+    for index, entry in enumerate(entries, start=1):
+        if index >= start:
+            yield index, entry
+
+
+class PlaylistStream:
+    """
+    Read position and finished-entry records of one streamed playlist.
+
+    Only the playlist's continuation job reads from it (there is one at a
+    time); records are added by whichever worker finishes an entry.
+    """
+    def __init__(self, url: str, context: Dict[str, Any], entries: Any, start: int = 1, playlist_count: Optional[int] = None,
+                 ie_key: Optional[str] = None, ydl: Optional[yt_dlp.YoutubeDL] = None):
+        self.url = url
+        self.ydl = ydl # Extracted the playlist and fetches its pages (None for entries already in a list)
+        self.context = context # playlist_context() of the playlist, shared by all its jobs
+        self.playlist_count = playlist_count
+        self.ie_key = ie_key
+        self.next_index = start
+        self.windows = 0
+        self.exhausted = False
+        self.records: Dict[int, ItemRecord] = {} # playlist_index -> record; a retried entry replaces its record
+        self._iter: Optional[Iterator[Tuple[int, Any]]] = iter_entries(entries, start)
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> bool:
+        """False once reading failed (the playlist has to be extracted again)."""
+        return self._iter is not None
+
+    def reopen(self, entries: Any):
+        """Continues from next_index in a fresh extraction of the playlist (by self.ydl)."""
+        self._iter = iter_entries(entries, self.next_index)
+
+    def close(self):
+        """Stops reading (the playlist is exhausted or the batch is over) and closes self.ydl."""
+        entries_iter, self._iter = self._iter, None
+        if entries_iter is not None:
+            entries_iter.close()
+        if self.ydl is not None:
+            self.ydl.close()
+            self.ydl = None
+
+    def read_window(self, size: int) -> List[Tuple[int, Any]]:
+        """
+        Up to size entries; fewer means the playlist is exhausted.
+
+        Raises:
+            Whatever the extractor raises while fetching a page; the stream
+            is closed then and has to be reopened.
+        """
+        window = []
+        first = self.next_index
+        try:
+            for index, entry in self._iter:
+                self.next_index = index + 1
+                if entry:
+                    window.append((index, entry))
+                if len(window) >= size:
+                    break
+            else:
+                self.exhausted = True
+        except Exception:
+            self._iter = None # A generator that raised is finished
+            self.next_index = first # The entries read so far weren't queued
+            raise
+        self.windows += 1
+        return window
+
+    def record(self, video_id: Optional[str], index: int, title: Optional[str], state: str):
+        with self._lock:
+            self.records[index] = ItemRecord(video_id, index, title, state)
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts for the batch_finished event (the records themselves stay in BatchResult.items)."""
+        with self._lock:
+            states: Dict[str, int] = {}
+            for record in self.records.values():
+                states[record.state] = states.get(record.state, 0) + 1
+        return {'playlist': self.context.get('playlist'), 'url': self.url, 'entries_read': self.next_index - 1,
+                'windows': self.windows, 'exhausted': self.exhausted, 'states': states}
+
@@ -0,0 +1,475 @@
+"""
+Subscriptions: playlists and channels re-synced on a schedule.
+
+Every subscribed source keeps a high-water mark: the ids of the newest known
+entries of each of its lists and the latest upload date seen. A sync
+extracts the source without resolving it and walks its entries lazily,
+newest first (the order of channel tabs and most upload lists), stopping at
+the first entry it already knows.
+For paged extractors this means later pages are never fetched, and only the
+new entries are extracted and downloaded, through the regular DownloadEngine
+(index, retries, bandwidth limits and journal included).
+
+New entries are kept in the store until they were downloaded, so an item
+that failed (or a sync that was cancelled) is picked up by the next sync
+even though the mark already moved past it.
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Optional, Callable, Iterable, Set, Tuple # For type hinting
+
+import yt_dlp
+from yt_dlp.utils import PlaylistEntries
+
+from .engine import DownloadOptions, DownloadEngine, BatchResult, EventCallback, playlist_context
+from .jobs import DownloadJob
+from .progress import ProgressBus
+from .retry import REQUEUE_CATEGORIES
+from .state import state_path
+
+DEFAULT_SUBSCRIPTIONS_FILENAME = "subscriptions.sqlite3"
+DEFAULT_SYNC_INTERVAL = 3600.0 # Seconds between two syncs of the same source
+MIN_SYNC_INTERVAL = 60.0
+DEFAULT_MAX_CONCURRENT_SYNCS = 2 # Sources scanned at the same time
+MAX_CONCURRENT_SYNCS = 8
+HEAD_IDS = 50 # Newest known entry ids kept per list (the mark survives deleted or privated videos)
+MAX_SYNC_ATTEMPTS = 3 # Syncs a new item is tried in before it's given up
+NESTED_DEPTH = 1 # Channel pages list their tabs (videos, shorts, live) as nested playlists
+
+
+@dataclass
+class SyncEntry:
+    """A new entry found by a scan, not downloaded yet."""
+    video_id: str
+    url: str
+    ie_key: Optional[str] = None
+    title: Optional[str] = None
+    extra_info: Dict[str, Any] = field(default_factory=dict) # Playlist fields for the output template
+
+
+@dataclass
+class ScanResult:
+    """What scan_source() found in one source."""
+    url: str
+    title: Optional[str] = None
+    entries: List[SyncEntry] = field(default_factory=list) # New entries, newest first
+    head_ids: Dict[str, List[str]] = field(default_factory=dict) # List (playlist id) -> ids for the new mark, newest first
+    head_date: Optional[str] = None # Latest upload date (YYYYMMDD) seen
+    scanned: int = 0 # Entries looked at, including the known one the scan stopped at
+    stop_reason: str = "end" # 'known', 'date', 'limit' or 'end' (walked the whole list)
+
+
+@dataclass
+class SyncResult:
+    """Outcome of one PlaylistSyncer.sync_once() call."""
+    sources: int = 0
+    failed_sources: List[Dict[str, Any]] = field(default_factory=list) # 'url', 'error'
+    new_items: int = 0 # Entries found by this sync's scans
+    queued: int = 0 # Items downloaded in this sync, including ones left over from earlier syncs
+    downloaded: int = 0 # Includes items the DownloadIndex already had
+    failed_items: int = 0
+    cancelled: bool = False
+    batch: Optional[BatchResult] = None
+
+
+def _entry_date(entry: Dict[str, Any]) -> Optional[str]:
+    date = entry.get('upload_date') or entry.get('release_date')
+    return str(date) if date else None
+
+
+def _is_nested(playlist: Dict[str, Any], entry: Dict[str, Any]) -> bool:
+    """True for entries that are playlists themselves (e.g. a channel's tabs)."""
+    if entry.get('_type') == 'playlist':
+        return True
+    # Tabs come back as unresolved URLs handled by the channel's own extractor
+    return entry.get('_type') == 'url' and bool(entry.get('ie_key')) and entry.get('ie_key') == playlist.get('extractor_key')
+
+
+def scan_source(ydl: yt_dlp.YoutubeDL, url: str, known_ids: Set[str], mark_date: Optional[str] = None, limit: Optional[int] = None,
+                ie_key: Optional[str] = None) -> ScanResult:
+    """
+    Walks a playlist/channel newest first and collects the entries newer than its mark.
+
+    Args:
+        ydl: YoutubeDL used for extraction only (not shared with other threads).
+        url: The subscribed source.
+        known_ids: Entry ids of the current mark (empty for a new source).
+        mark_date: Upload date (YYYYMMDD) of the mark. Once HEAD_IDS entries
+            of a list were new, an entry dated before it ends the scan (all
+            known ids were probably deleted).
+        limit: Maximum number of new entries to take (None = all), used for
+            the first sync of a source; 0 only records the mark.
+        ie_key: Extractor to use (None = the first suitable one).
+
+    Returns:
+        A ScanResult with the new entries, newest first.
+
+    Raises:
+        ValueError: The URL is not a playlist or channel.
+        yt_dlp.utils.DownloadError: Extraction failed.
+    """
+    info = ydl.extract_info(url, download=False, process=False, ie_key=ie_key)
+    for _ in range(3): # Follow redirects to the real playlist page
+        if info is None or info.get('_type') != 'url':
+            break
+        info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+    if info is None or info.get('_type') != 'playlist':
+        raise ValueError(f"{url} is not a playlist or channel")
+
+    result = ScanResult(url=url, title=info.get('title') or info.get('id'))
+    _scan_entries(ydl, info, known_ids, mark_date, limit, result, depth=0)
+    return result
+
+
+def _scan_entries(ydl: yt_dlp.YoutubeDL, playlist: Dict[str, Any], known_ids: Set[str], mark_date: Optional[str], limit: Optional[int],
+                  result: ScanResult, depth: int):
+    """Adds playlist's entries up to the first known one to result (recursing into nested playlists)."""
+    context = playlist_context(playlist)
+    head = result.head_ids.setdefault(str(playlist.get('id') or playlist.get('webpage_url') or result.url), [])
+    found: List[SyncEntry] = []
+    walked = 0
+    marking_only = False # Over the limit: only filling up the mark
+    # Entries are fetched lazily, so breaking out skips the pages after the mark
+    for playlist_index, entry in PlaylistEntries(ydl, playlist).get_requested_items():
+        if not entry:
+            continue
+        if depth < NESTED_DEPTH and _is_nested(playlist, entry):
+            nested = entry
+            if entry.get('_type') == 'url':
+                nested = ydl.extract_info(entry['url'], download=False, process=False, ie_key=entry.get('ie_key'))
+            if nested is not None and nested.get('_type') == 'playlist':
+                _scan_entries(ydl, nested, known_ids, mark_date, limit, result, depth + 1)
+                continue
+        result.scanned += 1
+        walked += 1
+        video_id = str(entry.get('id') or entry.get('url') or '')
+        if not video_id:
+            continue
+        date = _entry_date(entry)
+        if video_id in known_ids:
+            result.stop_reason = 'known'
+            break
+        if mark_date and date and date < mark_date and walked > HEAD_IDS:
+            result.stop_reason = 'date'
+            break
+        if limit is not None and len(result.entries) + len(found) >= limit:
+            result.stop_reason = 'limit'
+            if len(head) >= HEAD_IDS:
+                break
+            marking_only = True
+        if len(head) < HEAD_IDS:
+            head.append(video_id)
+        if date and (result.head_date is None or date > result.head_date):
+            result.head_date = date
+        if marking_only:
+            continue
+        if entry.get('_type') == 'url':
+            entry_url = entry['url']
+        else:
+            entry_url = entry.get('webpage_url') or entry.get('url')
+        if not entry_url:
+            continue
+        found.append(SyncEntry(video_id, entry_url, ie_key=entry.get('ie_key'), title=entry.get('title'),
+                               extra_info=dict(context, playlist_index=playlist_index,
+                                               playlist_count=playlist.get('playlist_count'))))
+
+    for autonumber, item in enumerate(found, start=1):
+        item.extra_info.update(n_entries=len(found), playlist_autonumber=autonumber)
+        if item.extra_info['playlist_count'] is None:
+            del item.extra_info['playlist_count']
+    result.entries.extend(found)
+
+
+class SubscriptionStore:
+    """
+    Subscribed sources, their marks and their not yet downloaded entries (SQLite, WAL mode).
+
+    Pending entries are stored oldest first, so a sync downloads a source's
+    new items in upload order.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or state_path(DEFAULT_SUBSCRIPTIONS_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # head_ids: JSON object mapping each list (playlist id) to its newest known entry ids
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " url TEXT PRIMARY KEY,"
+            " title TEXT,"
+            " added_at REAL NOT NULL,"
+            " synced_at REAL,"
+            " head_ids TEXT NOT NULL DEFAULT '{}',"
+            " head_date TEXT,"
+            " last_new INTEGER,"
+            " last_error TEXT);"
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " item_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " source TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " ie_key TEXT,"
+            " title TEXT,"
+            " extra_info TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " UNIQUE (source, video_id));"
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, url: str) -> bool:
+        """Subscribes to url; returns False if it already was."""
+        with self._lock:
+            cursor = self._conn.execute("INSERT OR IGNORE INTO sources (url, added_at) VALUES (?, ?)", (url, time.time()))
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def remove(self, url: str) -> bool:
+        """Unsubscribes from url and forgets its pending entries."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sources WHERE url=?", (url,))
+            self._conn.execute("DELETE FROM pending WHERE source=?", (url,))
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """All subscriptions, oldest first, with their pending entry counts."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.url, s.title, s.added_at, s.synced_at, s.head_ids, s.head_date, s.last_new, s.last_error,"
+                " (SELECT COUNT(*) FROM pending p WHERE p.source = s.url)"
+                " FROM sources s ORDER BY s.added_at, s.url"
+            ).fetchall()
+        return [
+            {'url': url, 'title': title, 'added_at': added_at, 'synced_at': synced_at, 'head_ids': json.loads(head_ids),
+             'head_date': head_date, 'last_new': last_new, 'last_error': last_error, 'pending': pending}
+            for url, title, added_at, synced_at, head_ids, head_date, last_new, last_error, pending in rows
+        ]
+
+    def due(self, interval: float, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Sources never synced, or last synced at least interval seconds ago."""
+        now = time.time() if now is None else now
+        return [s for s in self.sources() if s['synced_at'] is None or s['synced_at'] + interval <= now]
+
+    def next_due(self, interval: float) -> Optional[float]:
+        """time.time() at which the next source is due (None without subscriptions)."""
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*), MIN(COALESCE(synced_at, 0)) FROM sources").fetchone()
+        return row[1] + interval if row[0] else None
+
+    def record_scan(self, scan: ScanResult, now: Optional[float] = None):
+        """Moves the source's mark to the scanned head and stores its new entries."""
+        with self._lock:
+            row = self._conn.execute("SELECT head_ids, head_date FROM sources WHERE url=?", (scan.url,)).fetchone()
+            if row is None:
+                return # Unsubscribed while scanning
+            head_ids, old_date = json.loads(row[0]), row[1]
+            for list_id, ids in scan.head_ids.items():
+                if ids:
+                    head_ids[list_id] = list(dict.fromkeys(ids + head_ids.get(list_id, [])))[:HEAD_IDS]
+            head_date = max(filter(None, (old_date, scan.head_date)), default=None)
+            self._conn.execute(
+                "UPDATE sources SET title=COALESCE(?, title), synced_at=?, head_ids=?, head_date=?, last_new=?, last_error=NULL WHERE url=?",
+                (scan.title, time.time() if now is None else now, json.dumps(head_ids), head_date, len(scan.entries), scan.url),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO pending (source, video_id, url, ie_key, title, extra_info) VALUES (?, ?, ?, ?, ?, ?)",
+                [(scan.url, e.video_id, e.url, e.ie_key, e.title, json.dumps(e.extra_info, default=str)) for e in reversed(scan.entries)],
+            )
+            self._conn.commit()
+
+    def record_error(self, url: str, error: str, now: Optional[float] = None):
+        """Notes a failed scan; the source is tried again after the interval."""
+        with self._lock:
+            self._conn.execute("UPDATE sources SET synced_at=?, last_error=? WHERE url=?", (time.time() if now is None else now, error, url))
+            self._conn.commit()
+
+    def pending(self, sources: Iterable[str]) -> List[Dict[str, Any]]:
+        """Entries of the given sources not downloaded yet, oldest first per source."""
+        wanted = list(sources)
+        if not wanted:
+            return []
+        placeholders = ",".join("?" for _ in wanted)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_id, source, video_id, url, ie_key, title, extra_info, attempts FROM pending"
+                f" WHERE source IN ({placeholders}) ORDER BY item_id",
+                wanted,
+            ).fetchall()
+        return [
+            {'item_id': item_id, 'source': source, 'video_id': video_id, 'url': url, 'ie_key': ie_key, 'title': title,
+             'extra_info': json.loads(extra_info), 'attempts': attempts}
+            for item_id, source, video_id, url, ie_key, title, extra_info, attempts in rows
+        ]
+
+    def finish_items(self, item_ids: Iterable[int]):
+        """Forgets downloaded (or already present) entries."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending WHERE item_id=?", [(i,) for i in item_ids])
+            self._conn.commit()
+
+    def fail_items(self, failures: Iterable[Tuple[int, str, bool]]):
+        """
+        Records failed entries as (item_id, error, retryable).
+
+        Retryable ones stay pending for MAX_SYNC_ATTEMPTS syncs, the others
+        are given up right away (they are in the batch's failure report).
+        """
+        with self._lock:
+            for item_id, error, retryable in failures:
+                if retryable:
+                    self._conn.execute("UPDATE pending SET attempts=attempts+1, last_error=? WHERE item_id=?", (error, item_id))
+                    self._conn.execute("DELETE FROM pending WHERE item_id=? AND attempts>=?", (item_id, MAX_SYNC_ATTEMPTS))
+                else:
+                    self._conn.execute("DELETE FROM pending WHERE item_id=?", (item_id,))
+            self._conn.commit()
+
+
+class PlaylistSyncer:
+    """
+    Syncs subscribed sources and downloads what's new.
+
+    Scans run on a pool of max_concurrent threads (each with its own
+    YoutubeDL); the new items of all sources scanned in one sync are then
+    downloaded as one DownloadEngine batch. Events from both go to on_event:
+    sync_started, source_synced, source_failed, sync_finished and the
+    engine's own.
+    """
+    def __init__(self, options: DownloadOptions, store: Optional[SubscriptionStore] = None, interval: float = DEFAULT_SYNC_INTERVAL,
+                 max_concurrent: int = DEFAULT_MAX_CONCURRENT_SYNCS, initial_items: Optional[int] = None,
+                 on_event: Optional[EventCallback] = None, progress_bus: Optional[ProgressBus] = None,
+                 extractors: Optional[List[type]] = None):
+        """
+        Args:
+            options: Download settings; playlist output layout is always used.
+            store: Subscriptions (default: the store in the state directory).
+            interval: Seconds between two syncs of a source in watch().
+            max_concurrent: Sources scanned at the same time.
+            initial_items: New entries taken from a source's first sync
+                (None = the whole list, 0 = only items published later).
+            on_event: Event callback, called from several threads.
+            progress_bus: Passed on to the DownloadEngine.
+            extractors: Extra InfoExtractor classes, for scans and downloads.
+        """
+        self.options = replace(options, download_playlists=True)
+        self.store = store or SubscriptionStore()
+        self.interval = max(MIN_SYNC_INTERVAL, interval)
+        self.max_concurrent = max(1, min(max_concurrent, MAX_CONCURRENT_SYNCS))
+        self.initial_items = initial_items
+        self.on_event = on_event
+        self.extractors = list(extractors or [])
+        self.engine = DownloadEngine(self.options, on_event=self._engine_event, progress_bus=progress_bus, extractors=self.extractors)
+        self._stop = threading.Event()
+        self._finished_keys: Set[str] = set()
+        self._keys_lock = threading.Lock()
+
+    def emit(self, event: str, **payload: Any):
+        if self.on_event:
+            self.on_event(event, payload)
+
+    def stop(self):
+        """Ends watch() and cancels the running sync (new items stay pending)."""
+        self._stop.set()
+        self.engine.cancel()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def _engine_event(self, event: str, payload: Dict[str, Any]):
+        if event in ('item_finished', 'item_skipped'):
+            with self._keys_lock:
+                self._finished_keys.add(payload['key'])
+        self.emit(event, **payload)
+
+    def _scan(self, source: Dict[str, Any]) -> ScanResult:
+        """Scans one source with a YoutubeDL of its own (runs on the scan pool)."""
+        ydl_opts = {'quiet': True, 'no_warnings': True, 'noprogress': True, 'nocheckcertificate': True}
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            for ie_class in self.extractors:
+                ydl.add_info_extractor(ie_class())
+            known_ids = {video_id for ids in source['head_ids'].values() for video_id in ids}
+            first_sync = source['synced_at'] is None and not known_ids
+            ie_key = next((ie.ie_key() for ie in self.extractors if ie.suitable(source['url'])), None)
+            return scan_source(ydl, source['url'], known_ids, source['head_date'],
+                               limit=self.initial_items if first_sync else None, ie_key=ie_key)
+
+    def _scan_all(self, sources: List[Dict[str, Any]], result: SyncResult):
+        """Scans sources, at most max_concurrent at once, and records their marks."""
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrent, len(sources)), thread_name_prefix="sync-scan")
+        try:
+            futures = {executor.submit(self._scan, source): source for source in sources}
+            for future in as_completed(futures):
+                url = futures[future]['url']
+                if self._stop.is_set():
+                    break
+                try:
+                    scan = future.result()
+                except Exception as e:
+                    error = str(e)
+                    print(f"Sync of {url} failed: {error}", file=sys.stderr)
+                    self.store.record_error(url, error)
+                    result.failed_sources.append({'url': url, 'error': error})
+                    self.emit('source_failed', url=url, error=error)
+                    continue
+                self.store.record_scan(scan)
+                result.new_items += len(scan.entries)
+                self.emit('source_synced', url=url, title=scan.title, new=len(scan.entries), scanned=scan.scanned, stop_reason=scan.stop_reason)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def sync_once(self, force: bool = False) -> SyncResult:
+        """
+        Scans the due sources (all of them with force) and downloads their new items.
+
+        Returns:
+            A SyncResult; result.batch is the download batch, if there was one.
+        """
+        sources = self.store.sources() if force else self.store.due(self.interval)
+        result = SyncResult(sources=len(sources))
+        self.emit('sync_started', sources=len(sources))
+        if sources:
+            self._scan_all(sources, result)
+
+        items = self.store.pending(s['url'] for s in sources) if not self._stop.is_set() else []
+        if items:
+            # One input position per item keeps job keys unique across sources
+            jobs = [DownloadJob(position, item['url'], ie_key=item['ie_key'], video_id=item['video_id'], extra_info=item['extra_info'])
+                    for position, item in enumerate(items)]
+            by_key = {job.key(): item for job, item in zip(jobs, items)}
+            with self._keys_lock:
+                self._finished_keys.clear()
+            result.queued = len(jobs)
+            batch = result.batch = self.engine.run_jobs(jobs)
+            with self._keys_lock:
+                finished = [by_key[k]['item_id'] for k in self._finished_keys if k in by_key]
+            self.store.finish_items(finished)
+            # Interrupted items (batch cancelled) are neither: they stay pending as they are
+            self.store.fail_items((by_key[f['key']]['item_id'], f['error'], f['category'] in REQUEUE_CATEGORIES)
+                                  for f in batch.failed_items if f.get('key') in by_key)
+            result.downloaded = len(finished)
+            result.failed_items = len(batch.failed_items)
+            result.cancelled = batch.cancelled
+        result.cancelled = result.cancelled or self._stop.is_set()
+        self.emit('sync_finished', sources=result.sources, failed_sources=len(result.failed_sources), new=result.new_items,
+                  queued=result.queued, downloaded=result.downloaded, failed=result.failed_items, cancelled=result.cancelled)
+        return result
+
+    def watch(self, on_sync: Optional[Callable[[SyncResult], None]] = None):
+        """Syncs every source each interval until stop() (blocking)."""
+        while not self._stop.is_set():
+            result = self.sync_once()
+            if on_sync is not None:
+                on_sync(result)
+            next_due = self.store.next_due(self.interval)
+            wait = self.interval if next_due is None else next_due - time.time()
+            self._stop.wait(max(1.0, wait))
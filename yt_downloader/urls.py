@@ -0,0 +1,27 @@
+from typing import List, Optional, Tuple # For type hinting
+
+import yt_dlp
+
+_extractor_classes: Optional[List[type]] = None
+
+
+def _extractors() -> List[type]:
+    """yt-dlp extractor classes in matching order, without the catch-all GenericIE."""
+    global _extractor_classes
+    if _extractor_classes is None:
+        _extractor_classes = [ie for ie in yt_dlp.extractor.gen_extractor_classes() if ie.ie_key() != 'Generic']
+    return _extractor_classes
+
+
+def match_extractor(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Maps a URL to (extractor_key, id) using only yt-dlp's URL regexes.
+
+    No network access happens here. Returns None for URLs only the generic
+    extractor would handle, or when the extractor cannot derive an id.
+    """
+    for ie in _extractors():
+        if ie.suitable(url):
+            temp_id = ie.get_temp_id(url)
+            return (ie.ie_key(), str(temp_id)) if temp_id else None
+    return None
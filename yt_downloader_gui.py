@@ -1,27 +1,190 @@
+import time
+_SCRIPT_STARTED = time.perf_counter() # Before the other imports, for --measure-startup
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import yt_dlp
 import threading
 import os
-import re
+import sys
+import json
 import traceback
-from typing import List, Dict, Any, Optional # For type hinting
+from collections import deque
+from typing import List, Dict, Any, Optional, Set, Deque, Tuple, TYPE_CHECKING # For type hinting
+
+# yt-dlp is NOT imported here: the package's light modules are enough to
+# build the window, and the engine (which loads yt-dlp) is imported by a
+# background warm-up thread once the window is on screen.
+from yt_downloader import (
+    VIDEO_TYPE, AUDIO_TYPE, DEFAULT_AUDIO_CODEC, DEFAULT_ACCEPTED_AUDIO_CODECS, DEFAULT_WORKER_COUNT, MAX_WORKER_COUNT,
+    STOP_LATENCY_BOUND, DEFAULT_PLAYLIST_WINDOW,
+    ProgressBus, JobJournal, format_item_status, format_throughput, format_stage_depths,
+)
+from yt_downloader.state import state_path
+from yt_downloader.metrics import peak_rss
+from yt_downloader.queue_model import QueueModel, QueueRow, ROW_STATES, format_queue_row
+
+if TYPE_CHECKING:
+    from yt_downloader.engine import DownloadOptions, BatchResult, DownloadEngine
+    from yt_downloader.ingest import IngestReport
 
 # --- Constants ---
-VIDEO_TYPE = "video"
-AUDIO_TYPE = "audio"
-DEFAULT_AUDIO_CODEC = "mp3" # Or 'm4a', 'opus', etc.
-DEFAULT_AUDIO_QUALITY = "192" # kbit/s
+UI_REFRESH_INTERVAL_MS = 66 # ~15 Hz repaint of progress/status from the ProgressBus
+LOG_MAX_LINES = 2000 # Oldest log panel lines are dropped beyond this
+METRICS_JSONL_FILENAME = "item_metrics.jsonl" # Per-item phase timings, in the state dir
+METRICS_PROMETHEUS_FILENAME = "metrics.prom"
+WARMUP_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ" # Matched once to build the extractor cache
+DOWNLOAD_BUTTON_TEXT = "Download All Entered URLs"
+IMPORT_FILE_TYPES = [("URL lists", "*.txt *.csv *.tsv *.html *.htm"), ("All files", "*.*")]
+QUEUE_VISIBLE_ROWS = 10 # Treeview items that exist; scrolling re-fills them from the model
+QUEUE_VIEW_INTERVAL = 0.5 # Seconds between re-sorts/re-filters of the queue while it changes
+QUEUE_EVENTS_PER_FRAME = 5000 # Engine events applied per UI frame (the rest wait for the next one)
+QUEUE_FILTER_ALL = "All"
+AUDIO_CODEC_LABELS = {"aac": "AAC", "opus": "Opus", "mp3": "MP3", "vorbis": "Vorbis"}
+
+
+class QueueTable:
+    """
+    Windowed ttk.Treeview over a QueueModel.
+
+    Only QUEUE_VISIBLE_ROWS tree items ever exist. The scrollbar and mouse
+    wheel move a window over the model's (filtered, sorted) rows and the
+    items are re-filled from it, so a 10,000-item batch costs about as much
+    per frame as a 10-item one. Selection is tracked by job key, not by
+    tree item.
+    """
+    COLUMNS = (
+        # (column id, heading, width, anchor)
+        ('title', "Title", 230, "w"),
+        ('state', "State", 95, "w"),
+        ('percent', "%", 45, "e"),
+        ('speed', "Speed", 80, "e"),
+        ('eta', "ETA", 50, "e"),
+        ('size', "Size", 70, "e"),
+        ('error', "Error", 160, "w"),
+    )
+
+    def __init__(self, parent: tk.Widget, model: QueueModel, visible_rows: int = QUEUE_VISIBLE_ROWS):
+        self.model = model
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=[c[0] for c in self.COLUMNS], show='headings',
+                                 height=visible_rows, selectmode='extended')
+        for column, heading, width, anchor in self.COLUMNS:
+            self.tree.heading(column, text=heading, command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=width, anchor=anchor, stretch=column in ('title', 'error'))
+        self.tree.tag_configure('failed', foreground='red')
+        self.tree.tag_configure('cancelled', foreground='gray')
+        self.tree.tag_configure('paused', foreground='darkorange')
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
+
+        self._iids = [self.tree.insert('', tk.END, values=()) for _ in range(visible_rows)]
+        self._shown: List[Optional[Tuple[Tuple[str, ...], str]]] = [None] * visible_rows # (values, tag) per item
+        self._keys: List[Optional[str]] = [None] * visible_rows # Job key shown in each item
+        self.offset = 0
+        self.view: List[QueueRow] = []
+        self.selected: Set[str] = set()
+        self.state_filter: Optional[str] = None
+        self.sort_column: Optional[str] = None
+        self.descending = False
+        self._view_built_at = 0.0
+        self._rendered_version = -1
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, 'units'))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, 'units')) # X11 wheel
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, 'units'))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, 'pages'))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, 'pages'))
+
+    def sort_by(self, column: str):
+        """Heading click: sort by column, toggle direction, third click restores queue order."""
+        if self.sort_column != column:
+            self.sort_column, self.descending = column, False
+        elif not self.descending:
+            self.descending = True
+        else:
+            self.sort_column, self.descending = None, False
+        for name, heading, _width, _anchor in self.COLUMNS:
+            arrow = (" \u25bc" if self.descending else " \u25b2") if name == self.sort_column else ""
+            self.tree.heading(name, text=heading + arrow)
+        self.refresh(rebuild=True)
+
+    def set_filter(self, state: Optional[str]):
+        self.state_filter = state
+        self.offset = 0
+        self.refresh(rebuild=True)
+
+    def scroll(self, amount: int, what: str):
+        step = len(self._iids) - 1 if what == 'pages' else 1
+        self._move_to(self.offset + amount * step)
+        return "break"
+
+    def _on_scrollbar(self, action: str, amount: str, what: Optional[str] = None):
+        if action == 'moveto':
+            self._move_to(int(float(amount) * len(self.view)))
+        else: # 'scroll'
+            self.scroll(int(amount), what or 'units')
+
+    def _move_to(self, offset: int):
+        offset = max(0, min(offset, len(self.view) - len(self._iids)))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_select(self, _event=None):
+        in_window = {key for key in self._keys if key is not None}
+        chosen = {self._keys[self._iids.index(iid)] for iid in self.tree.selection()}
+        self.selected = (self.selected - in_window) | {key for key in chosen if key is not None}
+
+    def clear(self):
+        self.selected.clear()
+        self.offset = 0
+        self.refresh(rebuild=True)
+
+    def refresh(self, rebuild: bool = False):
+        """Repaints the window if the model changed; re-sorts/filters at most every QUEUE_VIEW_INTERVAL."""
+        now = time.monotonic()
+        if rebuild or now - self._view_built_at >= QUEUE_VIEW_INTERVAL:
+            self.view = self.model.view(self.state_filter, self.sort_column, self.descending)
+            self._view_built_at = now
+            self.offset = max(0, min(self.offset, len(self.view) - len(self._iids)))
+        elif self.model.version == self._rendered_version:
+            return # Nothing changed
+        self._render()
+
+    def _render(self):
+        """Fills the tree items from view[offset:] (only items whose text changed are touched)."""
+        self._rendered_version = self.model.version
+        selection = []
+        for n, iid in enumerate(self._iids):
+            position = self.offset + n
+            row = self.view[position] if position < len(self.view) else None
+            shown = (format_queue_row(row), row.state) if row is not None else ((), "")
+            if shown != self._shown[n]:
+                self.tree.item(iid, values=shown[0], tags=(shown[1],) if shown[1] else ())
+                self._shown[n] = shown
+            self._keys[n] = row.key if row is not None else None
+            if row is not None and row.key in self.selected:
+                selection.append(iid)
+        if set(selection) != set(self.tree.selection()):
+            self.tree.selection_set(selection)
+        total = len(self.view)
+        if total > len(self._iids):
+            self.scrollbar.set(self.offset / total, (self.offset + len(self._iids)) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
 class YouTubeDownloaderApp:
     """
     A Tkinter GUI application for downloading multiple YouTube videos or audio
     using yt-dlp, with optional playlist handling and container choice.
     """
-    def __init__(self, root: tk.Tk):
+    def __init__(self, root: tk.Tk, measure_startup: bool = False):
         self.root = root
         self.root.title("YouTube Multi-Downloader (yt-dlp)")
-        self.root.geometry("600x550") # Adjusted height
+        self.root.geometry("760x820") # Room for the queue table
 
         # --- Style ---
         self.style = ttk.Style()
@@ -34,18 +197,48 @@ class YouTubeDownloaderApp:
         self.progress_var = tk.DoubleVar(value=0.0)
         self.overall_progress_var = tk.StringVar(value="") # For X/Y progress
         self.download_playlists_var = tk.BooleanVar(value=False)
+        self.stream_playlists_var = tk.BooleanVar(value=False) # Read long playlists in windows (bounded memory)
         self.container_format_var = tk.StringVar(value="mp4") # Default to mp4
+        self.worker_count_var = tk.IntVar(value=DEFAULT_WORKER_COUNT)
+        self.skip_downloaded_var = tk.BooleanVar(value=True)
+        self.audio_copy_var = tk.BooleanVar(value=True) # Keep accepted audio codecs instead of transcoding
+        self.speed_limit_var = tk.DoubleVar(value=0.0) # MB/s for the whole batch, 0 = unlimited
+        self.throughput_var = tk.StringVar(value="")
+        self.stages_var = tk.StringVar(value="") # Per-stage queue depths
         # --- Internal State ---
         self.is_downloading = False
         self.download_thread: Optional[threading.Thread] = None
-        self.cancelled = False # Flag for explicit cancellation
+        self.engine: Optional["DownloadEngine"] = None # Set while a batch runs
+        self.progress_bus = ProgressBus()
+        self.queue_model = QueueModel()
+        self._engine_events: Deque[Tuple[str, Dict[str, Any]]] = deque() # Appended by worker threads
+        self.queue_filter_var = tk.StringVar(value=QUEUE_FILTER_ALL)
+        self.queue_count_var = tk.StringVar(value="")
+        # --- yt-dlp Warm-up ---
+        self.ready = False # True once yt-dlp is imported and initialized
+        self._warmup_done = threading.Event()
+        self._warmup_error: Optional[str] = None
+        self._warmup_seconds: Optional[float] = None
+        self._warmup_handled = False # _on_warmup_done has run
+        self.measure_startup = measure_startup
+        self._first_paint_at: Optional[float] = None
+        # --- URL Ingestion ---
+        self.ingest_thread: Optional[threading.Thread] = None
+        self._ingest_outcome: Optional[tuple] = None # (IngestReport or None, error message or None)
+        self._ingest_cancel = threading.Event()
+        self._close_deadline = 0.0 # on_closing: when to stop waiting for the batch to stop
 
         # --- GUI Elements ---
         self.setup_gui()
+        self.root.after(UI_REFRESH_INTERVAL_MS, self._poll_progress_bus)
 
         # --- Window Closing Protocol ---
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        # --- Load yt-dlp once the window is on screen ---
+        # (offer_resume runs when the warm-up has finished)
+        self._map_binding = self.root.bind("<Map>", self._on_first_map, add="+")
+
     def setup_gui(self):
         """Creates and grids all the GUI elements."""
         main_frame = ttk.Frame(self.root, padding="10")
@@ -55,6 +248,8 @@ class YouTubeDownloaderApp:
 
         # --- URL Input ---
         ttk.Label(main_frame, text="YouTube URLs (One per line):").grid(row=0, column=0, padx=5, pady=5, sticky="nw")
+        self.import_button = ttk.Button(main_frame, text="Import File...", command=self.import_urls, state=tk.DISABLED)
+        self.import_button.grid(row=0, column=2, padx=5, pady=5, sticky="e")
         self.url_text = scrolledtext.ScrolledText(main_frame, height=8, width=60, wrap=tk.WORD)
         self.url_text.grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
 
@@ -66,7 +261,7 @@ class YouTubeDownloaderApp:
 
         # Download Type Widgets
         self.video_radio = ttk.Radiobutton(options_frame, text="Video", variable=self.download_type_var, value=VIDEO_TYPE)
-        self.audio_radio = ttk.Radiobutton(options_frame, text=f"Audio Only ({DEFAULT_AUDIO_CODEC.upper()})*", variable=self.download_type_var, value=AUDIO_TYPE)
+        self.audio_radio = ttk.Radiobutton(options_frame, text="Audio Only*", variable=self.download_type_var, value=AUDIO_TYPE)
 
         # Video Container Widgets
         self.container_label = ttk.Label(options_frame, text="Video Container:")
@@ -80,9 +275,19 @@ class YouTubeDownloaderApp:
 
         # Playlist Widget
         self.playlist_checkbox = ttk.Checkbutton(options_frame, text="Download Playlists (creates subfolder)", variable=self.download_playlists_var)
+        self.stream_playlists_checkbox = ttk.Checkbutton(options_frame, text=f"Stream ({DEFAULT_PLAYLIST_WINDOW} entries at a time)", variable=self.stream_playlists_var)
+        self.skip_downloaded_checkbox = ttk.Checkbutton(options_frame, text="Skip items already downloaded to this folder", variable=self.skip_downloaded_var)
+        accepted = "/".join(AUDIO_CODEC_LABELS.get(codec, codec) for codec in DEFAULT_ACCEPTED_AUDIO_CODECS)
+        self.audio_copy_checkbox = ttk.Checkbutton(options_frame, text=f"Audio: keep original when possible ({accepted}, no re-encode)", variable=self.audio_copy_var)
+
+        # Parallel Downloads Widget
+        self.workers_frame = ttk.Frame(options_frame)
+        self.workers_spinbox = ttk.Spinbox(self.workers_frame, from_=1, to=MAX_WORKER_COUNT, textvariable=self.worker_count_var, width=4, state='readonly')
+        self.speed_limit_label = ttk.Label(self.workers_frame, text="Speed Limit (MB/s, 0 = none):")
+        self.speed_limit_spinbox = ttk.Spinbox(self.workers_frame, from_=0, to=1000, increment=0.5, textvariable=self.speed_limit_var, width=6)
 
         # FFmpeg Note Widget
-        self.ffmpeg_note = ttk.Label(options_frame, text=f"*Audio ({DEFAULT_AUDIO_CODEC.upper()}) or MKV selection requires FFmpeg in PATH. Playlists create subfolders.", font=('Helvetica', 8), foreground='gray')
+        self.ffmpeg_note = ttk.Label(options_frame, text=f"*Audio or MKV selection requires FFmpeg in PATH (other codecs become {DEFAULT_AUDIO_CODEC.upper()}). Playlists create subfolders.", font=('Helvetica', 8), foreground='gray')
 
 
         # --- Grid Widgets in Order ---
@@ -104,11 +309,25 @@ class YouTubeDownloaderApp:
         self.path_entry.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
         self.browse_button.grid(row=2, column=2, padx=5, pady=5, sticky="ew")
 
-        # Row 3: Playlist Checkbox
-        self.playlist_checkbox.grid(row=3, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+        # Row 3: Playlist Checkboxes
+        self.playlist_checkbox.grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        self.stream_playlists_checkbox.grid(row=3, column=2, padx=5, pady=5, sticky="w")
+
+        # Row 4: Skip Already Downloaded
+        self.skip_downloaded_checkbox.grid(row=4, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+
+        # Row 5: Audio Stream Copy
+        self.audio_copy_checkbox.grid(row=5, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+
+        # Row 6: Parallel Downloads
+        ttk.Label(options_frame, text="Parallel Downloads:").grid(row=6, column=0, padx=5, pady=5, sticky="w")
+        self.workers_frame.grid(row=6, column=1, columnspan=2, padx=0, pady=0, sticky="w")
+        self.workers_spinbox.pack(side=tk.LEFT, padx=5)
+        self.speed_limit_label.pack(side=tk.LEFT, padx=(15, 5))
+        self.speed_limit_spinbox.pack(side=tk.LEFT, padx=5)
 
-        # Row 4: FFmpeg Note
-        self.ffmpeg_note.grid(row=4, column=0, columnspan=3, padx=5, pady=(0, 5), sticky="w")
+        # Row 7: FFmpeg Note
+        self.ffmpeg_note.grid(row=7, column=0, columnspan=3, padx=5, pady=(0, 5), sticky="w")
 
 
         # --- Finish Options Frame Setup ---
@@ -120,9 +339,15 @@ class YouTubeDownloaderApp:
         self._toggle_container_options()
         # ---
 
-        # --- Action Button ---
-        self.download_button = ttk.Button(main_frame, text="Download All Entered URLs", command=self.start_download_thread)
-        self.download_button.grid(row=3, column=0, columnspan=3, padx=5, pady=10, sticky="ew") # Row adjusted
+        # --- Action Buttons ---
+        action_frame = ttk.Frame(main_frame)
+        action_frame.grid(row=3, column=0, columnspan=3, padx=5, pady=10, sticky="ew") # Row adjusted
+        self.download_button = ttk.Button(action_frame, text="Loading yt-dlp...", command=self.start_download_thread, state=tk.DISABLED)
+        self.download_button.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(action_frame, text="Cancel All", command=self.cancel_all, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.pause_button = ttk.Button(action_frame, text="Pause", command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_button.pack(side=tk.RIGHT, padx=5)
 
         # --- Progress & Status ---
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10")
@@ -136,11 +361,43 @@ class YouTubeDownloaderApp:
         self.overall_progress_label = ttk.Label(progress_frame, textvariable=self.overall_progress_var)
         self.overall_progress_label.grid(row=1, column=1, padx=5, pady=2, sticky="w")
 
+        ttk.Label(progress_frame, text="Queues:").grid(row=2, column=0, padx=5, pady=2, sticky="w")
+        self.stages_label = ttk.Label(progress_frame, textvariable=self.stages_var)
+        self.stages_label.grid(row=2, column=1, padx=5, pady=2, sticky="w")
+
+        ttk.Label(progress_frame, text="Throughput:").grid(row=3, column=0, padx=5, pady=2, sticky="w")
+        self.throughput_label = ttk.Label(progress_frame, textvariable=self.throughput_var)
+        self.throughput_label.grid(row=3, column=1, padx=5, pady=2, sticky="w")
+
         progress_frame.columnconfigure(1, weight=1) # Make progress bar expand
 
-        self.status_label = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor="w", wraplength=550)
+        self.status_label = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor="w", wraplength=700)
         self.status_label.grid(row=5, column=0, columnspan=3, padx=5, pady=(10, 5), sticky="ew") # Row adjusted
 
+        # --- Queue (one row per item) and Log (per-item timing breakdown) Tabs ---
+        notebook = ttk.Notebook(main_frame)
+        notebook.grid(row=6, column=0, columnspan=3, padx=5, pady=5, sticky="nsew")
+
+        queue_frame = ttk.Frame(notebook, padding="5")
+        notebook.add(queue_frame, text="Queue")
+        queue_controls = ttk.Frame(queue_frame)
+        queue_controls.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(queue_controls, text="Show:").pack(side=tk.LEFT)
+        self.queue_filter_combo = ttk.Combobox(queue_controls, textvariable=self.queue_filter_var, state='readonly', width=16,
+                                               values=[QUEUE_FILTER_ALL, *ROW_STATES])
+        self.queue_filter_combo.pack(side=tk.LEFT, padx=5)
+        self.queue_filter_combo.bind("<<ComboboxSelected>>", self._on_queue_filter)
+        ttk.Label(queue_controls, textvariable=self.queue_count_var, foreground='gray').pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_controls, text="Cancel Selected", command=self.cancel_selected).pack(side=tk.RIGHT)
+        ttk.Button(queue_controls, text="Retry Selected", command=self.retry_selected).pack(side=tk.RIGHT, padx=5)
+        self.queue_table = QueueTable(queue_frame, self.queue_model)
+        self.queue_table.frame.pack(fill=tk.BOTH, expand=True)
+
+        log_frame = ttk.Frame(notebook, padding="5")
+        notebook.add(log_frame, text="Log")
+        self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.NONE, height=8, font=('Courier', 9), state=tk.DISABLED)
+        self.log_text.pack(fill=tk.BOTH, expand=True)
+
         # --- Configure main_frame grid ---
         main_frame.columnconfigure(1, weight=1) # Text/Entry column expands
         main_frame.rowconfigure(1, weight=1) # Make Text widget expand vertically
@@ -166,20 +423,201 @@ class YouTubeDownloaderApp:
         if path:
             self.download_path_var.set(path)
 
+    def _on_first_map(self, event: tk.Event):
+        """Starts the yt-dlp warm-up after the window's first paint."""
+        if event.widget is not self.root or self._first_paint_at is not None:
+            return
+        self.root.unbind("<Map>", self._map_binding)
+        self.root.update_idletasks() # Finish drawing before timing first paint
+        self._first_paint_at = time.perf_counter()
+        self.status_var.set("Status: Loading yt-dlp...")
+        threading.Thread(target=self._warm_up, name="yt-dlp-warmup", daemon=True).start()
+
+    def _warm_up(self):
+        """Imports and initializes yt-dlp (runs on a background thread)."""
+        started = time.perf_counter()
+        try:
+            import yt_dlp
+            import yt_downloader.engine # noqa: F401 - imports the rest of the engine
+            from yt_downloader.urls import match_extractor
+            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}):
+                pass # Loads the extractor registry and post-processors
+            match_extractor(WARMUP_URL) # Compiles the extractor URL patterns
+        except ImportError as e:
+            print(f"Error: Could not import yt-dlp: {e}")
+            self._warmup_error = "Required library 'yt-dlp' not found.\nPlease install it using:\n\npip install yt-dlp"
+        except Exception as e:
+            print(f"Error: yt-dlp warm-up failed: {e}")
+            self._warmup_error = f"Failed to initialize yt-dlp. Check your installation.\nError: {e}"
+        self._warmup_seconds = time.perf_counter() - started
+        self._warmup_done.set()
+
+    def _on_warmup_done(self):
+        """Enables downloading once yt-dlp is loaded (Tk thread)."""
+        self._warmup_handled = True
+        if self._warmup_error:
+            self.download_button.configure(text="yt-dlp unavailable")
+            self.status_var.set("Status: yt-dlp could not be loaded")
+            if self.measure_startup:
+                self._report_startup()
+                return
+            messagebox.showerror("Dependency Error", self._warmup_error)
+            return
+        self.ready = True
+        self.download_button.configure(text=DOWNLOAD_BUTTON_TEXT, state=tk.NORMAL)
+        self.import_button.configure(state=tk.NORMAL)
+        self.status_var.set("Status: Idle")
+        if self.measure_startup:
+            self._report_startup()
+            return
+        self.offer_resume()
+
+    def _report_startup(self):
+        """Prints the --measure-startup timings as JSON and quits."""
+        ready_at = time.perf_counter()
+        report = {
+            'first_paint_ms': round((self._first_paint_at - _SCRIPT_STARTED) * 1000, 1),
+            'ready_ms': round((ready_at - _SCRIPT_STARTED) * 1000, 1) if self.ready else None,
+            'yt_dlp_warmup_ms': round(self._warmup_seconds * 1000, 1),
+            'error': self._warmup_error,
+        }
+        print(json.dumps(report), flush=True)
+        self.root.destroy()
+
     def update_status(self, message: str):
-        """Thread-safe way to update the status bar."""
-        self.root.after(0, lambda msg=message: self.status_var.set(f"Status: {msg}"))
+        """Thread-safe way to update the status bar (shown on the next UI frame)."""
+        self.progress_bus.set_status(message)
+
+    def _poll_progress_bus(self):
+        """Applies coalesced worker updates to the widgets at a fixed frame rate."""
+        if self._warmup_done.is_set() and not self._warmup_handled:
+            self._on_warmup_done()
+            if self.measure_startup:
+                return # Window destroyed
+
+        items, status, overall = self.progress_bus.drain()
+
+        if overall is not None:
+            current, total, active, stages = overall
+            msg = f"{current}/{total}"
+            if active:
+                msg += f" ({active} active)"
+            self.overall_progress_var.set(msg)
+            if stages:
+                self.stages_var.set(format_stage_depths(stages))
+
+        engine = self.engine
+        if engine is not None and self.is_downloading:
+            throughput = format_throughput(engine.bandwidth.throughput(), engine.bandwidth.current_limit())
+            rss = peak_rss()
+            self.throughput_var.set(f"{throughput} | Peak memory: {rss / 1024 / 1024:.0f} MB" if rss else throughput)
+        self._drain_item_metrics()
+        self._update_queue(items)
+
+        # Show whichever update is newest: the last item state or a status line
+        latest_item = next(reversed(items.values())) if items else None
+        if latest_item is not None and (status is None or latest_item['_seq'] > status[0]):
+            percentage, message = format_item_status(latest_item)
+            self.progress_var.set(percentage)
+            self.status_var.set(f"Status: {message}")
+        elif status is not None:
+            self.status_var.set(f"Status: {status[1]}")
+
+        self.root.after(UI_REFRESH_INTERVAL_MS, self._poll_progress_bus)
+
+    def _on_engine_event(self, event: str, payload: Dict[str, Any]):
+        """DownloadEngine on_event callback (worker threads): queued for the next UI frame."""
+        self._engine_events.append((event, payload)) # deque.append is thread-safe
+
+    def _update_queue(self, items: Dict[str, Dict[str, Any]]):
+        """Applies this frame's engine events and progress states to the queue table."""
+        model = self.queue_model
+        for _ in range(min(len(self._engine_events), QUEUE_EVENTS_PER_FRAME)):
+            model.apply_event(*self._engine_events.popleft())
+        for state in items.values():
+            model.apply_progress(state)
+        self.queue_table.refresh()
+        shown = len(self.queue_table.view)
+        self.queue_count_var.set(f"{shown} of {len(model.rows)} item(s)" if shown != len(model.rows) else f"{shown} item(s)")
+
+    def _on_queue_filter(self, _event=None):
+        selected = self.queue_filter_var.get()
+        self.queue_table.set_filter(None if selected == QUEUE_FILTER_ALL else selected)
+
+    def cancel_selected(self):
+        """Cancels the selected queued/running items; the rest of the batch continues."""
+        engine = self.engine
+        if not self.is_downloading or engine is None:
+            return
+        for key in self.queue_model.mark_cancelling(self.queue_table.selected):
+            engine.cancel_job(key)
+        self.queue_table.refresh(rebuild=True)
+
+    def toggle_pause(self):
+        """Pauses the batch (running transfers keep their .part files) or continues it."""
+        engine = self.engine
+        if not self.is_downloading or engine is None:
+            return
+        if engine.paused:
+            engine.unpause()
+            self.pause_button.configure(text="Pause")
+        else:
+            engine.pause()
+            self.pause_button.configure(text="Resume")
 
-    def update_progress(self, percentage: float, status_message: str = ""):
-        """Thread-safe way to update the progress bar and optionally the status."""
-        self.root.after(0, lambda p=percentage: self.progress_var.set(p))
-        if status_message:
-             self.update_status(status_message)
+    def cancel_all(self):
+        """Cancels the whole batch; unfinished items can be resumed later."""
+        engine = self.engine
+        if not self.is_downloading or engine is None:
+            return
+        engine.cancel()
+        self.pause_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.update_status("Cancellation requested, waiting for current operation to stop...")
+
+    def retry_selected(self):
+        """Re-queues the selected failed/cancelled items (in a new batch once this one is over)."""
+        rows = self.queue_model.retryable(self.queue_table.selected)
+        if not rows:
+            messagebox.showinfo("Retry", "Select failed or cancelled items to retry.")
+            return
+        engine = self.engine
+        if self.is_downloading:
+            late = [row for row in rows if engine is None or not engine.retry_job(row.key)]
+            if late:
+                messagebox.showinfo("Retry", f"{len(late)} item(s) can be retried once the current batch has finished.")
+            return
+        self._queue_again([row.url for row in rows])
 
-    def update_overall_progress(self, current: int, total: int):
-        """Thread-safe way to update the overall progress label."""
-        msg = f"{current}/{total}"
-        self.root.after(0, lambda m=msg: self.overall_progress_var.set(m))
+    def _queue_again(self, urls: List[str]):
+        """Starts a new batch for URLs that failed before, with the current form options."""
+        if self.is_downloading or self.ingest_thread is not None or not self.ready:
+            return
+        options = self._collect_options()
+        if options is None:
+            return
+        self.status_var.set(f"Status: Retrying {len(urls)} item(s)...")
+        self.overall_progress_var.set(f"0/{len(urls)}")
+        self._start_download_thread(urls, options)
+
+    def _drain_item_metrics(self):
+        """Adds a log line for every item that finished since the last frame."""
+        engine = self.engine
+        if engine is None or engine.metrics is None:
+            return
+        finished = engine.metrics.drain_finished()
+        if finished:
+            self.append_log("\n".join(m.summary_line() for m in finished))
+
+    def append_log(self, text: str):
+        """Appends line(s) to the log panel, keeping at most LOG_MAX_LINES (Tk thread only)."""
+        self.log_text.configure(state=tk.NORMAL)
+        self.log_text.insert(tk.END, text + "\n")
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.see(tk.END)
+        self.log_text.configure(state=tk.DISABLED)
 
     def set_ui_state(self, enabled: bool):
         """Enable or disable UI elements during download."""
@@ -189,9 +627,9 @@ class YouTubeDownloaderApp:
 
         # Widgets always enabled/disabled with base_state
         base_widgets = [
-            self.url_text, self.browse_button, self.download_button,
+            self.url_text, self.browse_button, self.download_button, self.import_button,
             self.video_radio, self.audio_radio,
-            self.playlist_checkbox
+            self.playlist_checkbox, self.stream_playlists_checkbox, self.skip_downloaded_checkbox, self.audio_copy_checkbox
         ]
         for widget in base_widgets:
             # ScrolledText needs special handling for state
@@ -199,344 +637,338 @@ class YouTubeDownloaderApp:
                  widget.configure(state=base_state)
             else:
                 widget.configure(state=base_state)
+        if not self.ready:
+            self.download_button.configure(state=tk.DISABLED) # Still loading yt-dlp
+            self.import_button.configure(state=tk.DISABLED)
+        # Spinbox stays readonly (not free-text) while enabled
+        self.workers_spinbox.configure(state='readonly' if enabled else tk.DISABLED)
+        self.speed_limit_spinbox.configure(state=base_state)
 
         # Container widgets depend on download type as well
         self.container_label.configure(state=container_state)
         self.mp4_radio.configure(state=container_state)
         self.mkv_radio.configure(state=container_state)
 
+        # Batch controls work the other way round: only while a batch runs
+        self.pause_button.configure(text="Pause", state=tk.DISABLED if enabled else tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED if enabled else tk.NORMAL)
+
 
     def reset_ui_after_download(self):
         """Resets the UI elements to their initial state after download finishes or fails."""
         self.is_downloading = False
-        self.cancelled = False # Reset cancellation flag
+        self.progress_bus.reset() # Don't repaint stale per-item progress
         self.root.after(0, lambda: self.set_ui_state(True))
         self.root.after(0, lambda: self.progress_var.set(0.0))
         self.root.after(0, lambda: self.overall_progress_var.set("")) # Clear overall progress
+        self.root.after(0, lambda: self.throughput_var.set(""))
+        self.root.after(0, lambda: self.stages_var.set(""))
 
 
-    def my_yt_dlp_progress_hook(self, d: Dict[str, Any]):
-        """Hook for yt-dlp to update progress, checking for cancellation."""
-        if self.cancelled:
-             # Must raise an exception yt-dlp understands to truly stop it
-             raise yt_dlp.utils.DownloadCancelled('Download cancelled by user.')
-
-        status = d.get('status')
-        filename = os.path.basename(d.get('filename', ''))
-        info_dict = d.get('info_dict', {}) # Extract info_dict if available
-        # Try to get playlist info for status
-        playlist_title = info_dict.get('playlist_title', info_dict.get('playlist'))
-        playlist_index = info_dict.get('playlist_index')
-        # Get title from info_dict preferably, fallback to filename
-        title = info_dict.get('title', os.path.splitext(filename)[0] if filename else 'Unknown Title')
-
-        # Construct prefix for status messages if part of a playlist download
-        status_prefix = ""
-        if playlist_title and playlist_index is not None:
-             status_prefix = f"Playlist '{playlist_title}' ({playlist_index}/{info_dict.get('n_entries', '?')}): "
-
-
-        if status == 'downloading':
-            total_bytes_estimate = d.get('total_bytes_estimate')
-            total_bytes = d.get('total_bytes', total_bytes_estimate)
-            downloaded_bytes = d.get('downloaded_bytes')
-
-            if total_bytes and downloaded_bytes:
-                percentage = (downloaded_bytes / total_bytes) * 100
-                speed = d.get('speed')
-                eta = d.get('eta')
-                speed_str = f"{speed / 1024 / 1024:.2f} MB/s" if speed else "..."
-                eta_str = f"{eta}s" if eta is not None else "..." # Handle None eta
-                status_msg = f"Downloading: {status_prefix}{title} | {percentage:.1f}% ({speed_str}, ETA: {eta_str})"
-                self.update_progress(percentage, status_msg)
-            else:
-                 # Sometimes only filename is available initially
-                 status_msg = f"Downloading: {status_prefix}{title} (Waiting for size info...)"
-                 self.update_status(status_msg)
-                 self.root.after(0, lambda: self.progress_var.set(0)) # Reset bar if no size info
-
-        elif status == 'finished':
-            # Get final filename from info_dict if possible (often includes path)
-            final_filename = os.path.basename(info_dict.get('filepath', filename))
-            if not final_filename: # Fallback if filepath isn't in info_dict yet
-                 final_filename = filename if filename else title
-
-            self.update_status(f"Finished: {status_prefix}{final_filename}")
-            # Reset progress bar visually for the next file in the loop (or completion)
-            # Small delay helps visually separate finishes
-            self.root.after(100, lambda: self.progress_var.set(0))
-
-        elif status == 'error':
-             # Include prefix if available, otherwise just title
-             display_name = f"{status_prefix}{title}" if status_prefix else title
-             self.update_status(f"Error downloading: {display_name}")
-             # Error details will be caught in the main download loop
-
-
-    def download_content(self, urls_to_download: List[str], download_path: str, download_type: str, should_download_playlists: bool, container_format: Optional[str]):
+    def download_content(self, urls_to_download: Optional[List[str]], options: "DownloadOptions", resume_batch_id: Optional[int] = None):
         """
-        Handles the download logic using yt-dlp.
+        Runs the shared DownloadEngine on the download thread.
 
         Args:
-            urls_to_download: List of URL strings.
-            download_path: The base directory path to save files.
-            download_type: Either VIDEO_TYPE or AUDIO_TYPE.
-            should_download_playlists: Boolean indicating if playlists should be downloaded.
-            container_format: 'mp4' or 'mkv' if download_type is VIDEO_TYPE, else None.
+            urls_to_download: List of URL strings (None when resuming).
+            options: Download settings collected from the form.
+            resume_batch_id: JobJournal batch to continue instead of a new batch.
         """
-        self.is_downloading = True
-        self.cancelled = False
-        total_urls = len(urls_to_download)
-        failed_items: List[Dict[str, str]] = [] # Store URL-level failures
-
-        # --- Base yt-dlp Options ---
-        base_ydl_opts: Dict[str, Any] = {
-            'progress_hooks': [self.my_yt_dlp_progress_hook],
-            'nocheckcertificate': True,
-            'ignoreerrors': True,
-            'noplaylist': not should_download_playlists,
-            'quiet': True,
-            'verbose': False,
-            'no_warnings': True,
-            'updatetime': False,
-            'postprocessors': [], # Initialize postprocessors list
-            'format': None, # Define later
-            'merge_output_format': None, # Define later
-        }
-
-        # --- Set Output Template ---
-        if should_download_playlists:
-             base_ydl_opts['outtmpl'] = os.path.join(
-                 download_path,
-                 '%(playlist)s',
-                 '%(playlist_index)02d - %(title)s [%(id)s].%(ext)s'
-             )
-        else:
-            base_ydl_opts['outtmpl'] = os.path.join(
-                download_path,
-                '%(title)s [%(id)s].%(ext)s'
-            )
-
-        # --- Set Format, Merge Format, and Postprocessors ---
-        if download_type == VIDEO_TYPE:
-            # Select best formats, preferring widely compatible ones first
-            base_ydl_opts['format'] = 'bestvideo[ext=mp4][vcodec^=avc]+bestaudio[ext=m4a]/bestvideo[vcodec^=avc]+bestaudio/bestvideo+bestaudio/best[ext=mp4]/best'
-
-            # Set merge format based on user selection
-            if container_format == 'mkv':
-                base_ydl_opts['merge_output_format'] = 'mkv'
-                # NOTE: Relying on merge_output_format primarily. Omitting explicit remuxer PP for now.
-            else: # Default to mp4
-                base_ydl_opts['merge_output_format'] = 'mp4'
-
-        elif download_type == AUDIO_TYPE:
-            base_ydl_opts['format'] = 'bestaudio/best'
-            base_ydl_opts['postprocessors'].append({
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': DEFAULT_AUDIO_CODEC,
-                'preferredquality': DEFAULT_AUDIO_QUALITY,
-            })
-
-        # Remove unset/empty keys
-        if base_ydl_opts['format'] is None: del base_ydl_opts['format']
-        if base_ydl_opts['merge_output_format'] is None: del base_ydl_opts['merge_output_format']
-        if not base_ydl_opts.get('postprocessors'): # Use .get() for safety
-             if 'postprocessors' in base_ydl_opts:
-                 del base_ydl_opts['postprocessors']
-
-        # --- Create yt-dlp instance ---
+        from yt_downloader.engine import DownloadEngine
         try:
-            # Uncomment to print final options for debugging
-            # print("--- Effective yt-dlp options ---")
-            # import json
-            # print(json.dumps(base_ydl_opts, indent=2))
-            # print("-----------------------------")
-            ydl = yt_dlp.YoutubeDL(base_ydl_opts)
+            self.engine = DownloadEngine(options, on_event=self._on_engine_event, progress_bus=self.progress_bus)
+            if resume_batch_id is not None:
+                result = self.engine.resume(resume_batch_id)
+            else:
+                result = self.engine.run(urls_to_download)
         except Exception as e:
-             self.update_status(f"Error initializing yt-dlp: {e}")
-             print(f"yt-dlp Initialization Error:\n{traceback.format_exc()}")
-             self.reset_ui_after_download()
-             messagebox.showerror("Initialization Error", f"Failed to initialize yt-dlp. Check options/installation.\nError: {e}")
-             return
-
-        # --- Loop Through Each Input URL ---
-        loop_start_index = 0
-        for i, current_url in enumerate(urls_to_download):
-            loop_start_index = i
-            if self.cancelled:
-                self.update_status("Download cancelled by user.")
-                break
-
-            self.update_overall_progress(i + 1, total_urls)
-            self.update_status(f"Processing input URL {i+1}/{total_urls}: {current_url}")
-            self.root.after(0, lambda: self.progress_var.set(0.0))
+            print(f"Download Error:\n{traceback.format_exc()}", file=sys.stderr)
+            error = f"{type(e).__name__}: {e}"
+            self.root.after(0, lambda: self.append_log(f"--- Batch stopped by an unexpected error: {error} ---"))
+            self.root.after(0, lambda: messagebox.showerror("Download Error", f"The batch stopped unexpectedly.\nError: {error}"))
+            return
+        finally:
+            self.reset_ui_after_download() # Also after an error, or the form stays disabled
 
-            try:
-                # Execute download for the URL (single or playlist)
-                ydl.download([current_url])
-
-            except yt_dlp.utils.DownloadCancelled:
-                 self.update_status("Download cancelled during operation.")
-                 break
-
-            except (yt_dlp.utils.ExtractorError, yt_dlp.utils.DownloadError) as e:
-                 error_message = f"Error processing URL ({i+1}): {current_url} - {type(e).__name__}: {e}"
-                 self.update_status(error_message)
-                 print(f"ERROR processing URL: {current_url}\n{traceback.format_exc()}")
-                 failed_items.append({'item': current_url, 'error': str(e)})
-
-            except Exception as e:
-                error_message = f"Unexpected Error ({i+1}): {current_url} - {type(e).__name__}: {e}"
-                self.update_status(error_message)
-                print(f"UNEXPECTED ERROR processing URL: {current_url}\n{traceback.format_exc()}")
-                failed_items.append({'item': current_url, 'error': f"Unexpected: {e}"})
-
-        # --- End of Loop ---
-        self.reset_ui_after_download()
-
-        # --- Final Summary Message ---
-        processed_url_count = loop_start_index + 1 if not self.cancelled else loop_start_index
-        if self.cancelled and processed_url_count == 0 and total_urls > 0: processed_url_count=1 # Handle cancel before first URL
-        final_status = f"Finished processing {processed_url_count} of {total_urls} input URLs."
-
-        if self.cancelled:
+        self.root.after(0, lambda: self.show_batch_summary(result))
+
+    def show_batch_summary(self, result: "BatchResult"):
+        """Shows the final summary dialog for a finished batch."""
+        if result.init_error:
+            messagebox.showerror("Initialization Error", f"Failed to initialize yt-dlp. Check options/installation.\nError: {result.init_error}")
+            return
+
+        self._drain_item_metrics() # Items that finished after the last frame
+        if result.stop_latency and result.stop_latency['stops']:
+            self.append_log(f"--- Cancel took up to {result.stop_latency['max_seconds']:.2f}s to take effect (bound {STOP_LATENCY_BOUND:.1f}s) ---")
+        if result.metrics:
+            self.append_log(f"--- {result.metrics['items']} item(s) timed; breakdown saved to {state_path(METRICS_JSONL_FILENAME)} ---")
+
+        final_status = f"Finished processing {result.completed} of {result.total} item(s) (playlists count per video)."
+        if result.skipped:
+            final_status += f"\n{result.skipped} already downloaded item(s) were skipped."
+        if result.metadata_cache:
+            final_status += f"\nMetadata cache: {result.metadata_cache['hits']} hit(s), {result.metadata_cache['misses']} miss(es)."
+        if result.audio:
+            final_status += f"\nAudio: {result.audio['copied']} kept without re-encoding, {result.audio['transcoded']} transcoded."
+        if result.disk and (result.disk['admission_waits'] or result.disk['rejected']):
+            final_status += f"\nDisk space: {result.disk['admission_waits']} item(s) waited for free space, {result.disk['rejected']} attempt(s) didn't fit."
+        if result.playlists:
+            final_status += f"\nStreamed {sum(p['entries_read'] for p in result.playlists)} playlist entry(ies) from {len(result.playlists)} playlist(s)."
+        if result.peak_rss:
+            final_status += f"\nPeak memory: {result.peak_rss / 1024 / 1024:.0f} MB."
+        failed_items = result.failed_items
+
+        if result.cancelled:
             messagebox.showwarning("Cancelled", final_status)
         elif not failed_items:
             messagebox.showinfo("Finished", f"{final_status}\nCheck download folder(s). Status log may show individual item errors.")
         else:
+            from yt_downloader.retry import REQUEUE_CATEGORIES
             fail_count = len(failed_items)
-            final_message = f"{final_status}\n\n" \
-                            f"{fail_count} input URL(s) encountered significant errors (check console log):\n"
+            by_category = (result.retry or {}).get('failures') or {}
+            breakdown = ", ".join(f"{n} {category.replace('_', '-')}" for category, n in by_category.items())
+            final_message = f"{final_status}\n\n{fail_count} item(s) failed" + (f" ({breakdown})" if breakdown else "") + ":\n"
             for fail in failed_items[:5]:
                 final_message += f"- {fail['item']} ({fail['error']})\n"
             if fail_count > 5:
-                final_message += "- ... (See console for full list)\n"
-            final_message += "\nNote: With 'ignoreerrors', individual items within playlists might fail without being listed here. Check status log during download."
-            messagebox.showwarning("Finished with Errors", final_message)
+                final_message += f"- ... and {fail_count - 5} more\n"
+            if result.failure_report:
+                final_message += f"Full report: {result.failure_report}\n"
+            retryable = [fail['item'] for fail in failed_items if fail.get('category') in REQUEUE_CATEGORIES]
+            if not retryable:
+                messagebox.showwarning("Finished with Errors", final_message)
+            elif messagebox.askyesno("Finished with Errors", f"{final_message}\n{len(retryable)} item(s) failed with "
+                                     "temporary network or rate-limit errors. Queue them again now?", icon=messagebox.WARNING):
+                self._queue_again(retryable)
 
 
     def start_download_thread(self):
-        """Validates input and starts the download process in a separate thread."""
-        if self.is_downloading:
+        """Validates the form, then ingests the pasted URLs in the background."""
+        if self.is_downloading or self.ingest_thread is not None:
             messagebox.showwarning("Busy", "A download is already in progress.")
             return
+        if not self.ready:
+            return # Button is disabled until the warm-up finishes
 
         # Read URLs from Text widget
         urls_text = self.url_text.get("1.0", tk.END)
-        raw_urls = urls_text.splitlines()
-        urls_to_download = [url.strip() for url in raw_urls if url.strip()]
+        if not urls_text.strip():
+            messagebox.showerror("Input Error", "Please enter at least one YouTube URL.")
+            return
+        options = self._collect_options()
+        if options is None:
+            return
 
-        download_path = self.download_path_var.get()
-        download_type = self.download_type_var.get()
-        should_download_playlists = self.download_playlists_var.get()
-        # Get container preference (only relevant if video type selected)
-        container_format = self.container_format_var.get() if download_type == VIDEO_TYPE else None
+        from yt_downloader.ingest import ingest_lines
+        self._start_ingestion(lambda **kwargs: ingest_lines(urls_text.splitlines(), **kwargs), options)
 
-        # --- Input Validation ---
-        if not urls_to_download:
-            messagebox.showerror("Input Error", "Please enter at least one YouTube URL.")
+    def import_urls(self):
+        """Queues the URLs of a .txt/.csv list or exported bookmarks file."""
+        if self.is_downloading or self.ingest_thread is not None or not self.ready:
             return
-        if not download_path:
-            messagebox.showerror("Input Error", "Please select a download location.")
+        path = filedialog.askopenfilename(title="Import URLs", filetypes=IMPORT_FILE_TYPES)
+        if not path:
             return
-        if not os.path.isdir(download_path):
-            messagebox.showerror("Path Error", f"The selected download path is not a valid directory:\n{download_path}")
+        options = self._collect_options()
+        if options is None:
             return
-        try: # Test write permissions
-             test_file = os.path.join(download_path, ".permission_test")
-             with open(test_file, "w") as f: f.write("test")
-             os.remove(test_file)
-        except Exception as e:
-             messagebox.showerror("Path Error", f"Cannot write to the selected download path:\n{download_path}\nError: {e}")
-             return
-
-        # --- Basic URL Format Check (Optional) ---
-        valid_urls = []
-        invalid_lines = []
-        youtube_pattern = re.compile(
-             r"^(https?://)?(www\.)?(youtube\.com/|youtu\.be/)"
-             r"(watch\?v=|playlist\?list=|shorts/|embed/|c/|channel/|user/|@)?"
-             r"[a-zA-Z0-9_\-?=&]+$" # Slightly improved pattern
+
+        from yt_downloader.ingest import ingest_file
+        self._start_ingestion(lambda **kwargs: ingest_file(path, **kwargs), options)
+
+    def _collect_options(self) -> Optional["DownloadOptions"]:
+        """DownloadOptions from the form, or None after showing what is wrong."""
+        from yt_downloader.engine import DownloadOptions, check_download_path
+        try:
+            speed_limit = float(self.speed_limit_var.get())
+        except (tk.TclError, ValueError):
+            speed_limit = -1.0
+        if speed_limit < 0:
+            messagebox.showerror("Input Error", "Speed limit must be a number of MB/s (0 for no limit).")
+            return None
+
+        download_type = self.download_type_var.get()
+        options = DownloadOptions(
+            download_path=self.download_path_var.get(),
+            download_type=download_type,
+            # Get container preference (only relevant if video type selected)
+            container_format=self.container_format_var.get() if download_type == VIDEO_TYPE else None,
+            download_playlists=self.download_playlists_var.get() or self.stream_playlists_var.get(),
+            playlist_window=DEFAULT_PLAYLIST_WINDOW if self.stream_playlists_var.get() else 0,
+            worker_count=self.worker_count_var.get(),
+            use_index=self.skip_downloaded_var.get(),
+            audio_accepted_codecs=list(DEFAULT_ACCEPTED_AUDIO_CODECS) if self.audio_copy_var.get() else [],
+            rate_limit=speed_limit * 1024 * 1024 if speed_limit > 0 else None,
+            metrics_jsonl_path=state_path(METRICS_JSONL_FILENAME),
+            metrics_prometheus_path=state_path(METRICS_PROMETHEUS_FILENAME),
         )
-        for url in urls_to_download:
-             if youtube_pattern.match(url):
-                 valid_urls.append(url)
-             else:
-                 if "://" in url or "." in url: # Heuristic for other URLs
-                     valid_urls.append(url)
-                     # print(f"Info: Passing potentially non-YouTube URL to yt-dlp: {url}")
-                 else:
-                     invalid_lines.append(url)
-
-        if not valid_urls:
-             messagebox.showerror("Input Error", "No valid-looking URLs found in the input.")
-             return
-
-        if invalid_lines:
-             max_show = 5
-             display_invalid = "\n- ".join(invalid_lines[:max_show])
-             if len(invalid_lines) > max_show: display_invalid += "\n- ..."
-             messagebox.showwarning("Invalid Lines Skipped",
-                                    f"The following lines were skipped (didn't look like URLs):\n- {display_invalid}")
+        path_error = check_download_path(options.download_path)
+        if path_error:
+            messagebox.showerror("Path Error", path_error)
+            return None
+        return options
 
+    def _start_ingestion(self, ingest, options: "DownloadOptions"):
+        """
+        Runs ingest (ingest_lines/ingest_file bound to its input) on a
+        background thread; _check_ingestion picks up the result.
+        """
+        self.set_ui_state(enabled=False)
+        self._ingest_cancel.clear()
+        self._ingest_outcome = None
+        self.status_var.set("Status: Checking URLs...")
+
+        def on_progress(lines: int, unique: int):
+            self.update_status(f"Checking URLs: {lines} line(s) read, {unique} unique URL(s)...")
+
+        def run():
+            try:
+                outcome = (ingest(on_progress=on_progress, should_stop=self._ingest_cancel.is_set), None)
+            except Exception as e: # Unreadable file, bad encoding, ...
+                outcome = (None, str(e))
+            self._ingest_outcome = outcome
+
+        self.ingest_thread = threading.Thread(target=run, name="url-ingest", daemon=True)
+        self.ingest_thread.start()
+        self.root.after(UI_REFRESH_INTERVAL_MS, self._check_ingestion, options)
+
+    def _check_ingestion(self, options: "DownloadOptions"):
+        """Waits (without blocking Tk) for the ingestion thread, then confirms and queues."""
+        if self._ingest_outcome is None:
+            self.root.after(UI_REFRESH_INTERVAL_MS, self._check_ingestion, options)
+            return
+        report, error = self._ingest_outcome
+        self.ingest_thread = None
+        self._ingest_outcome = None
+        self.update_status("Idle") # Supersedes queued ingestion progress lines
+        if report is None or report.cancelled:
+            if error:
+                messagebox.showerror("Import Error", f"Could not read the URLs:\n{error}")
+            self.set_ui_state(True)
+            return
+        if not report.urls:
+            messagebox.showerror("Input Error", "No valid-looking URLs found in the input.")
+            self.set_ui_state(True)
+            return
+        if not messagebox.askokcancel("Queue Downloads", self._ingest_summary(report) + "\n\nStart downloading?"):
+            self.set_ui_state(True)
+            return
 
         # --- Start Download ---
+        self.status_var.set(f"Status: Preparing to process {len(report.urls)} input URL(s)...")
+        self.overall_progress_var.set(f"0/{len(report.urls)}")
+        self._start_download_thread([item.url for item in report.urls], options)
+
+    @staticmethod
+    def _ingest_summary(report: "IngestReport") -> str:
+        """IngestReport summary plus a few of the skipped lines."""
+        summary = report.summary_text()
+        if report.invalid_lines:
+            max_show = 5
+            display_invalid = "\n- ".join(line[:80] for line in report.invalid_lines[:max_show])
+            if len(report.invalid_lines) > max_show: display_invalid += "\n- ..."
+            summary += f"\n\nSkipped (didn't look like URLs):\n- {display_invalid}"
+        return summary
+
+    def _start_download_thread(self, urls: Optional[List[str]], options: "DownloadOptions", resume_batch_id: Optional[int] = None):
+        """Disables the form and runs download_content on a daemon thread."""
         self.is_downloading = True
-        self.cancelled = False
         self.set_ui_state(enabled=False) # Disable UI
-        self.status_var.set(f"Status: Preparing to process {len(valid_urls)} input URL(s)...")
         self.progress_var.set(0.0)
-        self.overall_progress_var.set(f"0/{len(valid_urls)}")
+        # New batch, new table (rows for resumed/playlist jobs appear as they start)
+        self._engine_events.clear()
+        self.queue_model.clear()
+        if urls:
+            self.queue_model.add_urls(urls)
+        self.queue_table.clear()
 
         # Create and start the download thread
         self.download_thread = threading.Thread(
             target=self.download_content,
-            args=(valid_urls, download_path, download_type, should_download_playlists, container_format),
+            args=(urls, options, resume_batch_id),
             daemon=True
         )
         self.download_thread.start()
 
+    def offer_resume(self):
+        """Offers to continue a batch that was interrupted by a close, cancel or crash."""
+        if self.is_downloading:
+            return
+        from yt_downloader.engine import DownloadOptions, check_download_path
+        try:
+            journal = JobJournal()
+            try:
+                unfinished = journal.unfinished_batch()
+                if unfinished is None:
+                    return
+                options = DownloadOptions.from_dict(unfinished['options'])
+                started = time.strftime('%Y-%m-%d %H:%M', time.localtime(unfinished['created_at']))
+                if not messagebox.askyesno(
+                        "Resume Downloads",
+                        f"A batch started {started} has {unfinished['remaining']} unfinished item(s)\n"
+                        f"(saving to {options.download_path}).\n\nResume it now? Choose 'No' to discard it."):
+                    journal.finish_batch(unfinished['batch_id'])
+                    return
+            finally:
+                journal.close()
+        except Exception as e:
+            print(f"Warning: Could not read the job journal: {e}")
+            return
+
+        path_error = check_download_path(options.download_path)
+        if path_error:
+            messagebox.showerror("Path Error", path_error)
+            return
+
+        # Show the batch's settings in the (disabled) form while it runs
+        self.download_path_var.set(options.download_path)
+        self.download_type_var.set(options.download_type)
+        if options.container_format:
+            self.container_format_var.set(options.container_format)
+        self.download_playlists_var.set(options.download_playlists)
+        self.stream_playlists_var.set(options.playlist_window > 0)
+        self.worker_count_var.set(options.worker_count)
+        self.skip_downloaded_var.set(options.use_index)
+        self.audio_copy_var.set(bool(options.audio_accepted_codecs))
+        self.speed_limit_var.set(round((options.rate_limit or 0) / 1024 / 1024, 2))
+
+        self.status_var.set(f"Status: Resuming {unfinished['remaining']} unfinished item(s)...")
+        self._start_download_thread(None, options, resume_batch_id=unfinished['batch_id'])
+
     def on_closing(self):
         """Handles the window close event."""
+        self._ingest_cancel.set() # Abandon a running URL check
         if self.is_downloading:
             if messagebox.askokcancel("Quit", "Downloads are in progress. Stop downloads and quit?"):
-                self.cancelled = True # Set the cancellation flag
+                if self.engine is not None:
+                    self.engine.cancel() # Set the cancellation flag
                 self.update_status("Cancellation requested, waiting for current operation to stop...")
-                self.root.after(200, self._check_thread_and_destroy)
+                self._close_deadline = time.monotonic() + STOP_LATENCY_BOUND
+                self.root.after(50, self._check_thread_and_destroy)
             else:
                 return # Don't close
         else:
             self.root.destroy() # Close immediately if not downloading
 
     def _check_thread_and_destroy(self):
-        """Helper for on_closing to destroy the window after attempting cancellation."""
+        """Helper for on_closing: destroys the window once the batch stopped, or after STOP_LATENCY_BOUND."""
         if self.download_thread and self.download_thread.is_alive():
-             # Give it a tiny bit more time maybe?
-             self.download_thread.join(timeout=0.2) # Wait briefly for thread exit
-             if self.download_thread.is_alive():
-                 print("Warning: Download thread still active after cancellation signal and brief wait. Forcing exit.")
+            if time.monotonic() < self._close_deadline:
+                self.root.after(50, self._check_thread_and_destroy) # Keep the UI responsive while waiting
+                return
+            print(f"Warning: Download thread still active {STOP_LATENCY_BOUND:.1f}s after cancellation. Forcing exit.")
         self.root.destroy()
 
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    # Check for yt-dlp dependency
-    try:
-        import yt_dlp
-    except ImportError:
-        error_message = "Required library 'yt-dlp' not found.\nPlease install it using:\n\npip install yt-dlp"
-        print(error_message.replace('\n\n', '\n').replace('\n', '\n  ')) # Console formatting
-        try:
-            root_check = tk.Tk()
-            root_check.withdraw() # Hide the main window
-            messagebox.showerror("Dependency Error", error_message)
-            root_check.destroy()
-        except tk.TclError:
-            pass # Ignore if GUI can't be shown for the error
-        exit(1) # Exit the script
+    # --measure-startup: print time to first paint / ready to download as JSON, then exit
+    measure_startup = "--measure-startup" in sys.argv[1:]
 
+    # yt-dlp itself is loaded (and its absence reported) by the warm-up thread.
     # Check for FFmpeg? More complex, rely on runtime errors and the note for now.
 
     root = tk.Tk()
-    app = YouTubeDownloaderApp(root)
-    root.mainloop()
\ No newline at end of file
+    app = YouTubeDownloaderApp(root, measure_startup=measure_startup)
+    root.mainloop()